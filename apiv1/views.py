@@ -12,12 +12,16 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from django.conf import settings
 from corm.models import Source, Channel, Member, Contact, Conversation, Contribution, Event
+from corm.paging import Keyset
 from frontendv2.views import SavannahView
 
 from .serializers import SourceSerializer, IdentitySerializer, ConversationSerializer, ContributionSerializer, ZapierIdentitySerializer, EventSerializer, EventAttendeeSerializer
 from .icons import generic_icons, brand_icons
 
+API_MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+
 # Create your views here.
 class APISourceForm(forms.ModelForm):
     class Meta:
@@ -104,6 +108,23 @@ class SavannahIntegrationView(APIView):
     authentication_classes = [SourceTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    def paged_response(self, request, queryset, keyset, serializer_class):
+        """
+        Lists are returned whole unless ?limit= is given, then they are returned a page at a time with the cursor
+        for the next page in the X-Next-Cursor header, to be passed back as ?after=
+        """
+        try:
+            limit = min(int(request.GET['limit']), API_MAX_PAGE_SIZE)
+        except (KeyError, ValueError):
+            return Response(serializer_class(queryset, many=True).data)
+        if limit < 1:
+            return Response({'limit': 'Must be a positive number'}, status=status.HTTP_400_BAD_REQUEST)
+        rows, next_cursor = keyset.page(queryset, 1, limit, request.GET.get('after'))
+        headers = dict()
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        return Response(serializer_class(rows, many=True).data, headers=headers)
+
 
 class SourceInfo(SavannahIntegrationView):
     """
@@ -121,8 +142,7 @@ class IdentityList(SavannahIntegrationView):
 
     def get(self, request, format=None):
         identities = Contact.objects.filter(source=request.source).select_related('member').prefetch_related('member__tags')
-        serializer = IdentitySerializer(identities, many=True)
-        return Response(serializer.data)
+        return self.paged_response(request, identities, Keyset('id'), IdentitySerializer)
 
     def post(self, request, format=None):
         serializer = IdentitySerializer(data=request.data)
@@ -166,8 +186,7 @@ class ConversationsList(SavannahIntegrationView):
 
     def get(self, request, format=None):
         convos = Conversation.objects.filter(channel__source=request.source)
-        serializer = ConversationSerializer(convos, many=True)
-        return Response(serializer.data)
+        return self.paged_response(request, convos, Keyset('timestamp', descending=True), ConversationSerializer)
 
     def post(self, request, format=None):
         serializer = ConversationSerializer(data=request.data)
@@ -183,8 +202,7 @@ class ContributionsList(SavannahIntegrationView):
 
     def get(self, request, format=None):
         contribs = Contribution.objects.filter(channel__source=request.source)
-        serializer = ContributionSerializer(contribs, many=True)
-        return Response(serializer.data)
+        return self.paged_response(request, contribs, Keyset('timestamp', descending=True), ContributionSerializer)
 
     def post(self, request, format=None):
         serializer = ContributionSerializer(data=request.data)
@@ -200,8 +218,7 @@ class EventsList(SavannahIntegrationView):
 
     def get(self, request, format=None):
         events = Event.objects.filter(source=request.source)
-        serializer = EventSerializer(events, many=True)
-        return Response(serializer.data)
+        return self.paged_response(request, events, Keyset('start_timestamp', descending=True), EventSerializer)
 
     def post(self, request, format=None):
         serializer = EventSerializer(data=request.data)
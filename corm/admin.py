@@ -445,8 +445,7 @@ class SuggestMemberMergeAdmin(admin.ModelAdmin):
     list_filter = ("community", "status", "actioned_at", "created_at")
     actions = ("accept", "ignore", "reject")
     def accept(self, request, queryset):
-        for suggestion in queryset.all():
-            suggestion.accept(request.user)
+        SuggestMemberMerge.accept_many(queryset.select_related('source_member', 'destination_member'), request.user)
     accept.short_description = "Accept Suggestions"
 
     def reject(self, request, queryset):
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class CormConfig(AppConfig):
     name = 'corm'
@@ -6,4 +7,6 @@ class CormConfig(AppConfig):
 
     def ready(self):
         from corm.plugins import install_plugins
-        install_plugins()
\ No newline at end of file
+        install_plugins()
+        from corm.search import restore_search_index
+        post_migrate.connect(restore_search_index, sender=self)
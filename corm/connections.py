@@ -0,0 +1,208 @@
+import datetime
+import json
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Max, F
+from django.utils import timezone
+
+from corm.models import Member, MemberConnection, Participant, ConnectionGraphSnapshot
+
+CONNECTION_BATCH_SIZE = 500
+
+# Timespans offered by the filter bar, each gets its own precomputed graph
+GRAPH_TIMESPANS = (1, 7, 30, 90, 183, 365)
+GRAPH_MAX_NODES = getattr(settings, 'CONNECTION_GRAPH_MAX_NODES', 1000)
+GRAPH_MAX_LINKS = getattr(settings, 'CONNECTION_GRAPH_MAX_LINKS', 10000)
+GRAPH_MAX_AGE = getattr(settings, 'CONNECTION_GRAPH_MAX_AGE', 24)
+ROLE_COLORS = {
+    Member.BOT: "aeaeae",
+    Member.STAFF: "36b9cc",
+}
+DEFAULT_COLOR = "1f77b4"
+
+def aware(timestamp):
+    if timestamp is not None and settings.USE_TZ and timezone.is_naive(timestamp):
+        return timezone.make_aware(timestamp, timezone.utc)
+    return timestamp
+
+class ConnectionGraph:
+    """
+    Undirected graph of member connections, each edge has a connection count and first/last connected
+    timestamps. Edges are built up in memory and then written as MemberConnection rows in both directions.
+    """
+    def __init__(self, community):
+        self.community = community
+        self.edges = dict()
+
+    def __len__(self):
+        return len(self.edges)
+
+    def add(self, member_id, other_id, timestamp, count=1, first=None):
+        if member_id is None or other_id is None or member_id == other_id:
+            return
+        key = (min(member_id, other_id), max(member_id, other_id))
+        # Importers parse naive UTC timestamps, but the rows they're compared with are aware
+        timestamp = aware(timestamp)
+        first = aware(first) or timestamp
+        if key in self.edges:
+            edge = self.edges[key]
+            edge[0] = max(edge[0], count)
+            edge[1] = min(edge[1], first)
+            edge[2] = max(edge[2], timestamp)
+        else:
+            self.edges[key] = [count, first, timestamp]
+
+    @classmethod
+    def from_participants(cls, community, since):
+        """
+        Connect conversation initiators to their participants, counting the conversations they shared since the given time
+        """
+        graph = cls(community)
+        participants = Participant.objects.filter(community=community, timestamp__gte=since, initiator__isnull=False).exclude(member=F('initiator'))
+        participants = participants.values('initiator', 'member').annotate(connection_count=Count('conversation', distinct=True), first=Min('timestamp'), last=Max('timestamp')).order_by()
+        for row in participants.iterator():
+            graph.add(row['initiator'], row['member'], row['last'], count=row['connection_count'], first=row['first'])
+        return graph
+
+    def existing_connections(self, members=None):
+        existing = MemberConnection.objects.filter(community=self.community).order_by('id')
+        existing = existing.only('id', 'from_member_id', 'to_member_id', 'connection_count', 'first_connected', 'last_connected')
+        if members is None:
+            for connection in existing.iterator(chunk_size=CONNECTION_BATCH_SIZE):
+                yield connection
+        else:
+            members = sorted(members)
+            if len(members) <= CONNECTION_BATCH_SIZE:
+                existing = existing.filter(to_member_id__in=members)
+            for i in range(0, len(members), CONNECTION_BATCH_SIZE):
+                for connection in existing.filter(from_member_id__in=members[i:i+CONNECTION_BATCH_SIZE]):
+                    yield connection
+
+    def save(self, expire_before=None, counts=True):
+        """
+        Diff the graph against the community's MemberConnection rows, inserting missing rows and updating changed ones
+        in bulk. Self-connections and duplicate rows are removed. If expire_before is given, connections that aren't in
+        the graph and weren't seen since then have their count reset to zero, otherwise only the rows of members in
+        the graph are checked. With counts=False the connection counts of existing rows are left alone.
+        Returns the number of (created, updated) rows.
+        """
+        seen = set()
+        deleted = []
+        changed = []
+        members = None
+        if expire_before is None:
+            members = set([member_id for edge in self.edges.keys() for member_id in edge])
+        for connection in self.existing_connections(members):
+            pair = (connection.from_member_id, connection.to_member_id)
+            if pair[0] == pair[1] or pair in seen:
+                deleted.append(connection.id)
+                continue
+            seen.add(pair)
+
+            edge = self.edges.get((min(pair), max(pair)))
+            if edge is None:
+                if expire_before is not None and connection.connection_count != 0 and connection.last_connected < expire_before:
+                    connection.connection_count = 0
+                    changed.append(connection)
+                continue
+            count, first, last = edge
+            if not counts:
+                count = connection.connection_count
+            if connection.connection_count != count or connection.first_connected > first or connection.last_connected < last:
+                connection.connection_count = count
+                connection.first_connected = min(connection.first_connected, first)
+                connection.last_connected = max(connection.last_connected, last)
+                changed.append(connection)
+
+        new_connections = []
+        for (member_id, other_id), (count, first, last) in self.edges.items():
+            for from_id, to_id in ((member_id, other_id), (other_id, member_id)):
+                if (from_id, to_id) not in seen:
+                    new_connections.append(MemberConnection(community=self.community, from_member_id=from_id, to_member_id=to_id, connection_count=count, first_connected=first, last_connected=last))
+
+        with transaction.atomic():
+            for i in range(0, len(deleted), CONNECTION_BATCH_SIZE):
+                MemberConnection.objects.filter(id__in=deleted[i:i+CONNECTION_BATCH_SIZE]).delete()
+            MemberConnection.objects.bulk_update(changed, ['connection_count', 'first_connected', 'last_connected'], batch_size=CONNECTION_BATCH_SIZE)
+            MemberConnection.objects.bulk_create(new_connections, batch_size=CONNECTION_BATCH_SIZE)
+        return len(new_connections), len(changed)
+
+
+def load_edges(connections):
+    """
+    Strongest (connection count, last connected) for each pair of members in a MemberConnection queryset
+    """
+    edges = dict()
+    rows = connections.order_by().values_list('from_member_id', 'to_member_id', 'connection_count', 'last_connected')
+    for from_id, to_id, count, last in rows.iterator(chunk_size=CONNECTION_BATCH_SIZE):
+        if from_id == to_id:
+            continue
+        key = (min(from_id, to_id), max(from_id, to_id))
+        if key not in edges or edges[key] < (count, last):
+            edges[key] = (count, last)
+    return edges
+
+def graph_data(edges, max_nodes=GRAPH_MAX_NODES, max_links=GRAPH_MAX_LINKS):
+    """
+    Nodes and links for the connections graph. Big graphs keep the most connected members, and then the
+    strongest and most recent links between them, so links come out strongest first.
+    """
+    degree = Counter()
+    for member_id, other_id in edges.keys():
+        degree[member_id] += 1
+        degree[other_id] += 1
+    if len(degree) > max_nodes:
+        keep = set([member_id for member_id, count in degree.most_common(max_nodes)])
+        edges = dict([(key, edge) for key, edge in edges.items() if key[0] in keep and key[1] in keep])
+    links = sorted(edges.items(), key=lambda item: item[1], reverse=True)[:max_links]
+
+    connection_counts = Counter()
+    for (member_id, other_id), edge in links:
+        connection_counts[member_id] += 1
+        connection_counts[other_id] += 1
+    member_ids = sorted(connection_counts.keys())
+
+    nodes = list()
+    for i in range(0, len(member_ids), CONNECTION_BATCH_SIZE):
+        batch = member_ids[i:i+CONNECTION_BATCH_SIZE]
+        # Members are colored by their first tag, like member.tags.all()[0]
+        tag_colors = dict()
+        for member_id, color in Member.tags.through.objects.filter(member_id__in=batch).order_by('tag__name', 'tag_id').values_list('member_id', 'tag__color'):
+            tag_colors.setdefault(member_id, color)
+        for member_id, name, role in Member.objects.filter(id__in=batch).values_list('id', 'name', 'role'):
+            color = tag_colors.get(member_id)
+            if color is None:
+                color = ROLE_COLORS.get(role, DEFAULT_COLOR)
+            nodes.append({"id":member_id, "name":name, "color":color, "connections":connection_counts[member_id]})
+
+    return {"nodes":nodes, "links":[{"source":member_id, "target":other_id} for (member_id, other_id), edge in links]}
+
+def trim_graph(data, max_links):
+    """
+    Lower detail version of a graph from graph_data, keeping only the strongest links and the members they connect
+    """
+    links = data["links"][:max_links]
+    connection_counts = Counter()
+    for link in links:
+        connection_counts[link["source"]] += 1
+        connection_counts[link["target"]] += 1
+    nodes = [dict(node, connections=connection_counts[node["id"]]) for node in data["nodes"] if node["id"] in connection_counts]
+    return {"nodes":nodes, "links":links}
+
+def save_graph_snapshots(community, now=None):
+    """
+    Precompute the connections graph for each timespan in the filter bar, so the connections page can serve it as is
+    """
+    if now is None:
+        now = timezone.now()
+    connections = MemberConnection.objects.filter(community=community, connection_count__gte=1, last_connected__gte=now - datetime.timedelta(days=max(GRAPH_TIMESPANS)), last_connected__lte=now)
+    edges = load_edges(connections)
+    for timespan in GRAPH_TIMESPANS:
+        since = now - datetime.timedelta(days=timespan)
+        data = graph_data(dict([(key, edge) for key, edge in edges.items() if edge[1] >= since]))
+        ConnectionGraphSnapshot.objects.update_or_create(community=community, timespan=timespan, defaults={'created':now, 'data':json.dumps(data)})
+
+def get_graph_snapshot(community, timespan):
+    max_age = timezone.now() - datetime.timedelta(hours=GRAPH_MAX_AGE)
+    return ConnectionGraphSnapshot.objects.filter(community=community, timespan=timespan, created__gte=max_age).first()
@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand, CommandError
+import contextlib
+import datetime
+import io
+import json
+import os
+from django.contrib.auth.models import User
+
+from corm.models import Community, Source, Channel, Conversation, Contribution
+from corm.connectors import ConnectionManager
+from corm.replay import Cassette, SCRUBBED
+from frontendv2 import profiling
+
+class Command(BaseCommand):
+    help = 'Measure importer throughput by replaying recorded API responses, or record them from a live source'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cassettes', type=str, help='Directory holding the recorded responses')
+        parser.add_argument('--record', dest='source_ids', type=int, action='append', help='Import this source from its live API and record the responses, can be given more than once')
+        parser.add_argument('--connector', dest='connector', type=str, help='Only replay cassettes for this connector, like corm.plugins.slack')
+        parser.add_argument('--output', dest='output', type=str, help='File to write the JSON results to, instead of stdout')
+        parser.add_argument('--keep', dest='keep', action='store_true', help='Keep the communities created for replaying')
+
+    def handle(self, *args, **options):
+        self.cassettes = options.get('cassettes')
+        self.verbosity = options.get('verbosity')
+        results = {
+            'started': datetime.datetime.utcnow().isoformat(),
+            'imports': [],
+        }
+        if options.get('source_ids'):
+            os.makedirs(self.cassettes, exist_ok=True)
+            for source in Source.objects.filter(id__in=options.get('source_ids')):
+                results['imports'].append(self.record(source))
+        else:
+            if not os.path.isdir(self.cassettes):
+                raise CommandError("No cassette directory at %s" % self.cassettes)
+            self.owner, created = User.objects.get_or_create(username='benchmark')
+            for filename in sorted(os.listdir(self.cassettes)):
+                if not filename.endswith('.json'):
+                    continue
+                cassette = Cassette(os.path.join(self.cassettes, filename), replaying=True)
+                if options.get('connector') and cassette.source['connector'] != options.get('connector'):
+                    continue
+                results['imports'].append(self.replay(cassette, keep=options.get('keep')))
+
+        output = json.dumps(results, indent=2)
+        if options.get('output'):
+            with open(options.get('output'), 'w') as outfile:
+                outfile.write(output)
+        else:
+            self.stdout.write(output)
+
+    def record(self, source):
+        print("Recording %s" % source)
+        cassette = Cassette.for_source(os.path.join(self.cassettes, '%s-%s.json' % (source.connector.split('.')[-1], source.id)), source)
+        result = self.run_import(source, cassette)
+        cassette.save(source)
+        return result
+
+    def replay(self, cassette, keep=False):
+        print("Replaying %s" % cassette.path)
+        recorded = cassette.source
+        community = Community.objects.create(name="Import Benchmark %s" % recorded['name'], owner=self.owner)
+        community.bootstrap()
+        source = Source.objects.create(community=community, connector=recorded['connector'], name=recorded['name'], server=recorded['server'], auth_id=recorded['auth_id'], auth_secret=SCRUBBED)
+        for channel in recorded['channels']:
+            Channel.objects.create(source=source, name=channel['name'], origin_id=channel['origin_id'])
+        try:
+            return self.run_import(source, cassette)
+        finally:
+            if not keep:
+                community.delete()
+
+    def run_import(self, source, cassette):
+        importer = ConnectionManager.CONNECTOR_PLUGINS[source.connector].get_source_importer(source)
+        importer.verbosity = self.verbosity
+        importer.full_import = True
+        importer.cassette = cassette
+        conversations = Conversation.objects.filter(channel__source=source).count()
+        contributions = Contribution.objects.filter(contribution_type__source=source).count()
+
+        profile, stack = profiling.start(source.connector)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                importer.run()
+        finally:
+            profiling.stop(profile, stack)
+
+        messages = Conversation.objects.filter(channel__source=source).count() - conversations
+        per_message = max(messages, 1)
+        return {
+            'connector': source.connector,
+            'source': source.name,
+            'cassette': cassette.path,
+            'replayed': cassette.replaying,
+            'messages': messages,
+            'contributions': Contribution.objects.filter(contribution_type__source=source).count() - contributions,
+            'seconds': profile.wall_time,
+            'messages_per_second': messages / profile.wall_time if profile.wall_time else 0,
+            'queries': profile.queries,
+            'queries_per_message': profile.queries / per_message,
+            'query_seconds': profile.query_time,
+            'http_calls': cassette.calls,
+            'http_calls_per_message': cassette.calls / per_message,
+            'failures': dict(source.channel_set.filter(import_failed_message__isnull=False).values_list('name', 'import_failed_message')),
+        }
@@ -1,8 +1,10 @@
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
 import datetime
 import re
 import subprocess
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from time import sleep
 from corm.models import Community, Source, Member, Contact, Channel, Conversation
 from corm.connectors import ConnectionManager
@@ -18,7 +20,8 @@ class Command(BaseCommand):
         parser.add_argument('--full', dest='full_import', action='store_true', help='Do a full import, not incremental from the previous import')
         parser.add_argument('--new', dest='new_only', action='store_true', help='Import only from new sources')
         parser.add_argument('--debug', dest='debug', action='store_true', help='Enter debugger on errors')
-        parser.add_argument('--limit', dest='limit', type=int, help='Number of possible sources to import')
+        parser.add_argument('--limit', dest='limit', type=int, help='Number of sources to import, only sources that import successfully count towards it')
+        parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of sources, and channels within each source, to import at the same time')
 
     def handle(self, *args, **options):
 
@@ -31,6 +34,10 @@ class Command(BaseCommand):
         new_only = options.get('new_only')
         debug = options.get('debug')
         limit = options.get('limit')
+        workers = options.get('workers') or 1
+        if workers > 1 and connection.vendor == 'sqlite':
+            print("SQLite does not support concurrent imports, using a single worker")
+            workers = 1
 
         if importer_name == 'all':
             verbosity and print("Importing all sources")
@@ -69,36 +76,78 @@ class Command(BaseCommand):
             print("Sources: %s " % sources.count())
             print("Limit: %s " % limit)
 
+        self.verbosity = verbosity
+        self.debug = debug
+        self.full_import = full_import
+        self.new_only = new_only
+        self.channels = channels
+        self.workers = workers
+
+        if workers > 1 and not debug:
+            self.import_concurrently(sources, limit)
+        else:
+            count = 0
+            for source in sources:
+                if limit and count >= limit:
+                    break
+                if self.import_source(source):
+                    count += 1
+                    if full_import:
+                        sleep(5)
+
+    def import_concurrently(self, sources, limit=None):
+        # A source that fails makes room for another, the same as importing one at a time
         count = 0
-        for source in sources:
-            if limit and count >= limit:
-                break
-            print("Importing %s" % source)
-            if new_only:
-                source.first_import = datetime.datetime.utcnow()
+        running = set()
+        sources = iter(sources)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while len(running) < self.workers and not (limit and count + len(running) >= limit):
+                    source = next(sources, None)
+                    if source is None:
+                        break
+                    running.add(pool.submit(self.import_source_worker, source))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                count += len([future for future in done if future.result()])
+
+    def import_source_worker(self, source):
+        try:
+            imported = self.import_source(source)
+            if imported and self.full_import:
+                sleep(5)
+            return imported
+        finally:
+            connections.close_all()
+
+    def import_source(self, source):
+        print("Importing %s" % source)
+        if self.new_only:
+            source.first_import = datetime.datetime.utcnow()
+            source.save()
+        try:
+            plugin = ConnectionManager.CONNECTOR_PLUGINS[source.connector]
+            importer = plugin.get_source_importer(source)
+            importer.verbosity = self.verbosity
+            importer.debug = self.debug
+            importer.full_import = self.full_import
+            importer.workers = self.workers
+        except Exception as e:
+            print("Failed to import Source %s: %s" % (source, e))
+            if self.new_only:
+                source.first_import = None
                 source.save()
-            try:
-                plugin = ConnectionManager.CONNECTOR_PLUGINS[source.connector]
-                importer = plugin.get_source_importer(source)
-                importer.verbosity = verbosity
-                importer.debug = debug
-                importer.full_import = full_import
-            except Exception as e:
-                print("Failed to import Source %s: %s" % (source, e))
-                if new_only:
-                    source.first_import = None
-                    source.save()
-                continue
-
-            try:
-                if verbosity >= 2:
-                    print("Importing %s source: %s" % (plugin.get_source_type_name(), source))
-                importer.run(new_only, channels=channels)
-                count += 1
-                if full_import:
-                    sleep(5)
-            except Exception as e:
-                print(e)
-                if new_only:
-                    source.first_import = None
-                    source.save()
+            return False
+
+        try:
+            if self.verbosity >= 2:
+                print("Importing %s source: %s" % (plugin.get_source_type_name(), source))
+            importer.run(self.new_only, channels=self.channels)
+            return True
+        except Exception as e:
+            print(e)
+            if self.new_only:
+                source.first_import = None
+                source.save()
+            return False
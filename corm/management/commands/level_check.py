@@ -2,101 +2,254 @@
 
 from django.core.management.base import BaseCommand, CommandError
 import datetime
+import hashlib
+from django.conf import settings
+from django.utils import timezone
 from django.shortcuts import reverse
-from django.db.models import F, Q, Count, Max
+from django.db import transaction
+from django.db.models import F, Q, Count, Max, Sum
+from django.db.models.functions import TruncDate
 
-from corm.models import Community, Member, Conversation, Contribution, Project, MemberLevel
+from corm.models import Community, Member, Conversation, Contribution, Project, MemberLevel, MemberActivityCount, LevelCheckProgress
 from corm.models import pluralize
 from notifications.signals import notify
 
 LEVEL_RELEVANCY_DAYS = 180
+BATCH_SIZE = 1000
 
 class Command(BaseCommand):
     help = 'Checks member activity and assigns them levels in a project'
 
     def add_arguments(self, parser):
         parser.add_argument('--community', dest='community_id', type=int)
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help='Recount all activity instead of only what is new since the last run')
 
     def handle(self, *args, **options):
         self.verbosity = options.get('verbosity')
+        self.rebuild = options.get('rebuild')
+        self.rebuild_days = getattr(settings, 'LEVEL_REBUILD_DAYS', 7)
         community_id = options.get('community_id')
         if community_id:
             communities = [Community.objects.get(id=community_id)]
         else:
             communities = Community.objects.filter(status=Community.ACTIVE)
 
-
         for community in communities:
             community_start = datetime.datetime.utcnow()
             default_project, created = Project.objects.get_or_create(community=community, default_project=True, defaults={'name': community.name, 'owner':None, 'threshold_user':1, 'threshold_participant':10, 'threshold_contributor':1, 'threshold_core':10})
             other_projects = Project.objects.filter(community=community, default_project=False)
 
-            # Check community-wide levels
-            print("Checking member levels for %s" % community.name)
-            now = datetime.datetime.utcnow()
-            MemberLevel.objects.filter(community=community, project=default_project, timestamp__lt=datetime.datetime.utcnow() - datetime.timedelta(days=default_project.threshold_period)).delete()
-            if self.verbosity >= 3:
-                print("Default project level deletes: %s" % (datetime.datetime.utcnow() - now).total_seconds())
-
-            now = datetime.datetime.utcnow()
-            speaker_filter=Q(speaker_in__timestamp__gte=datetime.datetime.utcnow() - datetime.timedelta(days=default_project.threshold_period))
-            for member in Member.objects.filter(community=community).annotate(convo_count=Count('speaker_in__id', filter=speaker_filter, distinct=True), last_convo=Max('speaker_in__timestamp', filter=speaker_filter)):
-                if member.convo_count >= default_project.threshold_participant:
-                    MemberLevel.objects.update_or_create(community=community, project=default_project, member=member, defaults={'level':MemberLevel.PARTICIPANT, 'timestamp':member.last_convo, 'conversation_count':member.convo_count})
-                elif member.convo_count >= default_project.threshold_user:
-                    MemberLevel.objects.update_or_create(community=community, project=default_project, member=member, defaults={'level':MemberLevel.USER, 'timestamp':member.last_convo, 'conversation_count':member.convo_count})
-            if self.verbosity >= 3:
-                print("Default project conversation levels: %s" % (datetime.datetime.utcnow() - now).total_seconds())
-
-            now = datetime.datetime.utcnow()
-            author_filter = Q(contribution__timestamp__gte=datetime.datetime.utcnow() - datetime.timedelta(days=default_project.threshold_period))
-            for member in Member.objects.filter(community=community).annotate(contrib_count=Count('contribution__id', filter=author_filter, distinct=True), last_contrib=Max('contribution__timestamp', filter=author_filter)):
-                if member.contrib_count >= default_project.threshold_core:
-                    MemberLevel.objects.update_or_create(community=community, project=default_project, member=member, defaults={'level':MemberLevel.CORE, 'timestamp':member.last_contrib, 'contribution_count':member.contrib_count})
-                elif member.contrib_count >= default_project.threshold_contributor:
-                    MemberLevel.objects.update_or_create(community=community, project=default_project, member=member, defaults={'level':MemberLevel.CONTRIBUTOR, 'timestamp':member.last_contrib, 'contribution_count':member.contrib_count})
-            if self.verbosity >= 3:
-                print("Default project contribution levels: %s\n" % (datetime.datetime.utcnow() - now).total_seconds())
+            # Only count activity that existed when we started, anything newer is picked up next run
+            self.max_conversation_id = Conversation.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+            self.max_contribution_id = Contribution.objects.aggregate(max_id=Max('id'))['max_id'] or 0
 
-            # Check per-project levels
+            print("Checking member levels for %s" % community.name)
+            self.check_project(community, default_project)
             for project in other_projects:
                 print("Checking member levels for %s / %s" % (community.name, project.name))
-                now = datetime.datetime.utcnow()
-                MemberLevel.objects.filter(community=community, project=project, timestamp__lt=datetime.datetime.utcnow() - datetime.timedelta(days=default_project.threshold_period)).delete()
-                if self.verbosity >= 3:
-                    print("%s project level deletes: %s" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
-
-                now = datetime.datetime.utcnow()
-                speaker_filter = Q()
-                if project.tag is not None:
-                    speaker_filter = speaker_filter | Q(speaker_in__tags=project.tag)
-                if project.member_tag is not None:
-                    speaker_filter = speaker_filter | Q(tags=project.member_tag)
-                if project.channels.count() > 0:
-                    speaker_filter = speaker_filter | Q(speaker_in__channel__in=project.channels.all())
-                for member in Member.objects.filter(community=community).filter(speaker_in__timestamp__gte=datetime.datetime.utcnow() - datetime.timedelta(days=project.threshold_period)).annotate(convo_count=Count('speaker_in__id', filter=speaker_filter, distinct=True), last_convo=Max('speaker_in__timestamp', filter=speaker_filter)):
-                    if member.convo_count >= project.threshold_participant:
-                        MemberLevel.objects.update_or_create(community=community, project=project, member=member, defaults={'level':MemberLevel.PARTICIPANT, 'timestamp':member.last_convo, 'conversation_count':member.convo_count})
-                    elif member.convo_count >= project.threshold_user:
-                        MemberLevel.objects.update_or_create(community=community, project=project, member=member, defaults={'level':MemberLevel.USER, 'timestamp':member.last_convo, 'conversation_count':member.convo_count})
-                if self.verbosity >= 3:
-                    print("%s project conversation levels: %s" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
-
-                now = datetime.datetime.utcnow()
-                author_filter = Q()
-                if project.tag is not None:
-                    author_filter = author_filter | Q(contribution__tags=project.tag)
-                if project.member_tag is not None:
-                    author_filter = author_filter | Q(tags=project.member_tag)
-                if project.channels.count() > 0:
-                    author_filter = author_filter | Q(contribution__channel__in=project.channels.all())
-                for member in Member.objects.filter(community=community).filter(contribution__timestamp__gte=datetime.datetime.utcnow() - datetime.timedelta(days=project.threshold_period)).annotate(contrib_count=Count('contribution__id', filter=author_filter, distinct=True), last_contrib=Max('contribution__timestamp', filter=author_filter)):
-                    if member.contrib_count >= project.threshold_core:
-                        MemberLevel.objects.update_or_create(community=community, project=project, member=member, defaults={'level':MemberLevel.CORE, 'timestamp':member.last_contrib, 'contribution_count':member.contrib_count})
-                    elif member.contrib_count >= project.threshold_contributor:
-                        MemberLevel.objects.update_or_create(community=community, project=project, member=member, defaults={'level':MemberLevel.CONTRIBUTOR, 'timestamp':member.last_contrib, 'contribution_count':member.contrib_count})
-                if self.verbosity >= 3:
-                    print("%s project contribition levels: %s\n" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
+                self.check_project(community, project)
 
             if self.verbosity >= 3:
                 print("Time checking %s: %s\n" % (community, (datetime.datetime.utcnow() - community_start).total_seconds()))
+
+    def check_project(self, community, project):
+        window_start = timezone.now() - datetime.timedelta(days=project.threshold_period)
+
+        now = datetime.datetime.utcnow()
+        MemberLevel.objects.filter(community=community, project=project, timestamp__lt=window_start).delete()
+        MemberActivityCount.objects.filter(project=project, day__lt=window_start.date()).delete()
+        if self.verbosity >= 3:
+            print("%s project expired levels: %s" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
+
+        now = datetime.datetime.utcnow()
+        with transaction.atomic():
+            taggings = self.get_taggings(project)
+            progress = self.get_progress(project, taggings)
+            self.count_conversations(community, project, window_start, progress.conversation_id)
+            self.count_contributions(community, project, window_start, progress.contribution_id)
+            self.recount_tagged(community, project, window_start, progress, taggings)
+            progress.conversation_id = self.max_conversation_id
+            progress.contribution_id = self.max_contribution_id
+            for name, through, tag_id, max_id in taggings:
+                setattr(progress, name+'_id', max_id)
+                setattr(progress, name+'_count', through.objects.filter(tag_id=tag_id, id__lte=max_id).count())
+            progress.save()
+        if self.verbosity >= 3:
+            print("%s project activity counts: %s" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
+
+        now = datetime.datetime.utcnow()
+        self.update_levels(community, project, window_start)
+        if self.verbosity >= 3:
+            print("%s project levels: %s\n" % (project.name, (datetime.datetime.utcnow() - now).total_seconds()))
+
+    def get_project_key(self, project):
+        channel_ids = sorted(project.channels.values_list('id', flat=True))
+        key = "%s:%s:%s:%s" % (project.tag_id, project.member_tag_id, channel_ids, project.threshold_period)
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def get_taggings(self, project):
+        # Tagging content or members later changes which activity counts for the project, so the tag tables are
+        # followed like the activity itself, only rows added up to now are looked at in this run
+        taggings = []
+        if project.default_project:
+            return taggings
+        if project.tag_id is not None:
+            taggings.append(('conversation_tag', Conversation.tags.through, project.tag_id))
+            taggings.append(('contribution_tag', Contribution.tags.through, project.tag_id))
+        if project.member_tag_id is not None:
+            taggings.append(('member_tag', Member.tags.through, project.member_tag_id))
+        return [(name, through, tag_id, through.objects.aggregate(max_id=Max('id'))['max_id'] or 0) for name, through, tag_id in taggings]
+
+    def get_progress(self, project, taggings):
+        progress, created = LevelCheckProgress.objects.get_or_create(project=project)
+        project_key = self.get_project_key(project)
+        rebuild_before = timezone.now() - datetime.timedelta(days=self.rebuild_days)
+        # Taggings only ever get added after the last one we saw, so fewer of them up to there means something was untagged
+        untagged = [name for name, through, tag_id, max_id in taggings if through.objects.filter(tag_id=tag_id, id__lte=getattr(progress, name+'_id')).count() < getattr(progress, name+'_count')]
+        # Counts can drift as content is merged or deleted, so start over now and then
+        if self.rebuild or created or untagged or progress.project_key != project_key or progress.rebuilt is None or progress.rebuilt < rebuild_before:
+            if self.verbosity >= 2:
+                print("Recounting all activity for %s" % project.name)
+            MemberActivityCount.objects.filter(project=project).delete()
+            progress.conversation_id = 0
+            progress.contribution_id = 0
+            for name, through, tag_id, max_id in taggings:
+                setattr(progress, name+'_id', max_id)
+            progress.project_key = project_key
+            progress.rebuilt = timezone.now()
+        return progress
+
+    def recount_tagged(self, community, project, window_start, progress, taggings):
+        """
+        Recount the members and days that already counted activity has been tagged into since the last run
+        """
+        tagged_members = set()
+        tagged_days = dict()
+        for name, through, tag_id, max_id in taggings:
+            added = through.objects.filter(tag_id=tag_id, id__gt=getattr(progress, name+'_id'), id__lte=max_id)
+            if name == 'member_tag':
+                tagged_members.update(added.values_list('member_id', flat=True))
+            elif name == 'conversation_tag':
+                activity = Conversation.objects.filter(id__in=added.values('conversation_id'), id__lte=self.max_conversation_id, timestamp__gte=window_start).annotate(day=TruncDate('timestamp')).values_list('speaker_id', 'day')
+                for member_id, day in activity:
+                    tagged_days.setdefault(member_id, set()).add(day)
+            else:
+                activity = Contribution.objects.filter(id__in=added.values('contribution_id'), id__lte=self.max_contribution_id, timestamp__gte=window_start).annotate(day=TruncDate('timestamp')).values_list('author_id', 'day')
+                for member_id, day in activity:
+                    tagged_days.setdefault(member_id, set()).add(day)
+
+        # Newly tagged members have all of their days recounted
+        members = list(tagged_members)
+        for i in range(0, len(members), BATCH_SIZE):
+            self.recount(community, project, window_start, members[i:i+BATCH_SIZE])
+
+        # Tagged content only needs its own days recounted, members sharing the same days are recounted together
+        by_days = dict()
+        for member_id, days in tagged_days.items():
+            if member_id not in tagged_members:
+                by_days.setdefault(frozenset(days), []).append(member_id)
+        for days, members in by_days.items():
+            for i in range(0, len(members), BATCH_SIZE):
+                self.recount(community, project, window_start, members[i:i+BATCH_SIZE], days)
+
+        if self.verbosity >= 2 and (tagged_members or tagged_days):
+            print("Recounted %s members for new tagging in %s" % (len(tagged_members | set(tagged_days)), project.name))
+
+    def recount(self, community, project, window_start, members, days=None):
+        counters = MemberActivityCount.objects.filter(project=project, member_id__in=members)
+        if days is not None:
+            counters = counters.filter(day__in=days)
+        counters.delete()
+        self.count_conversations(community, project, window_start, 0, members, days)
+        self.count_contributions(community, project, window_start, 0, members, days)
+
+    def count_conversations(self, community, project, window_start, from_id, members=None, days=None):
+        convos = Conversation.objects.filter(speaker__community=community, timestamp__gte=window_start, id__gt=from_id, id__lte=self.max_conversation_id)
+        if members is not None:
+            convos = convos.filter(speaker_id__in=members)
+        if days is not None:
+            convos = convos.filter(timestamp__date__in=days)
+        if not project.default_project:
+            project_filter = Q()
+            if project.tag is not None:
+                project_filter = project_filter | Q(tags=project.tag)
+            if project.member_tag is not None:
+                project_filter = project_filter | Q(speaker__tags=project.member_tag)
+            if project.channels.count() > 0:
+                project_filter = project_filter | Q(channel__in=project.channels.all())
+            convos = convos.filter(project_filter)
+        counts = convos.annotate(day=TruncDate('timestamp')).values('speaker_id', 'day').annotate(count=Count('id', distinct=True), last=Max('timestamp')).order_by()
+        self.add_counts(project, [(c['speaker_id'], c['day'], c['count'], c['last']) for c in counts], 'conversation_count', 'last_conversation')
+
+    def count_contributions(self, community, project, window_start, from_id, members=None, days=None):
+        contribs = Contribution.objects.filter(author__community=community, timestamp__gte=window_start, id__gt=from_id, id__lte=self.max_contribution_id)
+        if members is not None:
+            contribs = contribs.filter(author_id__in=members)
+        if days is not None:
+            contribs = contribs.filter(timestamp__date__in=days)
+        if not project.default_project:
+            project_filter = Q()
+            if project.tag is not None:
+                project_filter = project_filter | Q(tags=project.tag)
+            if project.member_tag is not None:
+                project_filter = project_filter | Q(author__tags=project.member_tag)
+            if project.channels.count() > 0:
+                project_filter = project_filter | Q(channel__in=project.channels.all())
+            contribs = contribs.filter(project_filter)
+        counts = contribs.annotate(day=TruncDate('timestamp')).values('author_id', 'day').annotate(count=Count('id', distinct=True), last=Max('timestamp')).order_by()
+        self.add_counts(project, [(c['author_id'], c['day'], c['count'], c['last']) for c in counts], 'contribution_count', 'last_contribution')
+
+    def add_counts(self, project, counts, count_field, last_field):
+        for i in range(0, len(counts), BATCH_SIZE):
+            batch = counts[i:i+BATCH_SIZE]
+            existing = dict()
+            for counter in MemberActivityCount.objects.filter(project=project, member_id__in=set([c[0] for c in batch]), day__in=set([c[1] for c in batch])):
+                existing[(counter.member_id, counter.day)] = counter
+
+            new_counters = []
+            changed_counters = []
+            for member_id, day, count, last in batch:
+                counter = existing.get((member_id, day))
+                if counter is None:
+                    counter = MemberActivityCount(project=project, member_id=member_id, day=day)
+                    new_counters.append(counter)
+                else:
+                    changed_counters.append(counter)
+                setattr(counter, count_field, getattr(counter, count_field) + count)
+                if getattr(counter, last_field) is None or last > getattr(counter, last_field):
+                    setattr(counter, last_field, last)
+            MemberActivityCount.objects.bulk_create(new_counters, batch_size=BATCH_SIZE)
+            MemberActivityCount.objects.bulk_update(changed_counters, [count_field, last_field], batch_size=BATCH_SIZE)
+
+    def update_levels(self, community, project, window_start):
+        totals = MemberActivityCount.objects.filter(project=project, day__gte=window_start.date()).values('member_id').annotate(convo_count=Sum('conversation_count'), last_convo=Max('last_conversation'), contrib_count=Sum('contribution_count'), last_contrib=Max('last_contribution')).order_by()
+        levels = dict([(level.member_id, level) for level in MemberLevel.objects.filter(community=community, project=project)])
+
+        new_levels = []
+        changed_levels = []
+        for total in totals:
+            if total['contrib_count'] >= project.threshold_core:
+                level, timestamp = MemberLevel.CORE, total['last_contrib']
+            elif total['contrib_count'] >= project.threshold_contributor:
+                level, timestamp = MemberLevel.CONTRIBUTOR, total['last_contrib']
+            elif total['convo_count'] >= project.threshold_participant:
+                level, timestamp = MemberLevel.PARTICIPANT, total['last_convo']
+            elif total['convo_count'] >= project.threshold_user:
+                level, timestamp = MemberLevel.USER, total['last_convo']
+            else:
+                continue
+
+            member_level = levels.get(total['member_id'])
+            if member_level is None:
+                new_levels.append(MemberLevel(community=community, project=project, member_id=total['member_id'], level=level, timestamp=timestamp, conversation_count=total['convo_count'], contribution_count=total['contrib_count']))
+            elif (member_level.level, member_level.timestamp, member_level.conversation_count, member_level.contribution_count) != (level, timestamp, total['convo_count'], total['contrib_count']):
+                member_level.level = level
+                member_level.timestamp = timestamp
+                member_level.conversation_count = total['convo_count']
+                member_level.contribution_count = total['contrib_count']
+                changed_levels.append(member_level)
+
+        MemberLevel.objects.bulk_create(new_levels, batch_size=BATCH_SIZE)
+        MemberLevel.objects.bulk_update(changed_levels, ['level', 'timestamp', 'conversation_count', 'contribution_count'], batch_size=BATCH_SIZE)
+        if self.verbosity >= 2:
+            print("%s new and %s changed levels for %s" % (len(new_levels), len(changed_levels), project.name))
@@ -12,6 +12,7 @@ from django.core.serializers.json import DjangoJSONEncoder
 
 from corm.models import *
 from corm.models import Report, pluralize
+from corm.rollups import has_rollups, get_rollups, distinct_by_span
 from notifications.signals import notify
 
 
@@ -296,7 +297,11 @@ class GrowthReporter(Reporter):
                 months.append(month)
             joined[month] = m['member_count']
 
-        spoke = members.filter(speaker_in__timestamp__gte=self.start, speaker_in__timestamp__lte=self.end).annotate(month=Trunc('speaker_in__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
+        if self.trunc_span != 'hour' and has_rollups(self.community, self.start, self.end):
+            rollups = get_rollups(self.community, self.start.date(), self.end.date())
+            spoke = [{'month': day, 'member_count': count} for day, count in distinct_by_span(rollups, 'speakers', self.trunc_span)]
+        else:
+            spoke = members.filter(speaker_in__timestamp__gte=self.start, speaker_in__timestamp__lte=self.end).annotate(month=Trunc('speaker_in__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
         for a in spoke:
             if a['month'] is not None:
                 month = self.trunc_date(a['month'])
@@ -417,7 +422,11 @@ class AnnualReporter(Reporter):
                 months.append(month)
             joined[month] = m['member_count']
 
-        spoke = members.filter(speaker_in__timestamp__gte=self.start, speaker_in__timestamp__lte=self.end).annotate(month=Trunc('speaker_in__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
+        if self.trunc_span != 'hour' and has_rollups(self.community, self.start, self.end):
+            rollups = get_rollups(self.community, self.start.date(), self.end.date())
+            spoke = [{'month': day, 'member_count': count} for day, count in distinct_by_span(rollups, 'speakers', self.trunc_span)]
+        else:
+            spoke = members.filter(speaker_in__timestamp__gte=self.start, speaker_in__timestamp__lte=self.end).annotate(month=Trunc('speaker_in__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
         for a in spoke:
             if a['month'] is not None:
                 month = self.trunc_date(a['month'])
@@ -7,17 +7,25 @@ import datetime
 import operator
 from functools import reduce
 
+import numpy
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.feature_extraction import text 
+from sklearn.preprocessing import normalize
 
-from django.db.models import Count, Q
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import Count, Q, Max, Exists, OuterRef
 from django.shortcuts import reverse
 from corm.models import Activity, Community, Member, Conversation, Tag, Contact, Source, ContributionType, Project, MemberLevel
-from corm.models import SuggestTag, SuggestMemberMerge, SuggestMemberTag, SuggestConversationTag, SuggestConversationAsContribution, SuggestTask
+from corm.models import SuggestTag, SuggestMemberMerge, SuggestMemberTag, SuggestConversationTag, SuggestConversationAsContribution, SuggestTask, TagSuggestionModel
 from corm.models import pluralize
+from corm.matching import MergeCandidates
 from notifications.signals import notify
 
+TAG_SUGGESTION_BATCH = 1000
+TAG_SUGGESTION_REFIT_DAYS = getattr(settings, 'TAG_SUGGESTION_REFIT_DAYS', 7)
+
 
 def get_support_activity(thankful_convo):
     try:
@@ -74,79 +82,23 @@ class Command(BaseCommand):
                 self.make_followup_suggestions(community)
 
     def make_merge_suggestions(self, community):
-        merge_count = 0
-        # Check for duplicate emails
-        dups = Contact.objects.filter(member__community=community, email_address__isnull=False).values('email_address').annotate(dup_count=Count('member_id', distinct=True)).order_by('email_address').filter(dup_count__gt=1)
-        print("Found %s duplicate email addresses" % len(dups))
-        i = 0
-        for dup in dups:
-            if dup['dup_count'] > 1:
-                if self.verbosity >= 3:
-                    print("%s: %s" % (i, dup))
-                i += 1
-                members = Member.objects.filter(community=community, contact__email_address=dup['email_address']).order_by('id').distinct()
-                destination_member = members[0]
-                if self.verbosity >= 3:
-                    print("Target member: [%s] %s" % (destination_member.id, destination_member))
-                for source_member in members[1:]:
-                    if self.verbosity >= 3:
-                        print("    <- [%s] %s" % (source_member.id, source_member))
-                    suggestion, created = SuggestMemberMerge.objects.get_or_create(community=community, destination_member=destination_member, source_member=source_member, defaults={'reason':'Email match: %s' % dup['email_address']})
-                    if created:
-                        merge_count += 1
-
-        # Check for duplicate usernames
-        dups = Contact.objects.filter(member__community=community).values('detail').annotate(dup_count=Count('member_id', distinct=True)).order_by('detail').filter(dup_count__gt=1)
-        print("Found %s duplicate usernames" % len(dups))
-        i = 0
-        for dup in dups:
-            if dup['dup_count'] > 1:
-                if self.verbosity >= 3:
-                    print("%s: %s" % (i, dup))
-                i += 1
-                members = Member.objects.filter(community=community, contact__detail=dup['detail']).order_by('id').distinct()
-                destination_member = members[0]
-                if self.verbosity >= 3:
-                    print("Target member: [%s] %s" % (destination_member.id, destination_member))
-                destination_sources = [c.source for c in destination_member.contact_set.all()]
-                for source_member in members[1:]:
-                    common_sources = source_member.contact_set.filter(source__in=destination_sources)
-                    if common_sources.count() > 0:
-                        if self.verbosity >= 2:
-                            print("Skipping same source match: %s -> %s " % (source_member, destination_member))
-                        continue
-                    if self.verbosity >= 3:
-                        print("    <- [%s] %s" % (source_member.id, source_member))
-                    suggestion, created = SuggestMemberMerge.objects.get_or_create(community=community, destination_member=destination_member, source_member=source_member, defaults={'reason':'Username match: %s' % dup['detail']})
-                    if created:
-                        merge_count += 1
-
-        # Check for duplicate display names
-        dups = Member.objects.filter(community=community).values('name').annotate(dup_count=Count('id', distinct=True)).order_by('name').filter(dup_count__gt=1)
-        print("Found %s duplicate names" % len(dups))
-        i = 0
-        for dup in dups:
-            names = dup['name'].split(' ')
-            if dup['dup_count'] > 1 and len(names) > 1:
-                if self.verbosity >= 3:
-                    print("%s: %s" % (i, dup))
-                i += 1
-                members = Member.objects.filter(community=community, name=dup['name']).order_by('id').distinct()
-                destination_member = members[0]
-                if self.verbosity >= 3:
-                    print("Target member: [%s] %s" % (destination_member.id, destination_member))
-                destination_sources = [c.source for c in destination_member.contact_set.all()]
-                for source_member in members[1:]:
-                    common_sources = source_member.contact_set.filter(source__in=destination_sources)
-                    if common_sources.count() > 0:
-                        if self.verbosity >= 2:
-                            print("Skipping same source match: %s -> %s " % (source_member, destination_member))
-                        continue
-                    if self.verbosity >= 3:
-                        print("    <- [%s] %s" % (source_member.id, source_member))
-                    suggestion, created = SuggestMemberMerge.objects.get_or_create(community=community, destination_member=destination_member, source_member=source_member, defaults={'reason':'Full name match: %s' % dup['name']})
-                    if created:
-                        merge_count += 1
+        candidates = MergeCandidates(community).candidates()
+        print("Found %s possible duplicate members" % len(candidates))
+
+        existing = set()
+        for destination_id, source_id in SuggestMemberMerge.objects.filter(community=community).values_list('destination_member_id', 'source_member_id').iterator():
+            existing.add((destination_id, source_id))
+            existing.add((source_id, destination_id))
+
+        new_suggestions = []
+        for destination_id, source_id, score, reason in candidates:
+            if (destination_id, source_id) in existing:
+                continue
+            if self.verbosity >= 3:
+                print("[%s] <- [%s] %s" % (destination_id, source_id, reason))
+            new_suggestions.append(SuggestMemberMerge(community=community, destination_member_id=destination_id, source_member_id=source_id, reason=reason[:256]))
+        SuggestMemberMerge.objects.bulk_create(new_suggestions, batch_size=1000)
+        merge_count = len(new_suggestions)
 
         # Notify managers of new suggestions
         print("Suggested %s member merges" % merge_count)
@@ -373,48 +325,32 @@ class Command(BaseCommand):
             )
 
     # Tag Suggestions
-    def sort_coo(self, coo_matrix):
-        tuples = zip(coo_matrix.col, coo_matrix.data)
-        return sorted(tuples, key=lambda x: (x[1], x[0]), reverse=True)
-
-    def extract_topn_from_vector(self, feature_names, sorted_items, topn=10):
-        """get the feature names and tf-idf score of top n items"""
-        
-        #use only topn items from vector
-        sorted_items = sorted_items[:topn]
-
-        score_vals = []
-        feature_vals = []
-        
-        # word index and corresponding tf-idf score
-        for idx, score in sorted_items:
-            
-            #keep track of feature name and its corresponding score
-            score_vals.append(round(score, 3))
-            feature_vals.append(feature_names[idx])
-
-        #create a tuples of feature,score
-        #results = zip(feature_vals,score_vals)
-        results= {}
-        for idx in range(len(feature_vals)):
-            results[feature_vals[idx]]=score_vals[idx]
-        
-        return results
+    def fit_tag_vocabulary(self, tagged, stop_words):
+        cv = CountVectorizer(max_df=0.25,stop_words=list(stop_words),max_features=10000)
+        word_count_vector = cv.fit_transform(tagged.values_list('content', flat=True).iterator(chunk_size=TAG_SUGGESTION_BATCH))
+        transformer = TfidfTransformer(smooth_idf=True,use_idf=True)
+        transformer.fit(word_count_vector)
+        vocabulary = sorted(cv.vocabulary_.keys(), key=cv.vocabulary_.get)
+        return vocabulary, transformer.idf_
+
+    def score_tag_terms(self, contents, vectorizer, idf, topn=20):
+        """sum of squared tf-idf scores for each term, counting only the top n terms of each conversation"""
+        tf_idf = normalize(vectorizer.transform(contents).multiply(idf).tocsr())
+        rows = numpy.repeat(numpy.arange(tf_idf.shape[0]), numpy.diff(tf_idf.indptr))
+        order = numpy.lexsort((-tf_idf.indices, -tf_idf.data, rows))
+        rank = numpy.arange(len(order)) - tf_idf.indptr[rows[order]]
+        top = order[rank < topn]
+        return numpy.bincount(tf_idf.indices[top], weights=tf_idf.data[top] ** 2, minlength=tf_idf.shape[1])
 
     def make_tag_suggestions(self, community):
         print("Calculating tags for %s" % community.name)
-        tagged = []
-        untagged = []
+        now = timezone.now()
+        max_id = Conversation.objects.aggregate(max_id=Max('id'))['max_id'] or 0
 
-        conversations = Conversation.objects.filter(channel__source__community=community, content__isnull=False)
-        conversations = conversations.filter(timestamp__gte=datetime.datetime.utcnow() - datetime.timedelta(days=60))
+        conversations = Conversation.objects.filter(channel__source__community=community, content__isnull=False, id__lte=max_id)
+        conversations = conversations.filter(timestamp__gte=now - datetime.timedelta(days=60))
         conversations = conversations.exclude(speaker__role=Member.BOT)
-        for c in conversations:
-
-            if c.tags.all().count() > 0:
-                tagged.append(c.content)
-            else:
-                untagged.append(c.content)
+        is_tagged = Exists(Conversation.tags.through.objects.filter(conversation_id=OuterRef('id')))
 
         used_keywords = set(('http', 'https', 'com', 'github', 'open', 'closed', 'merge', 'pr', 'issue', 'pull', 'issue', 'problem', 'help'))
         # exclude keywords already in tags
@@ -423,47 +359,63 @@ class Command(BaseCommand):
                 for w in word.split(" "):
                     used_keywords.add(w.lower().strip())
         # exclude usernames
-        for ident in Contact.objects.filter(source__community=community):
-            used_keywords.add(ident.detail.lower().strip())
+        for detail in Contact.objects.filter(source__community=community).values_list('detail', flat=True).iterator():
+            used_keywords.add(detail.lower().strip())
         #exclude rejected keywords
         #for s in SuggestTag.objects.filter(community=community, status=SuggestTag.REJECTED):
         #    used_keywords.add(s.keyword)
 
         stop_words = text.ENGLISH_STOP_WORDS.union(list(used_keywords))
 
+        # The vocabulary is fitted to tagged conversations every few days, in between only conversations that
+        # are new since the last run are scored and added to the saved totals
         try:
-            cv = CountVectorizer(max_df=0.25,stop_words=stop_words,max_features=10000)
-            word_count_vector = cv.fit_transform(tagged)
-            transformer = TfidfTransformer(smooth_idf=True,use_idf=True)
-            transformer.fit(word_count_vector)
-        except ValueError:
-            print("Not enough content to suggest tags")
-            # Not enough content
+            model = community.tag_suggestion_model
+        except TagSuggestionModel.DoesNotExist:
+            model = TagSuggestionModel(community=community)
+        if model.fitted_at is None or model.fitted_at < now - datetime.timedelta(days=TAG_SUGGESTION_REFIT_DAYS):
+            try:
+                vocabulary, idf = self.fit_tag_vocabulary(conversations.filter(is_tagged), stop_words)
+            except ValueError:
+                print("Not enough content to suggest tags")
+                # Not enough content
+                return
+            model.fitted_at = now
+            model.conversation_id = 0
+            model.conversation_count = 0
+            model.vocabulary = vocabulary
+            model.idf = idf.tolist()
+            model.scores = [0.0] * len(vocabulary)
+
+        vectorizer = CountVectorizer(vocabulary=model.vocabulary)
+        idf = numpy.array(model.idf)
+        tagwords = numpy.array(model.scores)
+        untagged = conversations.filter(~is_tagged, id__gt=model.conversation_id).values_list('content', flat=True)
+        batch = []
+        for content in untagged.iterator(chunk_size=TAG_SUGGESTION_BATCH):
+            batch.append(content)
+            if len(batch) >= TAG_SUGGESTION_BATCH:
+                tagwords += self.score_tag_terms(batch, vectorizer, idf)
+                model.conversation_count += len(batch)
+                batch = []
+        if batch:
+            tagwords += self.score_tag_terms(batch, vectorizer, idf)
+            model.conversation_count += len(batch)
+        model.conversation_id = max_id
+        model.scores = tagwords.tolist()
+        model.save()
+
+        convo_count = model.conversation_count
+        if convo_count == 0:
+            print("No untagged conversations to suggest tags from")
             return
 
-        feature_names = cv.get_feature_names()
-
-        convo_count = len(untagged)
-        tagwords = dict()
-        for c in untagged:
-            try:
-                tf_idf_vector = transformer.transform(cv.transform([c]))
-                sorted_items = self.sort_coo(tf_idf_vector.tocoo())
-                keywords = self.extract_topn_from_vector(feature_names ,sorted_items, 20)
-                for k, v in keywords.items():
-                    if len(k) <= 3:
-                        continue
-                    if k not in tagwords:
-                        tagwords[k] = 0
-                    tagwords[k] += (v * v)
-            except:
-                pass
-            
         suggestion_count = 0
-        now = datetime.datetime.utcnow()
         if self.verbosity >= 3:
             print("\n===Tag Words===")
-        for k, v in sorted(tagwords.items(), key=operator.itemgetter(1), reverse=True)[:25]:
+        # Tags can have been added since the vocabulary was fitted, so check against the current keywords too
+        keywords = [(k, tagwords[idx]) for idx, k in enumerate(model.vocabulary) if len(k) > 3 and k not in used_keywords]
+        for k, v in sorted(keywords, key=operator.itemgetter(1), reverse=True)[:25]:
             percent = 100 * v / convo_count
             if percent >= 0.5:
                 if self.verbosity >= 3:
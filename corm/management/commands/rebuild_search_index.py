@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+import datetime
+from django.db import DatabaseError
+
+from corm.search import create_search_index, drop_search_index
+
+class Command(BaseCommand):
+    help = 'Recreate the conversation and member search indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', dest='drop', action='store_true', help='Drop the existing index before recreating it')
+
+    def handle(self, *args, **options):
+        start_time = datetime.datetime.utcnow()
+        try:
+            if options.get('drop'):
+                drop_search_index()
+            create_search_index()
+        except DatabaseError as e:
+            raise CommandError("Unable to rebuild the search index: %s" % e)
+        if options.get('verbosity') >= 2:
+            print("Rebuilt search index in %s seconds" % (datetime.datetime.utcnow() - start_time).total_seconds())
@@ -1,42 +1,88 @@
 from django.core.management.base import BaseCommand, CommandError
-import datetime
-import re
-import string
-from corm.models import Tag, Contribution, Community
+from django.db.models import Max
+from django.utils import timezone
+from corm.models import Tag, Conversation, Contribution, Activity, Community, TaggingProgress
+from corm.tagging import KeywordMatcher, add_tags
 
-PUNCTUATION = "!\"&'()*+,.:;<=>?@[\]^_`{|}~/\r\n"
-table = str.maketrans(PUNCTUATION, ' '*len(PUNCTUATION))
+BATCH_SIZE = 10000
 
 class Command(BaseCommand):
     help = 'Auto-Tag contributions based attached conversations'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--community', dest='community_id', type=int)
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help='Check every contribution instead of only new ones')
+
     def handle(self, *args, **options):
 
-      for community in Community.objects.filter(status=Community.ACTIVE):
+      community_id = options.get('community_id')
+      rebuild = options.get('rebuild')
+      self.verbosity = options.get('verbosity')
+
+      if community_id:
+          communities = [Community.objects.get(id=community_id)]
+      else:
+          communities = Community.objects.filter(status=Community.ACTIVE)
+
+      for community in communities:
         print("Tagging contributions in  %s" % community.name)
-        keywords = dict()
-        for tag in community.tag_set.filter(keywords__isnull=False):
-          for word in tag.keywords.split(","):
-            word = " "+word.lower().strip()+" "
-            if not word in keywords:
-              keywords[word] = set()
-            keywords[word].add(tag)
-        #print("Found %s keywords" % len(keywords))
-
-        for contrib in Contribution.objects.filter(community=community):
-          try:
-            if contrib.conversation.tags.count() > 0:
-              #print("Tagging: %s" % contrib)
-              contrib.tags.set(contrib.conversation.tags.all())
-              contrib.activity.tags.add(*contrib.conversation.tags.all())
-          except:
-            pass
-          text = " "+contrib.title.lower().translate(table)+" "
-          tagged = set()
-          for keyword in keywords:
-            if keyword in text:
-              for tag in keywords[keyword]:
-                if tag.id not in tagged:
-                  contrib.tags.add(tag)
-                  contrib.activity.tags.add(tag)
-                  tagged.add(tag.id)
\ No newline at end of file
+        start_time = timezone.now()
+        max_id = Contribution.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        max_tagging_id = Conversation.tags.through.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        tags = list(community.tag_set.all())
+        keyword_tags = [tag for tag in tags if tag.keywords]
+        contributions = Contribution.objects.filter(community=community, id__lte=max_id)
+
+        progress, created = TaggingProgress.objects.get_or_create(community=community)
+        if rebuild or progress.contributions_tagged is None:
+            self.tag_contributions(contributions, KeywordMatcher.for_community(community, keyword_tags))
+        else:
+            # Older contributions only need checking against tags that are new or had their keywords edited
+            changed_tags = [tag for tag in tags if tag.last_changed is None or tag.last_changed >= progress.contributions_tagged]
+            if changed_tags:
+                if self.verbosity >= 2:
+                    print("Checking all contributions for changed tags: %s" % ", ".join([tag.name for tag in changed_tags]))
+                self.tag_contributions(contributions.filter(id__lte=progress.contribution_id), KeywordMatcher.for_community(community, [tag for tag in changed_tags if tag.keywords]), changed_tags)
+            # Conversations can be tagged without any keyword changing, by hand or from a suggestion, so copy those too
+            new_taggings = Conversation.tags.through.objects.filter(id__gt=progress.conversation_tag_id, id__lte=max_tagging_id)
+            self.tag_contributions(contributions.filter(id__lte=progress.contribution_id, conversation__in=new_taggings.values('conversation_id')), KeywordMatcher.for_community(community, []))
+            self.tag_contributions(contributions.filter(id__gt=progress.contribution_id), KeywordMatcher.for_community(community, keyword_tags))
+
+        progress.contribution_id = max_id
+        progress.conversation_tag_id = max_tagging_id
+        progress.contributions_tagged = start_time
+        progress.save()
+
+    def tag_contributions(self, contributions, matcher, only_tags=None):
+        batch = []
+        checked = 0
+        for row in contributions.values_list('id', 'activity__id', 'title', 'conversation__id').iterator(chunk_size=BATCH_SIZE):
+          batch.append(row)
+          checked += 1
+          if len(batch) >= BATCH_SIZE:
+            self.tag_batch(batch, matcher, only_tags)
+            batch = []
+        self.tag_batch(batch, matcher, only_tags)
+        if self.verbosity >= 2:
+          print("Checked %s contributions" % checked)
+
+    def tag_batch(self, batch, matcher, only_tags=None):
+        if not batch:
+          return
+        # Contributions get the tags of the conversation they came from, as well as any keyword matches in their title
+        conversation_tags = dict()
+        links = Conversation.tags.through.objects.filter(conversation_id__in=[row[3] for row in batch if row[3] is not None])
+        if only_tags is not None:
+          links = links.filter(tag__in=only_tags)
+        for convo_id, tag_id in links.values_list('conversation_id', 'tag_id'):
+          conversation_tags.setdefault(convo_id, set()).add(tag_id)
+
+        contrib_tags = []
+        activity_tags = []
+        for contrib_id, activity_id, title, convo_id in batch:
+          for tag_id in conversation_tags.get(convo_id, set()) | matcher.match(title):
+            contrib_tags.append((contrib_id, tag_id))
+            if activity_id is not None:
+              activity_tags.append((activity_id, tag_id))
+        add_tags(Contribution, contrib_tags)
+        add_tags(Activity, activity_tags)
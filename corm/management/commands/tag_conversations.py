@@ -1,10 +1,10 @@
 from django.core.management.base import BaseCommand, CommandError
-import datetime
-import re
-import string
-from corm.models import Tag, Conversation, Community
+from django.db.models import Max
+from django.utils import timezone
+from corm.models import Tag, Conversation, Activity, Community, TaggingProgress
+from corm.tagging import KeywordMatcher, add_tags
 
-PUNCTUATION = "!\"&'()*+,.:;<=>?@[\]^_`{|}~/\r\n"
+BATCH_SIZE = 10000
 
 class Command(BaseCommand):
     help = 'Auto-Tag conversations based on Tag keywords'
@@ -13,12 +13,15 @@ class Command(BaseCommand):
         parser.add_argument('--community', dest='community_id', type=int)
         parser.add_argument('--source', dest='source_id', type=int)
         parser.add_argument('--connector', dest='connector', type=str)
-        
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help='Check every conversation instead of only new ones')
+
     def handle(self, *args, **options):
 
       community_id = options.get('community_id')
       source_id = options.get('source_id')
       connector = options.get('connector')
+      rebuild = options.get('rebuild')
+      self.verbosity = options.get('verbosity')
 
       if community_id:
           community = Community.objects.get(id=community_id)
@@ -29,40 +32,55 @@ class Command(BaseCommand):
 
       for community in communities:
         print("Tagging conversations in  %s" % community.name)
-        keywords = dict()
-        for tag in community.tag_set.filter(keywords__isnull=False):
-          for word in tag.keywords.split(","):
-            word = " "+word.lower().strip()+" "
-            if len(word) <= 2:
-              # The word is blank
-              continue
-            if not word in keywords:
-              keywords[word] = set()
-            keywords[word].add(tag)
+        start_time = timezone.now()
+        max_id = Conversation.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        tags = list(community.tag_set.filter(keywords__isnull=False))
+
+        conversations = Conversation.objects.filter(channel__source__community=community, id__lte=max_id)
+        if source_id or connector:
+            # Partial runs check everything they select and leave the watermark alone
+            if source_id:
+                conversations = conversations.filter(channel__source_id=source_id)
+            if connector:
+                conversations = conversations.filter(channel__source__connector=connector)
+            self.tag_conversations(conversations, KeywordMatcher.for_community(community, tags))
+            continue
+
+        progress, created = TaggingProgress.objects.get_or_create(community=community)
+        if rebuild or progress.conversations_tagged is None:
+            self.tag_conversations(conversations, KeywordMatcher.for_community(community, tags))
+        else:
+            # Older conversations only need checking against tags that are new or had their keywords edited
+            changed_tags = [tag for tag in tags if tag.last_changed is None or tag.last_changed >= progress.conversations_tagged]
+            if changed_tags:
+                if self.verbosity >= 2:
+                    print("Checking all conversations for changed tags: %s" % ", ".join([tag.name for tag in changed_tags]))
+                self.tag_conversations(conversations.filter(id__lte=progress.conversation_id), KeywordMatcher.for_community(community, changed_tags))
+            self.tag_conversations(conversations.filter(id__gt=progress.conversation_id), KeywordMatcher.for_community(community, tags))
+
+        progress.conversation_id = max_id
+        progress.conversations_tagged = start_time
+        progress.save()
+
+    def tag_conversations(self, conversations, matcher):
+        if len(matcher) == 0:
+          return
 
-        conversations = Conversation.objects.filter(channel__source__community=community)
-        if source_id:
-            conversations = conversations.filter(channel__source_id=source_id)
-        if connector:
-            conversations = conversations.filter(channel__source__connector=connector)
-        count = conversations.count()
-        page = 0
-        chunk = 10000
-        while count > (chunk * page):
-          start = chunk * page
-          end = start + chunk
-          for convo in conversations[start:end]:
-            table = str.maketrans(PUNCTUATION, ' '*len(PUNCTUATION))
-            if convo.content is None:
-              continue
-            text = " "+convo.content.lower().translate(table)+" "
-            tagged = set()
-            for keyword in keywords:
-              if keyword in text:
-                for tag in keywords[keyword]:
-                  if tag.id not in tagged:
-                    #print("Tagging \"%s\" with %s because of %s" % (convo, tag.name, keyword))
-                    convo.tags.add(tag)
-                    convo.activity.tags.add(tag)
-                    tagged.add(tag.id)
-          page += 1
+        convo_tags = []
+        activity_tags = []
+        checked = 0
+        for convo_id, activity_id, content in conversations.values_list('id', 'activity__id', 'content').iterator(chunk_size=BATCH_SIZE):
+          checked += 1
+          for tag_id in matcher.match(content):
+            convo_tags.append((convo_id, tag_id))
+            if activity_id is not None:
+              activity_tags.append((activity_id, tag_id))
+          if len(convo_tags) >= BATCH_SIZE:
+            add_tags(Conversation, convo_tags)
+            add_tags(Activity, activity_tags)
+            convo_tags = []
+            activity_tags = []
+        add_tags(Conversation, convo_tags)
+        add_tags(Activity, activity_tags)
+        if self.verbosity >= 2:
+          print("Checked %s conversations" % checked)
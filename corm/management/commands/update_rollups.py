@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+import datetime
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import Max
+
+from corm.models import Community, Conversation, Contribution, ActivityRollup, RollupProgress
+from corm.rollups import update_rollups, ROLLUP_HISTORY_DAYS
+
+class Command(BaseCommand):
+    help = 'Update the daily activity rollups used by charts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--community', dest='community_id', type=int)
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help='Recount all days instead of only recent and changed ones')
+
+    def handle(self, *args, **options):
+        community_id = options.get('community_id')
+        self.verbosity = options.get('verbosity')
+        self.rebuild = options.get('rebuild')
+        self.refresh_days = getattr(settings, 'ROLLUP_REFRESH_DAYS', 2)
+
+        if community_id:
+            community = Community.objects.get(id=community_id)
+            print("Using Community: %s" % community.name)
+            communities = [community]
+        else:
+            communities = Community.objects.filter(status=Community.ACTIVE)
+
+        for community in communities:
+            self.update_community(community)
+
+    def update_community(self, community):
+        start_time = datetime.datetime.utcnow()
+        max_conversation_id = Conversation.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        max_contribution_id = Contribution.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        today = datetime.datetime.utcnow().date()
+        history_start = today - datetime.timedelta(days=ROLLUP_HISTORY_DAYS)
+        progress, created = RollupProgress.objects.get_or_create(community=community)
+        if self.rebuild or created or progress.updated is None:
+            days = set([history_start + datetime.timedelta(days=i) for i in range(ROLLUP_HISTORY_DAYS + 1)])
+        else:
+            # Recent days pick up re-tagging and other edits, older days are only recounted when something new was imported for them
+            days = set([today - datetime.timedelta(days=i) for i in range(self.refresh_days)])
+            history = datetime.datetime.combine(history_start, datetime.time.min)
+            new_conversations = Conversation.objects.filter(channel__source__community=community, id__gt=progress.conversation_id, id__lte=max_conversation_id, timestamp__gte=history)
+            days.update(new_conversations.dates('timestamp', 'day'))
+            new_contributions = Contribution.objects.filter(community=community, id__gt=progress.contribution_id, id__lte=max_contribution_id, timestamp__gte=history)
+            days.update(new_contributions.dates('timestamp', 'day'))
+
+        row_count = 0
+        for start, end in self.day_ranges(sorted(days)):
+            row_count += update_rollups(community, start, end)
+        ActivityRollup.objects.filter(community=community, day__lt=history_start).delete()
+
+        progress.conversation_id = max_conversation_id
+        progress.contribution_id = max_contribution_id
+        progress.updated = timezone.now()
+        progress.save()
+        if self.verbosity >= 2:
+            print("Updated %s days of rollups (%s rows) for %s in %s seconds" % (len(days), row_count, community.name, (datetime.datetime.utcnow() - start_time).total_seconds()))
+
+    def day_ranges(self, days):
+        # Group consecutive days so each range can be recounted with one set of queries
+        start = end = None
+        for day in days:
+            if start is None:
+                start = end = day
+            elif day == end + datetime.timedelta(days=1):
+                end = day
+            else:
+                yield start, end
+                start = end = day
+            if (end - start).days >= 30:
+                yield start, end
+                start = end = None
+        if start is not None:
+            yield start, end
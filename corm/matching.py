@@ -0,0 +1,160 @@
+import re
+import unicodedata
+import zlib
+import numpy
+from django.conf import settings
+
+from corm.models import Member, Contact
+
+# Groups of members sharing a key bigger than this are too generic to be the same person
+MERGE_MAX_BLOCK = getattr(settings, 'MERGE_MAX_BLOCK', 50)
+# How alike two names have to be, by trigram overlap, to suggest a merge on name alone
+MERGE_NAME_SIMILARITY = getattr(settings, 'MERGE_NAME_SIMILARITY', 0.65)
+
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MINHASH_PRIME = (1 << 31) - 1
+# Members hashed at a time, which bounds the size of the (trigrams x hashes) arrays
+MINHASH_CHUNK = getattr(settings, 'MERGE_MINHASH_CHUNK', 5000)
+
+def name_words(name):
+    if not name:
+        return []
+    name = unicodedata.normalize('NFKD', name)
+    name = "".join([c for c in name if not unicodedata.combining(c)])
+    return re.findall(r'[^\W_]+', name.lower())
+
+def normalize_email(email):
+    if not email or '@' not in email:
+        return None
+    user, domain = email.strip().lower().rsplit('@', 1)
+    user = user.split('+', 1)[0]
+    if not user or not domain:
+        return None
+    return "%s@%s" % (user, domain)
+
+def normalize_handle(detail):
+    if not detail:
+        return None
+    detail = detail.strip().lower().lstrip('@')
+    return detail or None
+
+def trigrams(words):
+    text = " %s " % " ".join(words)
+    return set([text[i:i+3] for i in range(len(text) - 2)])
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MergeCandidates:
+    """
+    Finds members that are likely the same person. Members are grouped by blocking keys (normalized email,
+    username and full name) and by MinHash/LSH buckets of their name trigrams, and only members that share a
+    group are ever compared.
+    """
+    def __init__(self, community):
+        self.community = community
+        self.names = dict()
+        self.emails = dict()
+        self.handles = dict()
+        self.sources = dict()
+        for member_id, name, email in Member.objects.filter(community=community).values_list('id', 'name', 'email_address').iterator():
+            self.names[member_id] = name_words(name)
+            email = normalize_email(email)
+            if email:
+                self.emails.setdefault(member_id, set()).add(email)
+        for member_id, source_id, detail, email in Contact.objects.filter(member__community=community).values_list('member_id', 'source_id', 'detail', 'email_address').iterator():
+            self.sources.setdefault(member_id, set()).add(source_id)
+            handle = normalize_handle(detail)
+            if handle:
+                self.handles.setdefault(member_id, set()).add(handle)
+            email = normalize_email(email)
+            if email:
+                self.emails.setdefault(member_id, set()).add(email)
+        self.trigrams = dict([(member_id, trigrams(words)) for member_id, words in self.names.items() if len(words) > 1])
+
+    def same_source(self, a, b):
+        return len(self.sources.get(a, set()) & self.sources.get(b, set())) > 0
+
+    def blocks(self, values):
+        blocks = dict()
+        for member_id, keys in values.items():
+            for key in keys:
+                blocks.setdefault(key, []).append(member_id)
+        return [(key, sorted(members)) for key, members in blocks.items() if 1 < len(members) <= MERGE_MAX_BLOCK]
+
+    def minhash_signatures(self, member_ids):
+        """
+        MinHash signature of each member's name trigrams, one row per member in the same order
+        """
+        hash_count = MINHASH_BANDS * MINHASH_ROWS
+        random = numpy.random.RandomState(1)
+        a = random.randint(1, MINHASH_PRIME, size=hash_count, dtype=numpy.int64)
+        b = random.randint(0, MINHASH_PRIME, size=hash_count, dtype=numpy.int64)
+        # Every hash is below MINHASH_PRIME, so the signatures fit in 32 bits
+        signatures = numpy.empty((len(member_ids), hash_count), dtype=numpy.uint32)
+        for chunk_start in range(0, len(member_ids), MINHASH_CHUNK):
+            shingles = []
+            owners = []
+            for i, member_id in enumerate(member_ids[chunk_start:chunk_start+MINHASH_CHUNK]):
+                for gram in self.trigrams[member_id]:
+                    shingles.append(zlib.crc32(gram.encode('utf-8')))
+                    owners.append(i)
+            shingles = numpy.array(shingles, dtype=numpy.int64)
+            owners = numpy.array(owners)
+            starts = numpy.flatnonzero(numpy.r_[True, owners[1:] != owners[:-1]])
+            hashed = (numpy.outer(shingles % MINHASH_PRIME, a) + b) % MINHASH_PRIME
+            signatures[chunk_start:chunk_start+len(starts)] = numpy.minimum.reduceat(hashed, starts, axis=0)
+        return signatures
+
+    def lsh_buckets(self):
+        member_ids = list(self.trigrams.keys())
+        if not member_ids:
+            return []
+        signatures = self.minhash_signatures(member_ids)
+
+        buckets = dict()
+        for band in range(MINHASH_BANDS):
+            rows = signatures[:, band*MINHASH_ROWS:(band+1)*MINHASH_ROWS]
+            for i, row in enumerate(rows):
+                buckets.setdefault((band, row.tobytes()), []).append(member_ids[i])
+        return [sorted(members) for members in buckets.values() if 1 < len(members) <= MERGE_MAX_BLOCK]
+
+    def candidates(self):
+        """
+        Scored (destination_id, source_id, score, reason) tuples, the older member is always the destination
+        """
+        found = dict()
+        def add(destination_id, source_id, score, reason):
+            pair = (destination_id, source_id)
+            if pair not in found or found[pair][0] < score:
+                found[pair] = (score, reason)
+
+        for email, members in self.blocks(self.emails):
+            for source_id in members[1:]:
+                add(members[0], source_id, 1.0, 'Email match: %s' % email)
+
+        for handle, members in self.blocks(self.handles):
+            for source_id in members[1:]:
+                if not self.same_source(members[0], source_id):
+                    add(members[0], source_id, 0.9, 'Username match: %s' % handle)
+
+        full_names = dict([(member_id, [" ".join(words)]) for member_id, words in self.names.items() if len(words) > 1])
+        for name, members in self.blocks(full_names):
+            for source_id in members[1:]:
+                if not self.same_source(members[0], source_id):
+                    add(members[0], source_id, 0.8, 'Full name match: %s' % name)
+
+        for members in self.lsh_buckets():
+            for i, destination_id in enumerate(members):
+                for source_id in members[i+1:]:
+                    if (destination_id, source_id) in found or self.same_source(destination_id, source_id):
+                        continue
+                    score = similarity(self.trigrams[destination_id], self.trigrams[source_id])
+                    if score >= MERGE_NAME_SIMILARITY:
+                        add(destination_id, source_id, 0.7 * score, 'Similar names: %s / %s' % (" ".join(self.names[destination_id]), " ".join(self.names[source_id])))
+
+        return sorted([(destination_id, source_id, score, reason) for (destination_id, source_id), (score, reason) in found.items()], key=lambda c: -c[2])
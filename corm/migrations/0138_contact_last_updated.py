@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0137_auto_20220302_1636'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='last_updated',
+            field=models.DateTimeField(blank=True, help_text='When identity details were last refreshed from the source', null=True),
+        ),
+    ]
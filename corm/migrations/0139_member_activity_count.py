@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0138_contact_last_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LevelCheckProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.IntegerField(default=0, help_text='Last conversation counted towards member levels')),
+                ('contribution_id', models.IntegerField(default=0, help_text='Last contribution counted towards member levels')),
+                ('project_key', models.CharField(default='', help_text='Project settings the counts were made with', max_length=64)),
+                ('rebuilt', models.DateTimeField(blank=True, null=True)),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='level_progress', to='corm.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MemberActivityCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('conversation_count', models.IntegerField(default=0)),
+                ('contribution_count', models.IntegerField(default=0)),
+                ('last_conversation', models.DateTimeField(blank=True, null=True)),
+                ('last_contribution', models.DateTimeField(blank=True, null=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corm.member')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corm.project')),
+            ],
+            options={
+                'unique_together': {('project', 'member', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0139_member_activity_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.IntegerField(default=0, help_text='Last conversation included in the rollups')),
+                ('contribution_id', models.IntegerField(default=0, help_text='Last contribution included in the rollups')),
+                ('updated', models.DateTimeField(blank=True, null=True)),
+                ('community', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup_progress', to='corm.community')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('role', models.CharField(blank=True, max_length=32, null=True)),
+                ('conversation_count', models.IntegerField(default=0)),
+                ('contribution_count', models.IntegerField(default=0)),
+                ('activity_count', models.IntegerField(default=0)),
+                ('active_members', models.BinaryField(default=b'', help_text='Sketch of the distinct members with any activity')),
+                ('speakers', models.BinaryField(default=b'', help_text='Sketch of the distinct members who spoke in conversations')),
+                ('channel', models.ForeignKey(blank=True, help_text='Empty for activity across all channels', null=True, on_delete=django.db.models.deletion.CASCADE, to='corm.channel')),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corm.community')),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='corm.source')),
+                ('tag', models.ForeignKey(blank=True, help_text='Empty for all activity regardless of tags', null=True, on_delete=django.db.models.deletion.CASCADE, to='corm.tag')),
+            ],
+            options={
+                'index_together': {('community', 'day')},
+            },
+        ),
+    ]
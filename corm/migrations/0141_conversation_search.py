@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:02
+
+from django.db import migrations
+
+def add_search_index(apps, schema_editor):
+    from corm.search import create_search_index
+    create_search_index(schema_editor.connection)
+
+def remove_search_index(apps, schema_editor):
+    from corm.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0140_activity_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0141_conversation_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaggingProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.IntegerField(default=0, help_text='Last conversation checked for tag keywords')),
+                ('contribution_id', models.IntegerField(default=0, help_text='Last contribution checked for tag keywords')),
+                ('conversations_tagged', models.DateTimeField(blank=True, help_text='Tags with keywords changed after this are checked against every conversation', null=True)),
+                ('contributions_tagged', models.DateTimeField(blank=True, help_text='Tags with keywords changed after this are checked against every contribution', null=True)),
+                ('community', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tagging_progress', to='corm.community')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0142_tagging_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagSuggestionModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fitted_at', models.DateTimeField(help_text='When the vocabulary was last fitted to tagged conversations')),
+                ('conversation_id', models.IntegerField(default=0, help_text='Last conversation scored against the vocabulary')),
+                ('conversation_count', models.IntegerField(default=0, help_text='Untagged conversations scored since the vocabulary was fitted')),
+                ('vocabulary', jsonfield.fields.JSONField(default=list)),
+                ('idf', jsonfield.fields.JSONField(default=list)),
+                ('scores', jsonfield.fields.JSONField(default=list)),
+                ('community', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tag_suggestion_model', to='corm.community')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+def backfill_response_times(apps, schema_editor):
+    from corm.models import set_response_times
+    set_response_times(apps.get_model('corm', 'Conversation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0143_tag_suggestion_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='response_time',
+            field=models.DurationField(blank=True, help_text='Time from the start of a thread to its first reply', null=True),
+        ),
+        migrations.RunPython(backfill_response_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0144_conversation_response_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionGraphSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timespan', models.IntegerField(help_text='Days of connections included, counting back from when it was created')),
+                ('created', models.DateTimeField()),
+                ('data', models.TextField(help_text='Graph nodes and links, as JSON ready to be served')),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corm.community')),
+            ],
+            options={
+                'unique_together': {('community', 'timespan')},
+            },
+        ),
+    ]
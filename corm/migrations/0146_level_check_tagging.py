@@ -0,0 +1,43 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0145_connection_graph_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='contribution_tag_count',
+            field=models.IntegerField(default=0, help_text="Project tag's contribution taggings up to contribution_tag_id"),
+        ),
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='contribution_tag_id',
+            field=models.IntegerField(default=0, help_text='Last contribution tagging counted towards member levels'),
+        ),
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='conversation_tag_count',
+            field=models.IntegerField(default=0, help_text="Project tag's conversation taggings up to conversation_tag_id"),
+        ),
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='conversation_tag_id',
+            field=models.IntegerField(default=0, help_text='Last conversation tagging counted towards member levels'),
+        ),
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='member_tag_count',
+            field=models.IntegerField(default=0, help_text="Project member tag's taggings up to member_tag_id"),
+        ),
+        migrations.AddField(
+            model_name='levelcheckprogress',
+            name='member_tag_id',
+            field=models.IntegerField(default=0, help_text='Last member tagging counted towards member levels'),
+        ),
+    ]
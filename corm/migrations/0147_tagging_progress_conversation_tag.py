@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corm', '0146_level_check_tagging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taggingprogress',
+            name='conversation_tag_id',
+            field=models.IntegerField(default=0, help_text='Last conversation tagging copied onto contributions'),
+        ),
+    ]
@@ -1,11 +1,12 @@
 import datetime, pytz
 import uuid
-from django.db import models
-from django.db.models import F, Q, Count, Max
+from django.db import models, transaction
+from django.db.models import F, Q, Count, Min, Max, Case, When, Value
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.shortcuts import redirect, get_object_or_404, reverse
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.messages.constants import DEFAULT_TAGS, WARNING
 from jsonfield.fields import JSONField
@@ -285,6 +286,22 @@ class Tag(models.Model):
         else:
             return ""
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        tag = super().from_db(db, field_names, values)
+        tag._loaded_keywords = tag.__dict__.get('keywords')
+        return tag
+
+    def save(self, *args, **kwargs):
+        # Taggers re-check old conversations and contributions for any tag changed since their last run
+        if self.pk is not None and self.keywords != getattr(self, '_loaded_keywords', self.keywords):
+            self.last_changed = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'last_changed' not in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['last_changed']
+        super().save(*args, **kwargs)
+        self._loaded_keywords = self.keywords
+
     def __str__(self):
         return "%s (%s)" % (self.name, self.community)
 
@@ -311,6 +328,14 @@ class MemberConnection(models.Model):
     def __str__(self):
         return "%s -> %s" % (self.from_member, self.to_member)
 
+class ConnectionGraphSnapshot(models.Model):
+    class Meta:
+        unique_together = [["community", "timespan"]]
+    community = models.ForeignKey(Community, on_delete=models.CASCADE)
+    timespan = models.IntegerField(help_text="Days of connections included, counting back from when it was created")
+    created = models.DateTimeField()
+    data = models.TextField(help_text="Graph nodes and links, as JSON ready to be served")
+
 class Member(TaggableModel):
     COMMUNITY = "community"
     STAFF = "staff"
@@ -418,8 +443,87 @@ class Member(TaggableModel):
         return self.name
 
     def merge_with(self, other_member):
-        merge_record = MemberMergeRecord.from_member(other_member, self)
+        Member.merge_members([(self, other_member)])
 
+    @classmethod
+    def merge_members(cls, pairs):
+        """
+        Merge the source member of each (destination, source) pair into its destination, all in one transaction.
+        Related rows are moved with one UPDATE per table for each batch of pairs, and rows that would duplicate
+        ones the destination already has are combined into them. Returns the number of members merged away.
+        """
+        members = dict()
+        parent = dict()
+        def find(member_id):
+            while member_id in parent:
+                member_id = parent[member_id]
+            return member_id
+        for destination, source in pairs:
+            members.setdefault(destination.id, destination)
+            members.setdefault(source.id, source)
+            # A member can only be merged away once, and chains end up on the last destination
+            if source.id in parent or find(destination.id) == source.id:
+                continue
+            parent[source.id] = find(destination.id)
+        mapping = dict([(source_id, find(source_id)) for source_id in parent])
+        if not mapping:
+            return 0
+
+        with transaction.atomic():
+            snapshots = MemberMergeRecord._serialize_many([members[member_id] for member_id in set(mapping) | set(mapping.values())])
+            MemberMergeRecord.objects.bulk_create([MemberMergeRecord(community=members[source_id].community, name=members[source_id].name, merged_with=members[target_id], data={'removed': snapshots[source_id], 'original': snapshots[target_id]}) for source_id, target_id in mapping.items()], batch_size=MERGE_BATCH_SIZE)
+
+            contacts = dict()
+            for member_ids in _batches(list(members)):
+                for member_id, detail in Contact.objects.filter(member_id__in=member_ids).values_list('member_id', 'detail'):
+                    contacts.setdefault(member_id, set()).add(detail)
+            for source_id in parent:
+                members[mapping[source_id]]._merge_fields(members[source_id], contacts)
+
+            for model, field in [(Contact, 'member_id'), (Note, 'member_id'), (Activity, 'member_id'), (Conversation, 'speaker_id'), (Contribution, 'author_id'), (Gift, 'member_id'), (MemberWatch, 'member_id'), (Participant, 'member_id'), (Participant, 'initiator_id'), (ManagerProfile, 'member_id'), (Project, 'owner_id')]:
+                _remap_members(model, field, mapping)
+
+            for through, field, other_field in [(Member.tags.through, 'member_id', 'tag_id'), (Task.stakeholders.through, 'member_id', 'task_id'), (Promotion.promoters.through, 'member_id', 'promotion_id')]:
+                for source_ids in _batches(list(mapping)):
+                    links = through.objects.filter(**{field+'__in': source_ids}).values_list(field, other_field)
+                    through.objects.bulk_create([through(**{field: mapping[member_id], other_field: other_id}) for member_id, other_id in links], batch_size=MERGE_BATCH_SIZE, ignore_conflicts=True)
+
+            def combine_levels(level, other):
+                level.level = max(level.level or 0, other.level or 0)
+                level.timestamp = max(level.timestamp, other.timestamp)
+                level.conversation_count += other.conversation_count
+                level.contribution_count += other.contribution_count
+            _merge_unique(MemberLevel, ['member_id'], ['project_id'], combine_levels, mapping, ['member', 'level', 'timestamp', 'conversation_count', 'contribution_count'])
+
+            def combine_counts(counter, other):
+                counter.conversation_count += other.conversation_count
+                counter.contribution_count += other.contribution_count
+                counter.last_conversation = max([d for d in (counter.last_conversation, other.last_conversation) if d is not None], default=None)
+                counter.last_contribution = max([d for d in (counter.last_contribution, other.last_contribution) if d is not None], default=None)
+            _merge_unique(MemberActivityCount, ['member_id'], ['project_id', 'day'], combine_counts, mapping, ['member', 'conversation_count', 'contribution_count', 'last_conversation', 'last_contribution'])
+
+            def combine_attendance(attendance, other):
+                if other.role > attendance.role:
+                    attendance.role = other.role
+            _merge_unique(EventAttendee, ['member_id'], ['event_id'], combine_attendance, mapping, ['member', 'role'])
+
+            def combine_connections(connection, other):
+                connection.first_connected = min(connection.first_connected, other.first_connected)
+                connection.last_connected = max(connection.last_connected, other.last_connected)
+                connection.connection_count += other.connection_count
+            _merge_unique(MemberConnection, ['from_member_id', 'to_member_id'], [], combine_connections, mapping, ['from_member', 'to_member', 'first_connected', 'last_connected', 'connection_count'])
+
+            for source_ids in _batches(list(mapping)):
+                Member.objects.filter(id__in=source_ids).delete()
+            targets = [members[target_id] for target_id in set(mapping.values())]
+            Member.objects.bulk_update(targets, ['user', 'name', 'first_seen', 'last_seen', 'role', 'email_address', 'mailing_address', 'phone_number', 'company'], batch_size=MERGE_BATCH_SIZE)
+
+        # Importers cache which member a contact belongs to, and the merged members' fields have changed
+        from corm.plugins import IDENTITY_CACHE
+        IDENTITY_CACHE.remove_members(set(mapping) | set(mapping.values()))
+        return len(mapping)
+
+    def _merge_fields(self, other_member, contacts):
         if self.user is None and other_member.user is not None :
             self.user = other_member.user
         if other_member.first_seen is not None and (self.first_seen is None or self.first_seen > other_member.first_seen):
@@ -439,57 +543,62 @@ class Member(TaggableModel):
         if self.company is None and other_member.company is not None:
             self.company = other_member.company
 
-        self_contacts = [c.detail for c in self.contact_set.all()]
-        other_contacts = [c.detail for c in other_member.contact_set.all()]
+        self_contacts = contacts.get(self.id, set())
+        other_contacts = contacts.get(other_member.id, set())
         if other_member.name is not None and self.name in self_contacts and other_member.name not in other_contacts:
             self.name = other_member.name
+        contacts[self.id] = self_contacts | other_contacts
 
-        Contact.objects.filter(member=other_member).update(member=self)
-        Note.objects.filter(member=other_member).update(member=self)
-        MemberConnection.objects.filter(from_member=other_member).update(from_member=self)
-        MemberConnection.objects.filter(to_member=other_member).update(to_member=self)
-        Activity.objects.filter(member=other_member).update(member=self)
-        Conversation.objects.filter(speaker=other_member).update(speaker=self)
-        Contribution.objects.filter(author=other_member).update(author=self)
-        Gift.objects.filter(member=other_member).update(member=self)
-        MemberWatch.objects.filter(member=other_member).update(member=self)
-
-        for tag in other_member.tags.all():
-            self.tags.add(tag)
+MERGE_BATCH_SIZE = 500
 
-        Participant.objects.filter(initiator=other_member).update(initiator=self)
-        Participant.objects.filter(member=other_member).update(member=self)
+def _batches(items, size=MERGE_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
 
-        for task in Task.objects.filter(project__community=self.community, stakeholders=other_member):
-            task.stakeholders.add(self)
-            task.stakeholders.remove(other_member)
+def _remap_members(model, field, mapping):
+    # Point every row at a merged member to its destination, one UPDATE per batch of members
+    for source_ids in _batches(list(mapping)):
+        target = Case(*[When(**{field: source_id}, then=Value(mapping[source_id])) for source_id in source_ids], output_field=models.IntegerField())
+        model.objects.filter(**{field+'__in': source_ids}).update(**{field: target})
 
-        for level in MemberLevel.objects.filter(member=other_member):
-            try:
-                self_level = MemberLevel.objects.get(community=self.community, project=level.project, member=self)
-                if level.level > self_level.level:
-                    self_level.level = level.level
-                if level.timestamp > self_level.timestamp:
-                    self_level.timestamp = level.timestamp
-                self_level.conversation_count += level.conversation_count
-                self_level.contribution_count += level.contribution_count
-                self_level.save()
-            except MemberLevel.DoesNotExist:
-                level.member = self
-                level.save()
-
-        for attendance in EventAttendee.objects.filter(member=other_member):
-            try:
-                self_attendance = EventAttendee.objects.get(community=self.community, event=attendance.event)
-                if attendance.role > self_attendance.role:
-                    self_attendance.role = attendance.role
-                self_attendance.save()
-            except:
-                attendance.member = self
-                attendance.save()
+def _merge_unique(model, member_fields, key_fields, combine, mapping, update_fields):
+    """
+    Move rows that can only exist once per member (and key), combining them into the row the destination
+    member already has when there is one
+    """
+    member_ids = list(set(mapping) | set(mapping.values()))
+    rows = dict()
+    for field in member_fields:
+        for batch in _batches(member_ids):
+            for row in model.objects.filter(**{field+'__in': batch}):
+                rows[row.pk] = row
+
+    # Rows the destinations already have go first so they're the ones kept
+    kept = dict()
+    changed = dict()
+    deleted = []
+    for row in sorted(rows.values(), key=lambda row: any([getattr(row, field) in mapping for field in member_fields])):
+        moved = False
+        for field in member_fields:
+            if getattr(row, field) in mapping:
+                setattr(row, field, mapping[getattr(row, field)])
+                moved = True
+        key = tuple([getattr(row, field) for field in member_fields + key_fields])
+        if len(member_fields) > 1 and len(set(key[:len(member_fields)])) == 1:
+            # Connections between members that were merged together
+            deleted.append(row.pk)
+        elif key in kept:
+            combine(kept[key], row)
+            changed[kept[key].pk] = kept[key]
+            deleted.append(row.pk)
+        else:
+            kept[key] = row
+            if moved:
+                changed[row.pk] = row
 
-        self.save()
-        other_member.delete()
+    for batch in _batches(deleted):
+        model.objects.filter(pk__in=batch).delete()
+    model.objects.bulk_update([row for pk, row in changed.items() if pk not in deleted], update_fields, batch_size=MERGE_BATCH_SIZE)
 
 class MemberMergeRecord(models.Model):
     community =  models.ForeignKey(Community, on_delete=models.CASCADE)
@@ -500,32 +609,60 @@ class MemberMergeRecord(models.Model):
 
     @classmethod
     def _serialize(self, member):
-        if member.last_seen is not None:
-            last_seen = member.last_seen.strftime('%Y-%m-%dT%H:%M:%S.%f')
-        else:
-            last_seen = None
-        data = {
-            'name': member.name,
-            'email_address': member.email_address,
-            'first_seen': member.first_seen.strftime('%Y-%m-%dT%H:%M:%S.%f'),
-            'last_seen': last_seen,
-            'mailing_address': member.mailing_address,
-            'phone_number': member.phone_number,
-            'avatar_url': member.avatar_url,
-            'role': member.role,
-            'company': member.company_id,
-            'identities': [ident.id for ident in Contact.objects.filter(member=member)],
-            'tags': [tag.id for tag in member.tags.all()],
-            'notes': [note.id for note in Note.objects.filter(member=member)],
-            'gifts': [gift.id for gift in Gift.objects.filter(member=member)],
-            'activity': [c.id for c in Activity.objects.filter(member=member)],
-            'conversations': [c.id for c in Conversation.objects.filter(speaker=member)],
-            'contributions': [c.id for c in Contribution.objects.filter(author=member)],
-            'event_attendance': [c.id for c in EventAttendee.objects.filter(member=member)],
-            'watches': [w.id for w in MemberWatch.objects.filter(member=member)],
-            'tasks': [t.id for t in Task.objects.filter(stakeholders=member)],
-            'levels': dict([(level.project_id, (level.level, level.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f'))) for level in MemberLevel.objects.filter(member=member)])
-        }
+        return self._serialize_many([member])[member.id]
+
+    @classmethod
+    def _serialize_many(self, members):
+        ids = [member.id for member in members]
+        def by_member(model, field, value='id'):
+            related = dict([(member_id, []) for member_id in ids])
+            for batch in _batches(ids):
+                for member_id, related_id in model.objects.filter(**{field+'__in': batch}).values_list(field, value):
+                    related[member_id].append(related_id)
+            return related
+        identities = by_member(Contact, 'member_id')
+        tags = by_member(Member.tags.through, 'member_id', 'tag_id')
+        notes = by_member(Note, 'member_id')
+        gifts = by_member(Gift, 'member_id')
+        activity = by_member(Activity, 'member_id')
+        conversations = by_member(Conversation, 'speaker_id')
+        contributions = by_member(Contribution, 'author_id')
+        event_attendance = by_member(EventAttendee, 'member_id')
+        watches = by_member(MemberWatch, 'member_id')
+        tasks = by_member(Task.stakeholders.through, 'member_id', 'task_id')
+        levels = dict([(member_id, dict()) for member_id in ids])
+        for batch in _batches(ids):
+            for level in MemberLevel.objects.filter(member_id__in=batch):
+                levels[level.member_id][level.project_id] = (level.level, level.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+
+        data = dict()
+        for member in members:
+            if member.last_seen is not None:
+                last_seen = member.last_seen.strftime('%Y-%m-%dT%H:%M:%S.%f')
+            else:
+                last_seen = None
+            data[member.id] = {
+                'name': member.name,
+                'email_address': member.email_address,
+                'first_seen': member.first_seen.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                'last_seen': last_seen,
+                'mailing_address': member.mailing_address,
+                'phone_number': member.phone_number,
+                'avatar_url': member.avatar_url,
+                'role': member.role,
+                'company': member.company_id,
+                'identities': identities[member.id],
+                'tags': tags[member.id],
+                'notes': notes[member.id],
+                'gifts': gifts[member.id],
+                'activity': activity[member.id],
+                'conversations': conversations[member.id],
+                'contributions': contributions[member.id],
+                'event_attendance': event_attendance[member.id],
+                'watches': watches[member.id],
+                'tasks': tasks[member.id],
+                'levels': levels[member.id],
+            }
         return data
 
     @classmethod
@@ -740,6 +877,7 @@ class Contact(ImportedDataModel):
     name = models.CharField(max_length=256, null=True, blank=True)
     email_address = models.EmailField(null=True, blank=True)
     avatar_url = models.URLField(max_length=512, null=True, blank=True)
+    last_updated = models.DateTimeField(null=True, blank=True, help_text="When identity details were last refreshed from the source")
 
     @property
     def link_url(self):
@@ -798,6 +936,23 @@ class Hyperlink(models.Model):
     def __str__(self):
         return self.url
 
+def set_response_times(model, thread_ids=None):
+    # Takes the model as an argument so migrations can backfill with it too
+    replies = model.objects.filter(thread_start__isnull=False, timestamp__gt=F('thread_start__timestamp')).order_by()
+    if thread_ids is None:
+        thread_ids = replies.values_list('thread_start_id', flat=True).distinct()
+    for batch in _batches(sorted(set(thread_ids))):
+        first_replies = dict(replies.filter(thread_start_id__in=batch).values('thread_start_id').annotate(first_reply=Min('timestamp')).values_list('thread_start_id', 'first_reply'))
+        changed = []
+        for convo in model.objects.filter(id__in=batch).only('id', 'timestamp', 'response_time'):
+            response_time = None
+            if convo.id in first_replies:
+                response_time = first_replies[convo.id] - convo.timestamp
+            if convo.response_time != response_time:
+                convo.response_time = response_time
+                changed.append(convo)
+        model.objects.bulk_update(changed, ['response_time'])
+
 class Conversation(TaggableModel, ImportedDataModel):
     class Meta:
         ordering = ("-timestamp",)
@@ -809,6 +964,11 @@ class Conversation(TaggableModel, ImportedDataModel):
     thread_start = models.ForeignKey('Conversation', related_name='replies', on_delete=models.CASCADE, null=True, blank=True)
     contribution = models.OneToOneField('Contribution', related_name='conversation', on_delete=models.SET_NULL, null=True, blank=True)
     links = models.ManyToManyField(Hyperlink)
+    response_time = models.DurationField(null=True, blank=True, help_text="Time from the start of a thread to its first reply")
+
+    @classmethod
+    def update_response_times(cls, thread_ids=None):
+        set_response_times(cls, thread_ids)
 
     @property
     def participants(self):
@@ -946,6 +1106,59 @@ class MemberLevel(models.Model):
     def level_name(self):
         return MemberLevel.LEVEL_MAP[self.level]
 
+class MemberActivityCount(models.Model):
+    class Meta:
+        unique_together = [["project", "member", "day"]]
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    day = models.DateField(db_index=True)
+    conversation_count = models.IntegerField(default=0)
+    contribution_count = models.IntegerField(default=0)
+    last_conversation = models.DateTimeField(null=True, blank=True)
+    last_contribution = models.DateTimeField(null=True, blank=True)
+
+class ActivityRollup(models.Model):
+    class Meta:
+        index_together = [["community", "day"]]
+    community = models.ForeignKey(Community, on_delete=models.CASCADE)
+    day = models.DateField()
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, null=True, blank=True)
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, null=True, blank=True, help_text="Empty for activity across all channels")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, null=True, blank=True, help_text="Empty for all activity regardless of tags")
+    role = models.CharField(max_length=32, null=True, blank=True)
+    conversation_count = models.IntegerField(default=0)
+    contribution_count = models.IntegerField(default=0)
+    activity_count = models.IntegerField(default=0)
+    active_members = models.BinaryField(default=b'', help_text="Sketch of the distinct members with any activity")
+    speakers = models.BinaryField(default=b'', help_text="Sketch of the distinct members who spoke in conversations")
+
+class RollupProgress(models.Model):
+    community = models.OneToOneField(Community, related_name='rollup_progress', on_delete=models.CASCADE)
+    conversation_id = models.IntegerField(default=0, help_text="Last conversation included in the rollups")
+    contribution_id = models.IntegerField(default=0, help_text="Last contribution included in the rollups")
+    updated = models.DateTimeField(null=True, blank=True)
+
+class LevelCheckProgress(models.Model):
+    project = models.OneToOneField(Project, related_name='level_progress', on_delete=models.CASCADE)
+    conversation_id = models.IntegerField(default=0, help_text="Last conversation counted towards member levels")
+    contribution_id = models.IntegerField(default=0, help_text="Last contribution counted towards member levels")
+    project_key = models.CharField(max_length=64, default='', help_text="Project settings the counts were made with")
+    rebuilt = models.DateTimeField(null=True, blank=True)
+    conversation_tag_id = models.IntegerField(default=0, help_text="Last conversation tagging counted towards member levels")
+    conversation_tag_count = models.IntegerField(default=0, help_text="Project tag's conversation taggings up to conversation_tag_id")
+    contribution_tag_id = models.IntegerField(default=0, help_text="Last contribution tagging counted towards member levels")
+    contribution_tag_count = models.IntegerField(default=0, help_text="Project tag's contribution taggings up to contribution_tag_id")
+    member_tag_id = models.IntegerField(default=0, help_text="Last member tagging counted towards member levels")
+    member_tag_count = models.IntegerField(default=0, help_text="Project member tag's taggings up to member_tag_id")
+
+class TaggingProgress(models.Model):
+    community = models.OneToOneField(Community, related_name='tagging_progress', on_delete=models.CASCADE)
+    conversation_id = models.IntegerField(default=0, help_text="Last conversation checked for tag keywords")
+    contribution_id = models.IntegerField(default=0, help_text="Last contribution checked for tag keywords")
+    conversation_tag_id = models.IntegerField(default=0, help_text="Last conversation tagging copied onto contributions")
+    conversations_tagged = models.DateTimeField(null=True, blank=True, help_text="Tags with keywords changed after this are checked against every conversation")
+    contributions_tagged = models.DateTimeField(null=True, blank=True, help_text="Tags with keywords changed after this are checked against every contribution")
+
 class Task(TaggableModel):
     class Meta:
         ordering = ("done", "due",)
@@ -961,7 +1174,7 @@ class Task(TaggableModel):
 
     @property
     def past_due(self):
-        return self.due < datetime.datetime.utcnow()
+        return self.due < timezone.now()
 
     @property
     def is_done(self):
@@ -1208,6 +1421,11 @@ class SuggestMemberMerge(Suggestion):
         self.destination_member.merge_with(self.source_member)
         return False
 
+    @classmethod
+    def accept_many(cls, suggestions, user):
+        # Accepted suggestions go away with the merged member
+        return Member.merge_members([(suggestion.destination_member, suggestion.source_member) for suggestion in suggestions])
+
 class SuggestTag(Suggestion):
     keyword = models.CharField(max_length=50)
     score = models.SmallIntegerField(default=0)
@@ -1216,6 +1434,15 @@ class SuggestTag(Suggestion):
         Tag.objects.create(community=self.community, name=self.keyword, keywords=self.keyword, color=color)
         self.delete()
 
+class TagSuggestionModel(models.Model):
+    community = models.OneToOneField(Community, related_name='tag_suggestion_model', on_delete=models.CASCADE)
+    fitted_at = models.DateTimeField(help_text="When the vocabulary was last fitted to tagged conversations")
+    conversation_id = models.IntegerField(default=0, help_text="Last conversation scored against the vocabulary")
+    conversation_count = models.IntegerField(default=0, help_text="Untagged conversations scored since the vocabulary was fitted")
+    vocabulary = JSONField(default=list)
+    idf = JSONField(default=list)
+    scores = JSONField(default=list)
+
 
 class SuggestTask(Suggestion):
     stakeholder = models.ForeignKey(Member, related_name='task_suggestions', on_delete=models.CASCADE)    
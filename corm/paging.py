@@ -0,0 +1,58 @@
+import base64
+import json
+from django.db.models import F, Q
+
+class Keyset:
+    """
+    Orders a queryset on one column (or annotation) plus id and pages through it by filtering on the last row of
+    the previous page instead of using OFFSET, so deep pages cost the same as the first one. Null values sort last
+    in both directions.
+    """
+    def __init__(self, field, descending=False):
+        self.field = field
+        self.descending = descending
+
+    def order(self, queryset):
+        if self.descending:
+            return queryset.order_by(F(self.field).desc(nulls_last=True), F('id').desc())
+        else:
+            return queryset.order_by(F(self.field).asc(nulls_last=True), F('id').asc())
+
+    def cursor(self, obj):
+        value = getattr(obj, self.field)
+        if hasattr(value, 'isoformat'):
+            # Keep the microseconds, rows with the same timestamp to the millisecond are common in imported data
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([self.field, self.descending, value, obj.id]).encode('utf-8')).decode('ascii')
+
+    def position(self, cursor):
+        try:
+            field, descending, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except:
+            return None
+        if field != self.field or descending != self.descending:
+            return None
+        return value, row_id
+
+    def after(self, queryset, value, row_id):
+        op = 'lt' if self.descending else 'gt'
+        if value is None:
+            return queryset.filter(**{self.field+'__isnull': True, 'id__'+op: row_id})
+        return queryset.filter(Q(**{self.field+'__'+op: value}) | Q(**{self.field: value, 'id__'+op: row_id}) | Q(**{self.field+'__isnull': True}))
+
+    def page(self, queryset, page, per_page, cursor=None):
+        """
+        Rows for a page and the cursor for the page after it. The cursor from the end of the previous page is used
+        when it's given and valid, otherwise it falls back to OFFSET so any page can still be jumped to.
+        """
+        queryset = self.order(queryset)
+        position = cursor and self.position(cursor)
+        if position:
+            rows = list(self.after(queryset, *position)[:per_page])
+        else:
+            start = (page-1) * per_page
+            rows = list(queryset[start:start+per_page])
+        next_cursor = None
+        if len(rows) == per_page:
+            next_cursor = self.cursor(rows[-1])
+        return rows, next_cursor
@@ -2,14 +2,22 @@ import datetime
 import re
 import subprocess
 import requests
+import requests.adapters
+import threading
 import urllib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
-from time import sleep
-from corm.models import Member, MemberWatch, Contact, Conversation, Contribution, Participant, ManagerProfile, Event, EventAttendee, Company, SourceGroup, CompanyDomains, Hyperlink
+from email.utils import parsedate_to_datetime
+from time import sleep, monotonic, time as epoch_time
+from corm.models import Member, MemberWatch, Contact, Conversation, Contribution, Participant, ManagerProfile, Event, EventAttendee, Company, SourceGroup, CompanyDomains, Hyperlink, Activity
 from corm.connectors import ConnectionManager
+from corm.connections import ConnectionGraph
 from corm.email import EmailMessage
 from django.conf import settings
+from django.db import connection, connections, transaction
 from django.shortcuts import reverse
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from notifications.signals import notify
 from notifications.models import Notification
@@ -28,6 +36,206 @@ def install_plugins():
         else:
             print("Failed to load plugin: %s" % plugin)
 
+# How long a contact's identity details are trusted before asking the source again
+IDENTITY_REFRESH_HOURS = getattr(settings, 'IDENTITY_REFRESH_HOURS', 24)
+
+def identity_is_stale(last_updated):
+    if last_updated is None:
+        return True
+    return last_updated < timezone.now() - datetime.timedelta(hours=IDENTITY_REFRESH_HOURS)
+
+# The Contact and Member fields make_member works with, in model order so instances can be built from them
+CONTACT_FIELDS = tuple([field.attname for field in Contact._meta.concrete_fields if field.attname in ('id', 'member_id', 'source_id', 'origin_id', 'detail', 'name', 'email_address', 'avatar_url', 'last_updated')])
+MEMBER_FIELDS = tuple([field.attname for field in Member._meta.concrete_fields if field.attname in ('id', 'community_id', 'name', 'email_address', 'avatar_url', 'first_seen', 'last_seen')])
+
+class IdentityCache:
+    """
+    Process-wide map of (source, origin_id) to the Contact and Member fields make_member works with, shared by
+    every importer so that known speakers don't need any queries. A source's entries are reloaded in one query
+    when its import starts, and members are dropped from it when they're merged.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or getattr(settings, 'IDENTITY_CACHE_SIZE', 100000)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def preload(self, source):
+        contacts = Contact.objects.filter(source=source, origin_id__isnull=False).values_list(*(CONTACT_FIELDS + tuple(['member__' + field for field in MEMBER_FIELDS])))
+        origin_index = CONTACT_FIELDS.index('origin_id')
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == source.id]:
+                del self._entries[key]
+            for row in contacts.iterator():
+                self._set((source.id, row[origin_index]), (row[:len(CONTACT_FIELDS)], row[len(CONTACT_FIELDS):]))
+
+    def get(self, source_id, origin_id):
+        """
+        Returns the cached Contact with its member, other fields are loaded from the database if they're used
+        """
+        key = (source_id, origin_id)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            contact_values, member_values = self._entries[key]
+        contact = Contact.from_db(Contact.objects.db, CONTACT_FIELDS, contact_values)
+        contact.member = Member.from_db(Member.objects.db, MEMBER_FIELDS, member_values)
+        return contact
+
+    def set(self, contact, member):
+        with self._lock:
+            self._set((contact.source_id, contact.origin_id), (tuple([getattr(contact, field) for field in CONTACT_FIELDS]), tuple([getattr(member, field) for field in MEMBER_FIELDS])))
+
+    def update_member(self, source_id, origin_id, member):
+        key = (source_id, origin_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (self._entries[key][0], tuple([getattr(member, field) for field in MEMBER_FIELDS]))
+
+    def _set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def remove_members(self, member_ids):
+        member_ids = set(member_ids)
+        member_index = CONTACT_FIELDS.index('member_id')
+        with self._lock:
+            for key in [key for key, (contact_values, member_values) in self._entries.items() if contact_values[member_index] in member_ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+IDENTITY_CACHE = IdentityCache()
+
+# One pooled HTTP session per source, so repeated API calls reuse their connections
+HTTP_SESSIONS = dict()
+HTTP_SESSIONS_LOCK = threading.Lock()
+
+def get_http_session(source):
+    with HTTP_SESSIONS_LOCK:
+        if source.id not in HTTP_SESSIONS:
+            pool_size = getattr(settings, 'API_POOL_SIZE', 10)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            HTTP_SESSIONS[source.id] = session
+        return HTTP_SESSIONS[source.id]
+
+class RateLimiter:
+    """
+    Token bucket shared by every importer that calls an API with the same credential. The bucket is
+    kept in sync with the rate limit headers the provider sends back, so requests are paced before
+    the budget runs out instead of after a 429.
+    """
+    REMAINING_HEADERS = ('X-RateLimit-Remaining', 'RateLimit-Remaining', 'X-Rate-Limit-Remaining')
+    RESET_HEADERS = ('X-RateLimit-Reset', 'RateLimit-Reset', 'X-Rate-Limit-Reset')
+
+    def __init__(self, rate=None, capacity=None, reserve=None):
+        # rate is in requests per second, None means no limit until the provider tells us one
+        self.rate = rate
+        self.capacity = capacity or 1
+        self.reserve = reserve if reserve is not None else getattr(settings, 'API_RATE_LIMIT_RESERVE', 10)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._refill(now)
+                if self.blocked_until > now:
+                    delay = self.blocked_until - now
+                elif self.rate is None or self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+    def is_paused(self):
+        return self.blocked_until > monotonic()
+
+    def update(self, resp):
+        retry_after = self._retry_after(resp.headers.get('Retry-After'))
+        if retry_after is not None:
+            self.pause(retry_after)
+
+        remaining = self._header_value(resp.headers, self.REMAINING_HEADERS)
+        reset_in = self._header_value(resp.headers, ('X-RateLimit-Reset-After',))
+        if reset_in is None:
+            reset_in = self._header_value(resp.headers, self.RESET_HEADERS)
+            if reset_in is not None and reset_in > 1000000000:
+                # Epoch timestamp rather than seconds from now
+                reset_in = reset_in - epoch_time()
+        if remaining is None or reset_in is None:
+            return
+        reset_in = max(reset_in, 1)
+
+        with self._lock:
+            now = monotonic()
+            available = remaining - self.reserve
+            if available < 1:
+                # Out of budget, hold every request until the window resets and let one through to
+                # pick up the new limits
+                self.tokens = 1
+                self.blocked_until = max(self.blocked_until, now + reset_in)
+            else:
+                # Spend what's left of this window, spread evenly once it has been used up
+                self.capacity = available
+                self.tokens = available
+                self.rate = available / reset_in
+            self.updated = now
+
+    def _header_value(self, headers, names):
+        for name in names:
+            if name in headers:
+                try:
+                    return float(headers[name])
+                except:
+                    pass
+        return None
+
+    def _retry_after(self, value):
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except:
+            pass
+        try:
+            return parsedate_to_datetime(value).timestamp() - epoch_time()
+        except:
+            return None
+
+RATE_LIMITERS = dict()
+RATE_LIMITERS_LOCK = threading.Lock()
+
+def get_rate_limiter(key, rate=None, capacity=None):
+    with RATE_LIMITERS_LOCK:
+        if key not in RATE_LIMITERS:
+            RATE_LIMITERS[key] = RateLimiter(rate=rate, capacity=capacity)
+        return RATE_LIMITERS[key]
+
+# Held while creating new members so concurrent importers don't create duplicates of the same person
+MEMBER_CREATION_LOCK = threading.Lock()
+
 class MemberWatchEmail(EmailMessage):
     def __init__(self, watch, convo=None):
         super(MemberWatchEmail, self).__init__(watch.manager, watch.member.community)
@@ -93,11 +301,18 @@ class PluginImporter:
         self._first_import = False
         self._full_import = False
         self._member_cache = dict()
+        self._conversation_queue = dict()
+        self._participant_queue = dict()
         self.API_HEADERS = dict()
         self.TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
         self.TAGGED_USER_MATCHER = re.compile('\@([a-zA-Z0-9]+)')
         self.API_BACKOFF_ATTEMPTS = getattr(settings, 'API_BACKOFF_ATTEMPTS', 5)
         self.API_BACKOFF_SECONDS = getattr(settings, 'API_BACKOFF_SECONDS', 10)
+        self.MAX_WORKERS = getattr(settings, 'MAX_SOURCE_IMPORT_WORKERS', 4)
+        self.API_CONCURRENCY = getattr(settings, 'API_CONCURRENCY', 4)
+        self.workers = 1
+        # Records or replays API responses, see corm.replay
+        self.cassette = None
 
     @property
     def plugin(self):
@@ -106,6 +321,17 @@ class PluginImporter:
         except:
             return None
 
+    @property
+    def session(self):
+        return get_http_session(self.source)
+
+    @property
+    def rate_limit_key(self):
+        return '%s:%s' % (self.source.connector, self.source.auth_secret or self.source.id)
+
+    def get_rate_limiter(self, url):
+        return get_rate_limiter(self.rate_limit_key)
+
     def get_full_import(self):
         return self._full_import or self._first_import
 
@@ -121,64 +347,91 @@ class PluginImporter:
     first_import = property(get_first_import, set_first_import)
 
     def make_member(self, origin_id, detail, tstamp=None, channel=None, email_address=None, avatar_url=None, name=None, speaker=False, replace_first_seen=False):
-        save_member = False
+        # Members can come from the identity cache with only some fields loaded, so only what changed gets saved
+        member_fields = []
         if origin_id in self._member_cache:
             member = self._member_cache[origin_id]
         else:
             if name is None:
                 name = detail
-            contact_matches = Contact.objects.filter(origin_id=origin_id, source=self.source)
-            if contact_matches.count() == 0:
-                first_seen = tstamp
-                if first_seen is None:
-                    first_seen = datetime.datetime.utcnow()
-                last_seen = None
-                if speaker and tstamp:
-                    last_seen = tstamp
-                member = Member.objects.create(community=self.community, name=name, email_address=email_address, avatar_url=avatar_url, first_seen=first_seen, last_seen=last_seen)
-                contact = Contact.objects.create(origin_id=origin_id, source=self.source, member=member, detail=detail, name=name, email_address=email_address, avatar_url=avatar_url)
-                self.update_identity(contact)
-            else:
-                matched_contact = contact_matches[0]
-                if detail:
-                    matched_contact.detail = detail
-                if name and not matched_contact.name or matched_contact.name == matched_contact.detail:
-                    matched_contact.name = name
-                if email_address and not matched_contact.email_address:
-                    matched_contact.email_address = email_address
-                if avatar_url and not matched_contact.avatar_url:
-                    matched_contact.avatar_url = avatar_url
-                matched_contact.save()
-                member = matched_contact.member
-
-                if member.name == matched_contact.detail and matched_contact.name is not None:
-                    member.name = matched_contact.name
-                    save_member = True
-                if member.email_address is None:
-                    member.email_address = matched_contact.email_address
-                    save_member = True
-                if member.avatar_url is None:
-                    member.avatar_url = matched_contact.avatar_url
-                    save_member = True
-                self.update_identity(matched_contact)
+            created = False
+            contact = IDENTITY_CACHE.get(self.source.id, origin_id)
+            if contact is None:
+                contact = self.find_contact(origin_id)
+
+            if contact is None:
+                with MEMBER_CREATION_LOCK:
+                    # Another importer may have created it while we were waiting
+                    contact = self.find_contact(origin_id)
+                    if contact is None:
+                        first_seen = tstamp
+                        if first_seen is None:
+                            first_seen = datetime.datetime.utcnow()
+                        last_seen = None
+                        if speaker and tstamp:
+                            last_seen = tstamp
+                        member = Member.objects.create(community=self.community, name=name, email_address=email_address, avatar_url=avatar_url, first_seen=first_seen, last_seen=last_seen)
+                        contact = Contact.objects.create(origin_id=origin_id, source=self.source, member=member, detail=detail, name=name, email_address=email_address, avatar_url=avatar_url, last_updated=timezone.now())
+                        created = True
+                if created:
+                    self.update_identity(contact)
+            if not created:
+                contact_fields = []
+                if detail and contact.detail != detail:
+                    contact.detail = detail
+                    contact_fields.append('detail')
+                if (name and not contact.name or contact.name == contact.detail) and contact.name != name:
+                    contact.name = name
+                    contact_fields.append('name')
+                if email_address and not contact.email_address:
+                    contact.email_address = email_address
+                    contact_fields.append('email_address')
+                if avatar_url and not contact.avatar_url:
+                    contact.avatar_url = avatar_url
+                    contact_fields.append('avatar_url')
+                # Only go back to the source for identity details once they're stale
+                refresh_identity = identity_is_stale(contact.last_updated)
+                if refresh_identity:
+                    contact.last_updated = timezone.now()
+                    contact_fields.append('last_updated')
+                if contact_fields:
+                    contact.save(update_fields=contact_fields)
+                member = contact.member
 
+                if member.name == contact.detail and contact.name is not None and member.name != contact.name:
+                    member.name = contact.name
+                    member_fields.append('name')
+                if member.email_address is None and contact.email_address is not None:
+                    member.email_address = contact.email_address
+                    member_fields.append('email_address')
+                if member.avatar_url is None and contact.avatar_url is not None:
+                    member.avatar_url = contact.avatar_url
+                    member_fields.append('avatar_url')
+                if refresh_identity:
+                    self.update_identity(contact)
+
+            IDENTITY_CACHE.set(contact, member)
             self._member_cache[origin_id] = member
         if member.first_seen == replace_first_seen and tstamp is not None:
             member.first_seen = tstamp
-            save_member = True
+            member_fields.append('first_seen')
 
         if speaker and tstamp is not None:
             if member.first_seen is None or tstamp < member.first_seen:
                 member.first_seen = tstamp
-                save_member = True
+                member_fields.append('first_seen')
             if member.last_seen is None or tstamp > member.last_seen:
                 member.last_seen = tstamp
-                save_member = True
-        if save_member:
-            member.save()
+                member_fields.append('last_seen')
+        if member_fields:
+            member.save(update_fields=set(member_fields))
+            IDENTITY_CACHE.update_member(self.source.id, origin_id, member)
 
         return member
 
+    def find_contact(self, origin_id):
+        return Contact.objects.filter(origin_id=origin_id, source=self.source).select_related('member').first()
+
     def make_conversation(self, origin_id, channel, speaker, content=None, tstamp=None, location=None, thread=None, contribution=None, dedup=False):
         if dedup:
             try:
@@ -196,6 +449,8 @@ class PluginImporter:
             convo.speaker = speaker
         convo.save()
         convo.update_activity()
+        if convo.thread_start_id is not None:
+            Conversation.update_response_times([convo.thread_start_id])
 
         if content is not None:
             tagged_users = self.get_tagged_users(content)
@@ -203,110 +458,273 @@ class PluginImporter:
                 self.add_participants(convo, tagged_users)
             for link in self.get_links(content):
                 try:
-                    url = urllib.parse.urlparse(link)
-                    if not url.hostname or not url.scheme:
+                    link_defaults = self.parse_link(link)
+                    if link_defaults is None:
                         continue
-                    if self.verbosity >= 3:
-                        print(link)
-                    # Clean hostname
-                    host = url.hostname
-                    host_parts = host.split('.')
-                    if len(host_parts) > 2:
-                        try:
-                            int(host_parts[-3])
-                            pass # host is an IP
-                        except:
-                            try:
-                                int(host_parts[-3][0])
-                                # 3-rd level subdomain starts with a number and is likely generated
-                                host = '.'.join(host_parts[-2:])
-                            except:
-                                pass
-                    if host[:4] == 'www.':
-                        host = host[4:] # Ignore www subdomains
-                    # Determine content type
-                    ctype = None
-                    if url.path is not None and url.path != '':
-                        ext = url.path.split('.')[-1].lower()
-                        if ext in ['html', 'htm']:
-                            ctype = 'Webpage'
-                        elif ext in ['png', 'jpg', 'jpeg', 'gif', 'svg'] or host in ['i.imgur.com', 'media.giphy.com', 'i.reddit.com']:
-                            ctype = 'Image'
-                        elif ext in ['zip', 'tar', 'gz', 'xz']:
-                            ctype = 'Archive'
-                        elif ext in ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx']:
-                            ctype = 'Document'
-                        elif ext in ['py', 'rs', 'go', 'cpp', 'php', 'rb', 'js', 'ts']:
-                            ctype = 'Code'
-                        elif ext in ['py', 'rs', 'go', 'cpp', 'php', 'rb', 'js', 'ts']:
-                            ctype = 'Code'
-                        elif host in ['youtube.com', 'youtu.be', 'vimeo.com', 'twitch.com', 'v.reddit.com']:
-                            ctype = 'Video'
-                        else:
-                            ctype = 'Webpage'
                     hl, created = Hyperlink.objects.get_or_create(
                         community=self.community,
                         url=link,
-                        defaults={
-                            'host':host,
-                            'path':url.path or '/',
-                            'content_type': ctype,
-                        }
+                        defaults=link_defaults
                     )
                     convo.links.add(hl)
                 except:
                     pass # Keep going even if capturing the hyperlink fails
 
         if speaker and tstamp is not None:
-            for watch in MemberWatch.objects.filter(member=speaker, start__lte=tstamp):
-                if watch.last_seen is None or tstamp > watch.last_seen:
-                    watch.last_seen = tstamp
-                    watch.last_channel = channel
-                    watch.save()
-                has_recent_notification = Notification.objects.filter(recipient=watch.manager, actor_object_id=speaker.id, actor_content_type=ContentType.objects.get_for_model(speaker), verb="has been active in", timestamp__gte=tstamp - datetime.timedelta(hours=1)).count()
-                if not has_recent_notification:
-                    notify.send(speaker, 
-                        recipient=watch.manager, 
-                        verb="has been active in",
-                        target=speaker.community,
-                        level='error',
-                        timestamp=tstamp,
-                        icon_name="fas fa-eye",
-                        link=reverse('member_activity', kwargs={'member_id':speaker.id}),
-                        source=self.source.id,
-                    )
+            self.notify_watchers(speaker, channel, convo, tstamp)
+        return convo
+
+    def notify_watchers(self, speaker, channel, convo, tstamp, watches=None):
+        if watches is None:
+            watches = MemberWatch.objects.filter(member=speaker, start__lte=tstamp)
+        for watch in watches:
+            if watch.last_seen is None or tstamp > watch.last_seen:
+                watch.last_seen = tstamp
+                watch.last_channel = channel
+                watch.save()
+            has_recent_notification = Notification.objects.filter(recipient=watch.manager, actor_object_id=speaker.id, actor_content_type=ContentType.objects.get_for_model(speaker), verb="has been active in", timestamp__gte=tstamp - datetime.timedelta(hours=1)).count()
+            if not has_recent_notification:
+                notify.send(speaker, 
+                    recipient=watch.manager, 
+                    verb="has been active in",
+                    target=speaker.community,
+                    level='error',
+                    timestamp=tstamp,
+                    icon_name="fas fa-eye",
+                    link=reverse('member_activity', kwargs={'member_id':speaker.id}),
+                    source=self.source.id,
+                )
+                try:
+                    profile = ManagerProfile.objects.get(user=watch.manager, community=self.source.community)
+                except ManagerProfile.DoesNotExist:
+                    continue
+                except Exception as e:
+                    print(e)
+                    continue
+
+                if profile and profile.send_notifications == True:
+                    email = MemberWatchEmail(watch, convo)
+                    email.send(profile.email)
+
+    def queue_conversation(self, origin_id, channel, speaker, content=None, tstamp=None, location=None, thread=None, contribution=None, tags=None):
+        # Batched version of make_conversation. Nothing is written until flush_conversations() is called,
+        # so importers should flush once per page of API results. The thread can be either a Conversation
+        # or the origin_id of another conversation in the same channel.
+        key = (channel.id, origin_id)
+        queued = self._conversation_queue.get(key)
+        if queued is None:
+            queued = {'origin_id': origin_id, 'channel': channel, 'speaker': None, 'content': None, 'tags': set()}
+            self._conversation_queue[key] = queued
+        queued['timestamp'] = tstamp
+        queued['location'] = location
+        queued['thread'] = thread
+        queued['contribution'] = contribution
+        if speaker is not None:
+            queued['speaker'] = speaker
+        if content is not None and (queued['content'] is None or len(queued['content']) < len(content)):
+            queued['content'] = content
+        if tags:
+            queued['tags'].update(tags)
+        if content is not None:
+            tagged_users = self.get_tagged_users(content)
+            if tagged_users:
+                self.queue_participants(channel, origin_id, tagged_users)
+
+    def queue_participants(self, channel, origin_id, members):
+        self._participant_queue.setdefault((channel.id, origin_id), set()).update(members)
+
+    def flush_conversations(self):
+        if len(self._conversation_queue) == 0 and len(self._participant_queue) == 0:
+            return
+        queued = self._conversation_queue
+        participants = self._participant_queue
+        self._conversation_queue = dict()
+        self._participant_queue = dict()
+        if self.verbosity >= 3:
+            print("Flushing %s conversations" % len(queued))
+
+        with transaction.atomic():
+            convo_map = self._flush_conversation_rows(queued, participants)
+            activities = self._flush_activity_rows(queued)
+            self._flush_link_rows(queued)
+            self._flush_participant_rows(convo_map, participants)
+
+            for data in queued.values():
+                if data['contribution'] is not None:
+                    data['contribution'].update_activity(activities[data['conversation'].id])
+
+        watched = set(MemberWatch.objects.filter(member_id__in=[data['speaker'].id for data in queued.values() if data['speaker'] is not None]).values_list('member_id', flat=True))
+        for data in queued.values():
+            if data['speaker'] is not None and data['speaker'].id in watched and data['timestamp'] is not None:
+                self.notify_watchers(data['speaker'], data['channel'], data['conversation'], data['timestamp'])
+
+    def _flush_conversation_rows(self, queued, participants):
+        keys = set(queued.keys()) | set(participants.keys())
+        for key, data in queued.items():
+            if isinstance(data['thread'], str):
+                keys.add((key[0], data['thread']))
+
+        convo_map = dict()
+        existing = Conversation.objects.filter(channel_id__in=set([key[0] for key in keys]), origin_id__in=set([key[1] for key in keys]))
+        for convo in existing.order_by('-id'):
+            convo_map[(convo.channel_id, convo.origin_id)] = convo
+
+        new_convos = []
+        for key, data in queued.items():
+            convo = convo_map.get(key)
+            if convo is None:
+                convo = Conversation(origin_id=data['origin_id'], channel=data['channel'])
+                new_convos.append(convo)
+                convo_map[key] = convo
+            convo.timestamp = data['timestamp']
+            convo.location = data['location']
+            convo.contribution = data['contribution']
+            if data['speaker'] is not None:
+                convo.speaker = data['speaker']
+            if data['content'] is not None and (convo.content is None or len(convo.content) < len(data['content'])):
+                convo.content = data['content']
+            data['conversation'] = convo
+
+        Conversation.objects.bulk_create(new_convos)
+        if len(new_convos) > 0 and new_convos[0].id is None:
+            # Not every database backend returns the new primary keys
+            new_ids = Conversation.objects.filter(channel_id__in=set([convo.channel_id for convo in new_convos]), origin_id__in=[convo.origin_id for convo in new_convos]).values_list('channel_id', 'origin_id', 'id')
+            for channel_id, origin_id, convo_id in new_ids:
+                convo_map[(channel_id, origin_id)].id = convo_id
+
+        for key, data in queued.items():
+            thread = data['thread']
+            if isinstance(thread, str):
+                thread = convo_map.get((key[0], thread))
+            data['conversation'].thread_start = thread
+
+        Conversation.objects.bulk_update([data['conversation'] for data in queued.values()], ['timestamp', 'location', 'thread_start', 'contribution', 'speaker', 'content'])
+        Conversation.update_response_times([data['conversation'].thread_start_id for data in queued.values() if data['conversation'].thread_start_id is not None])
+
+        speakers = dict()
+        for data in queued.values():
+            speaker = data['speaker']
+            tstamp = data['timestamp']
+            if speaker is not None and tstamp is not None and (speaker.last_seen is None or speaker.last_seen < tstamp):
+                speaker.last_seen = tstamp
+                speakers[speaker.id] = speaker
+        Member.objects.bulk_update(speakers.values(), ['last_seen'])
+
+        ConversationTag = Conversation.tags.through
+        ConversationTag.objects.bulk_create([ConversationTag(conversation_id=data['conversation'].id, tag_id=tag.id) for data in queued.values() for tag in data['tags']], ignore_conflicts=True)
+        return convo_map
+
+    def _flush_activity_rows(self, queued):
+        convos = [data['conversation'] for data in queued.values()]
+        activities = dict([(activity.conversation_id, activity) for activity in Activity.objects.filter(conversation_id__in=[convo.id for convo in convos])])
+        new_activities = []
+        updated_activities = []
+        for convo in convos:
+            activity = activities.get(convo.id)
+            if activity is None:
+                activity = Activity(
+                    conversation=convo,
+                    channel=convo.channel,
+                    member=convo.speaker,
+                    timestamp=convo.timestamp,
+                    icon_name='fas fa-comments',
+                    short_description='Commented',
+                    long_description=convo.brief,
+                    location=convo.location,
+                )
+                activities[convo.id] = activity
+                new_activities.append(activity)
+                continue
+            if convo.speaker_id:
+                activity.member_id = convo.speaker_id
+            if convo.content:
+                activity.long_description = Conversation.truncate(convo.content)
+            if convo.location:
+                activity.location = convo.location
+            updated_activities.append(activity)
+        Activity.objects.bulk_create(new_activities)
+        Activity.objects.bulk_update(updated_activities, ['member', 'long_description', 'location'])
+
+        ActivityTag = Activity.tags.through
+        convo_tags = Conversation.tags.through.objects.filter(conversation_id__in=activities.keys()).values_list('conversation_id', 'tag_id')
+        ActivityTag.objects.bulk_create([ActivityTag(activity_id=activities[convo_id].id, tag_id=tag_id) for convo_id, tag_id in convo_tags], ignore_conflicts=True)
+        return activities
+
+    def _flush_link_rows(self, queued):
+        max_length = Hyperlink._meta.get_field('url').max_length
+        links = dict()
+        convo_links = set()
+        for data in queued.values():
+            if data['content'] is None:
+                continue
+            for link in self.get_links(data['content']):
+                if len(link) > max_length:
+                    continue
+                if link not in links:
                     try:
-                        profile = ManagerProfile.objects.get(user=watch.manager, community=self.source.community)
-                    except ManagerProfile.DoesNotExist:
-                        continue
-                    except Exception as e:
-                        print(e)
-                        continue
+                        links[link] = self.parse_link(link)
+                    except:
+                        links[link] = None # Keep going even if capturing the hyperlink fails
+                if links[link] is not None:
+                    convo_links.add((data['conversation'].id, link))
+        if len(convo_links) == 0:
+            return
 
-                    if profile and profile.send_notifications == True:
-                        email = MemberWatchEmail(watch, convo)
-                        email.send(profile.email)
-        return convo
+        link_ids = dict(Hyperlink.objects.filter(community=self.community, url__in=links.keys()).values_list('url', 'id'))
+        new_links = [Hyperlink(community=self.community, url=link, **link_defaults) for link, link_defaults in links.items() if link_defaults is not None and link not in link_ids]
+        if len(new_links) > 0:
+            Hyperlink.objects.bulk_create(new_links)
+            link_ids.update(dict(Hyperlink.objects.filter(community=self.community, url__in=[hl.url for hl in new_links]).values_list('url', 'id')))
+
+        ConversationLink = Conversation.links.through
+        ConversationLink.objects.bulk_create([ConversationLink(conversation_id=convo_id, hyperlink_id=link_ids[link]) for convo_id, link in convo_links], ignore_conflicts=True)
+
+    def _flush_participant_rows(self, convo_map, participants, make_connections=True):
+        convo_ids = [convo_map[key].id for key in participants.keys() if key in convo_map]
+        existing = set(Participant.objects.filter(conversation_id__in=convo_ids).values_list('conversation_id', 'member_id'))
+        new_participants = []
+        graph = ConnectionGraph(self.community)
+        for key, members in participants.items():
+            convo = convo_map.get(key)
+            if convo is None:
+                continue
+            for member in members:
+                if (convo.id, member.id) in existing:
+                    continue
+                existing.add((convo.id, member.id))
+                new_participants.append(Participant(
+                    community=self.community,
+                    conversation_id=convo.id,
+                    member_id=member.id,
+                    initiator_id=convo.speaker_id,
+                    timestamp=convo.timestamp,
+                ))
+                if make_connections:
+                    for to_member in members:
+                        graph.add(member.id, to_member.id, convo.timestamp)
+        with transaction.atomic():
+            Participant.objects.bulk_create(new_participants)
+            graph.save(counts=False)
 
     def add_participants(self, conversation, members, make_connections=True):
-        for member in members:
-            try:
-                participant, created = Participant.objects.get_or_create(
-                    community=self.community, 
-                    conversation=conversation,
-                    member=member,
-                    defaults={
-                        'initiator': conversation.speaker,
-                        'timestamp':conversation.timestamp,
-                    }
-                )
-                if created and make_connections:
+        members = list(OrderedDict([(member.id, member) for member in members]).values())
+        # Participants and their connections are written together, a failure leaves neither and fails the channel import
+        with transaction.atomic():
+            existing = set(Participant.objects.filter(conversation=conversation, member__in=members).values_list('member_id', flat=True))
+            new_members = [member for member in members if member.id not in existing]
+            Participant.objects.bulk_create([Participant(
+                community=self.community,
+                conversation=conversation,
+                member=member,
+                initiator=conversation.speaker,
+                timestamp=conversation.timestamp,
+            ) for member in new_members])
+            if make_connections and new_members:
+                graph = ConnectionGraph(self.community)
+                for member in new_members:
                     for to_member in members:
-                        if member.id != to_member.id:
-                            member.add_connection(to_member, conversation.timestamp)
-            except Exception as e:
-                print(e)
-                pass
+                        graph.add(member.id, to_member.id, conversation.timestamp)
+                graph.save(counts=False)
 
     def make_participant(self, conversation, member):
         try:
@@ -361,10 +779,12 @@ class PluginImporter:
         for member in members:
             attendee = self.add_event_attendee(event, member, role)
             
-            if make_connections:
+        if make_connections:
+            graph = ConnectionGraph(self.community)
+            for member in members:
                 for to_member in members:
-                    if member.id != to_member.id:
-                        member.add_connection(to_member, event.start_timestamp)
+                    graph.add(member.id, to_member.id, event.start_timestamp)
+            graph.save(counts=False)
 
 
     def add_event_attendee(self, event, member, role=EventAttendee.GUEST):
@@ -398,23 +818,47 @@ class PluginImporter:
     def api_request(self, url, headers={}, params={}, retries=None, timeout=None):
         if self.verbosity or settings.DEBUG:
             print("API Call: %s" % url)
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(url, params)
         if retries is None:
             retries = self.API_BACKOFF_ATTEMPTS
+        limiter = self.get_rate_limiter(url)
         backoff_time = 0
-        resp = requests.get(url, headers=headers, params=params, timeout=timeout)
+        limiter.wait()
+        resp = self.session.get(url, headers=headers, params=params, timeout=timeout)
+        limiter.update(resp)
         while resp.status_code == 429 and retries > 0:
             retries -= 1
             if settings.DEBUG:
                 print("API backoff, %s retries remaining" % retries)
-            backoff_time += self.API_BACKOFF_SECONDS
-            sleep(backoff_time)
-            resp = requests.get(url, headers=headers, timeout=timeout)
+            if not limiter.is_paused():
+                # The provider didn't say how long to wait
+                backoff_time += self.API_BACKOFF_SECONDS
+                limiter.pause(backoff_time)
+            limiter.wait()
+            resp = self.session.get(url, headers=headers, params=params, timeout=timeout)
+            limiter.update(resp)
+        if self.cassette is not None:
+            self.cassette.record(url, params, resp)
         return resp
 
-    def api_call(self, path, retries=None, timeout=None):
+    def api_request_many(self, urls, headers={}, params={}, retries=None, timeout=None):
+        # Fetch independent URLs at the same time, returning the responses in the same order as the urls
+        if len(urls) < 2 or self.API_CONCURRENCY < 2:
+            return [self.api_request(url, headers=headers, params=params, retries=retries, timeout=timeout) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(self.API_CONCURRENCY, len(urls))) as pool:
+            return list(pool.map(lambda url: self.api_request(url, headers=headers, params=params, retries=retries, timeout=timeout), urls))
+
+    def api_url(self, path):
         if len(self.source.server) > 0 and self.source.server[-1] == '/' and path[0] == '/':
             path = path[1:]
-        return self.api_request(self.source.server+path, headers=self.API_HEADERS, retries=retries, timeout=timeout)
+        return self.source.server+path
+
+    def api_call(self, path, retries=None, timeout=None):
+        return self.api_request(self.api_url(path), headers=self.API_HEADERS, retries=retries, timeout=timeout)
+
+    def api_call_many(self, paths, retries=None, timeout=None):
+        return self.api_request_many([self.api_url(path) for path in paths], headers=self.API_HEADERS, retries=retries, timeout=timeout)
 
     def strftime(self, dtime):
         return dtime.strftime(self.TIMESTAMP_FORMAT)
@@ -434,6 +878,52 @@ class PluginImporter:
     def get_links(self, content):
         return [x[0] for x in URL_MATCHER.findall(content)]
 
+    def parse_link(self, link):
+        url = urllib.parse.urlparse(link)
+        if not url.hostname or not url.scheme:
+            return None
+        if self.verbosity >= 3:
+            print(link)
+        # Clean hostname
+        host = url.hostname
+        host_parts = host.split('.')
+        if len(host_parts) > 2:
+            try:
+                int(host_parts[-3])
+                pass # host is an IP
+            except:
+                try:
+                    int(host_parts[-3][0])
+                    # 3-rd level subdomain starts with a number and is likely generated
+                    host = '.'.join(host_parts[-2:])
+                except:
+                    pass
+        if host[:4] == 'www.':
+            host = host[4:] # Ignore www subdomains
+        # Determine content type
+        ctype = None
+        if url.path is not None and url.path != '':
+            ext = url.path.split('.')[-1].lower()
+            if ext in ['html', 'htm']:
+                ctype = 'Webpage'
+            elif ext in ['png', 'jpg', 'jpeg', 'gif', 'svg'] or host in ['i.imgur.com', 'media.giphy.com', 'i.reddit.com']:
+                ctype = 'Image'
+            elif ext in ['zip', 'tar', 'gz', 'xz']:
+                ctype = 'Archive'
+            elif ext in ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx']:
+                ctype = 'Document'
+            elif ext in ['py', 'rs', 'go', 'cpp', 'php', 'rb', 'js', 'ts']:
+                ctype = 'Code'
+            elif host in ['youtube.com', 'youtu.be', 'vimeo.com', 'twitch.com', 'v.reddit.com']:
+                ctype = 'Video'
+            else:
+                ctype = 'Webpage'
+        return {
+            'host':host,
+            'path':url.path or '/',
+            'content_type': ctype,
+        }
+
     def get_channels(self):
         channels = self.source.channel_set.filter(origin_id__isnull=False, source__auth_secret__isnull=False).order_by('last_import')
         return channels
@@ -446,6 +936,7 @@ class PluginImporter:
     
     def run(self, new_only=False, channels=None):
         failures = list()
+        IDENTITY_CACHE.preload(self.source)
         self.update_source()
         if channels is None:
             channels = self.get_channels()
@@ -456,76 +947,21 @@ class PluginImporter:
             raise Exception("No channels to import")
 
         self.pre_import(new_only, channels)
-        for channel in channels:
-            if self.verbosity >= 2:
-                print("Importing channel: %s" % channel.name)
-            full_import = self.full_import
-            first_import = self.first_import
-            try:
-                if channel.first_import is None:
-                    channel.first_import = datetime.datetime.utcnow()
-                    first_import = True
-                    channel.save()
-
-                if channel.last_import and not self.full_import:
-                    from_date = channel.last_import
-                else:
-                    from_date = datetime.datetime.utcnow() - datetime.timedelta(days=settings.MAX_IMPORT_HISTORY_DAYS)
-                    # Because we're going a full import, set the last_imported to now to avoid the next run
-                    # also trying to do a full import if this one hasn't finished yet.
-                    full_import = True
-                    channel.last_import = datetime.datetime.utcnow()
-                    channel.save()
-                if self.verbosity >= 2:
-                    print("From %s since %s" % (channel.name, from_date))
-
-                self.import_channel(channel, from_date, full_import)
-
-                if self.verbosity > 2:
-                    print("Completed import of %s" % channel.name)
-                if first_import:
-                    recipients = self.source.community.managers or self.source.community.owner
-                    notify.send(channel, 
-                        recipient=recipients, 
-                        verb="has been imported into",
-                        target=self.community,
-                        level='success',
-                        icon_name="fas fa-file-import",
-                        link=reverse('channels', kwargs={'source_id':self.source.id, 'community_id':self.source.community.id})
-                    )
-                if channel.oldest_import is None or from_date < channel.oldest_import:
-                    channel.oldest_import = from_date
-                channel.last_import = datetime.datetime.utcnow()
-                channel.import_failed_attempts = 0
-                channel.import_failed_message = None
-                channel.save()
-            except Exception as e:
-                if first_import:
-                    channel.first_import = None
-                    channel.oldest_import = None
-                channel.import_failed_attempts += 1
-                channel.import_failed_message = str(e)
-                if channel.import_failed_attempts >= settings.MAX_CHANNEL_IMPORT_FAILURES:
-                    channel.enabled = False
-                    recipients = self.source.community.managers or self.source.community.owner
-                    notify.send(channel, 
-                        recipient=recipients, 
-                        verb="failed to import into",
-                        target=self.community,
-                        level='error',
-                        icon_name="fas fa-file-import",
-                        link=reverse('channels', kwargs={'source_id':self.source.id, 'community_id':self.source.community.id}),
-                        error=str(e)
-                    )
-                channel.save()
-                failures.append(channel.name)
-                if self.verbosity:
-                    print("Failed to import %s: %s" %(channel.name, e))
-                if self.debug:
-                    # Drop into PDB to debug the import exception
-                    import pdb; pdb.post_mortem()
-            if self.full_import:
-                sleep(5)
+        workers = min(self.workers, self.MAX_WORKERS)
+        if connection.vendor == 'sqlite':
+            # SQLite can't handle concurrent writers
+            workers = 1
+        if workers > 1 and not self.debug:
+            # Each channel gets its own importer so per-channel state isn't shared between threads
+            channels = list(channels)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for channel, imported in zip(channels, pool.map(self.run_channel_worker, channels)):
+                    if not imported:
+                        failures.append(channel.name)
+        else:
+            for channel in channels:
+                if not self.run_channel(channel):
+                    failures.append(channel.name)
 
         self.post_import(new_only, channels)
 
@@ -546,6 +982,97 @@ class PluginImporter:
 
         self.source.save()
 
+    def run_channel(self, channel):
+        if self.verbosity >= 2:
+            print("Importing channel: %s" % channel.name)
+        full_import = self.full_import
+        first_import = self.first_import
+        try:
+            if channel.first_import is None:
+                channel.first_import = datetime.datetime.utcnow()
+                first_import = True
+                channel.save()
+
+            if channel.last_import and not self.full_import:
+                from_date = channel.last_import
+            else:
+                from_date = datetime.datetime.utcnow() - datetime.timedelta(days=settings.MAX_IMPORT_HISTORY_DAYS)
+                # Because we're going a full import, set the last_imported to now to avoid the next run
+                # also trying to do a full import if this one hasn't finished yet.
+                full_import = True
+                channel.last_import = datetime.datetime.utcnow()
+                channel.save()
+            if self.verbosity >= 2:
+                print("From %s since %s" % (channel.name, from_date))
+
+            self.import_channel(channel, from_date, full_import)
+            self.flush_conversations()
+
+            if self.verbosity > 2:
+                print("Completed import of %s" % channel.name)
+            if first_import:
+                recipients = self.source.community.managers or self.source.community.owner
+                notify.send(channel, 
+                    recipient=recipients, 
+                    verb="has been imported into",
+                    target=self.community,
+                    level='success',
+                    icon_name="fas fa-file-import",
+                    link=reverse('channels', kwargs={'source_id':self.source.id, 'community_id':self.source.community.id})
+                )
+            if channel.oldest_import is None or from_date < channel.oldest_import:
+                channel.oldest_import = from_date
+            channel.last_import = datetime.datetime.utcnow()
+            channel.import_failed_attempts = 0
+            channel.import_failed_message = None
+            channel.save()
+        except Exception as e:
+            self._conversation_queue = dict()
+            self._participant_queue = dict()
+            if first_import:
+                channel.first_import = None
+                channel.oldest_import = None
+            channel.import_failed_attempts += 1
+            channel.import_failed_message = str(e)
+            if channel.import_failed_attempts >= settings.MAX_CHANNEL_IMPORT_FAILURES:
+                channel.enabled = False
+                recipients = self.source.community.managers or self.source.community.owner
+                notify.send(channel, 
+                    recipient=recipients, 
+                    verb="failed to import into",
+                    target=self.community,
+                    level='error',
+                    icon_name="fas fa-file-import",
+                    link=reverse('channels', kwargs={'source_id':self.source.id, 'community_id':self.source.community.id}),
+                    error=str(e)
+                )
+            channel.save()
+            if self.verbosity:
+                print("Failed to import %s: %s" %(channel.name, e))
+            if self.debug:
+                # Drop into PDB to debug the import exception
+                import pdb; pdb.post_mortem()
+            return False
+        return True
+
+    def get_worker(self):
+        worker = self.plugin.get_source_importer(self.source)
+        worker.verbosity = self.verbosity
+        worker.debug = self.debug
+        worker.full_import = self._full_import
+        worker.first_import = self._first_import
+        worker.cassette = self.cassette
+        return worker
+
+    def run_channel_worker(self, channel):
+        try:
+            return self.get_worker().run_channel(channel)
+        except Exception as e:
+            print("Failed to import %s: %s" %(channel.name, e))
+            return False
+        finally:
+            connections.close_all()
+
     def import_channel(self, channel):
         raise NotImplementedError
 
@@ -109,11 +109,10 @@ class DiscoursePlugin(BasePlugin):
                 })
                 subcategories = category.get('subcategory_ids')
                 if subcategories:
-                    for sub_id in subcategories:
-                        resp = importer.api_request(source.server+DISCOURSE_CATEGORY_URL % {'id': sub_id}, retries=0, timeout=10)
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            sub = data.get('category')
+                    sub_responses = importer.api_request_many([source.server+DISCOURSE_CATEGORY_URL % {'id': sub_id} for sub_id in subcategories], retries=0, timeout=10)
+                    for sub_id, sub_resp in zip(subcategories, sub_responses):
+                        if sub_resp.status_code == 200:
+                            sub = sub_resp.json().get('category')
                             channels.append({
                                 'id': '%s/c/%s/%s/%s' % (source.server, category.get('slug'), sub.get('slug'), sub_id),
                                 'name': '%s / %s' % (category.get('name'), sub.get('name')),
@@ -194,6 +193,7 @@ class DiscourseImporter(PluginImporter):
             else:
                 page += 1
 
+            import_topics = []
             for topic in data.get('topic_list').get('topics'):
                 if topic['category_id'] != category_id:
                     # Topic belongs to a sub-category
@@ -210,6 +210,11 @@ class DiscourseImporter(PluginImporter):
 
                 # Found a topic to import
                 has_more = True
+                import_topics.append(topic)
+
+            # Fetch the posts for all of this page's topics at once
+            posts_responses = self.api_call_many([DISCOURSE_POSTS_URL % {'id': topic['id'], 'page': 0} for topic in import_topics])
+            for topic, posts_resp in zip(import_topics, posts_responses):
                 #print("Importing %s" % topic['title'])
                 topic_url = "%s/t/%s/%s" % (self.source.server, topic['slug'], topic['id'])
                 topic_participants = set()
@@ -217,10 +222,6 @@ class DiscourseImporter(PluginImporter):
                 thread_post = None
 
                 posts_by_id = dict()
-                posts_page = 0
-                posts_url = DISCOURSE_POSTS_URL % {'id': topic['id'], 'page': posts_page}
-                    
-                posts_resp = self.api_call(posts_url)
 
                 if posts_resp.status_code == 200:
                     posts_data = posts_resp.json()
@@ -267,6 +267,9 @@ class GithubImporter(PluginImporter):
         resp = self.api_call(repo_issues_url)
         if resp.status_code == 200:
             issues = resp.json()
+            # Fetch the comments for every issue on this page at once
+            comment_urls = [issue['comments_url'] for issue in issues if issue.get('comments', 0) > 0]
+            comment_responses = dict(zip(comment_urls, self.api_request_many(comment_urls, headers=self.API_HEADERS)))
             for issue in issues:
 
                 participants = set()
@@ -283,24 +286,22 @@ class GithubImporter(PluginImporter):
                     issue_body = issue['body']
                     if issue_body is not None:
                         issue_body = issue_body.replace("\x00", "\uFFFD")
-                    convo = self.make_conversation(origin_id=github_convo_link, channel=channel, speaker=member, content=issue_body, tstamp=tstamp, location=issue['html_url'])
-                    conversations.add(convo)
+                    contrib = None
+                    convo_tags = None
                     # Pull Requests are Contributions
                     if 'pull_request' in issue:
                         contrib, created = Contribution.objects.update_or_create(origin_id=github_convo_link, community=community, defaults={'contribution_type':self.PR_CONTRIBUTION, 'channel':channel, 'author':member, 'timestamp':tstamp, 'title':issue['title'][:255], 'location':issue['html_url']})
-                        contrib.update_activity(convo.activity)
                         # Not all comments should get the channel tag, but all PRs should
                         if channel.tag:
                             contrib.tags.add(channel.tag)
-                            convo.tags.add(channel.tag)
-                        convo.contribution = contrib
-                        convo.save()
-
+                            convo_tags = [channel.tag]
+                    self.queue_conversation(origin_id=github_convo_link, channel=channel, speaker=member, content=issue_body, tstamp=tstamp, location=issue['html_url'], contribution=contrib, tags=convo_tags)
+                    conversations.add(github_convo_link)
 
                     participants.add(member)
 
-                    comment_resp = self.api_call(issue['comments_url'])
-                    if comment_resp.status_code == 200:
+                    comment_resp = comment_responses.get(issue['comments_url'])
+                    if comment_resp is not None and comment_resp.status_code == 200:
                         comments = comment_resp.json()
                         for comment in comments:
                             comment_tstamp = datetime.datetime.strptime(comment['created_at'], GITHUB_TIMESTAMP)
@@ -309,9 +310,9 @@ class GithubImporter(PluginImporter):
                             comment_body = comment['body']
                             if comment_body is not None:
                                 comment_body = comment_body.replace("\x00", "\uFFFD")
-                            comment_convo = self.make_conversation(origin_id=comment['url'], channel=channel, speaker=comment_member, content=comment_body, tstamp=comment_tstamp, location=comment['html_url'], thread=convo)
+                            self.queue_conversation(origin_id=comment['url'], channel=channel, speaker=comment_member, content=comment_body, tstamp=comment_tstamp, location=comment['html_url'], thread=github_convo_link)
                             participants.add(comment_member)
-                            conversations.add(comment_convo)
+                            conversations.add(comment['url'])
                             tagged = set(tag_matcher.findall(comment['body']))
                             if tagged:
                                 for tagged_user in tagged:
@@ -343,8 +344,11 @@ class GithubImporter(PluginImporter):
                     pass
 
                 # Add everybody involved as a participant in every conversation
-                for convo in conversations:
-                    self.add_participants(convo, participants)
+                for convo_origin_id in conversations:
+                    self.queue_participants(channel, convo_origin_id, participants)
+
+            # Write this page of issues and comments in bulk
+            self.flush_conversations()
 
 
         # If there are more pages of issues, continue on to the next apge
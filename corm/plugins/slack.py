@@ -1,4 +1,4 @@
-from corm.plugins import BasePlugin, PluginImporter
+from corm.plugins import BasePlugin, PluginImporter, get_rate_limiter
 import datetime
 import re
 import json
@@ -23,6 +23,15 @@ USER_PROFILE_URL = 'https://slack.com/api/users.info?user=%(user)s'
 USERS_LIST = 'https://slack.com/api/users.list?cursor=%(cursor)s'
 TEAM_INFO = 'https://slack.com/api/team.info?team=%(team_id)s'
 
+# Requests per minute allowed for each Web API method, from Slack's rate limit tiers
+SLACK_METHOD_TIERS = {
+    'conversations.history': 50,
+    'conversations.replies': 50,
+    'users.info': 100,
+    'users.list': 20,
+    'team.info': 20,
+}
+
 def authenticate(request):
     community = get_object_or_404(Community, id=request.session.get('community'))
     client_id = settings.SLACK_CLIENT_ID
@@ -235,6 +244,7 @@ class SlackImporter(PluginImporter):
         self._users = dict()
         self._has_prefetched = False
         self._update_threads = dict()
+        self._thread_participants = dict()
         self.tag_matcher = re.compile(r'\<\@([^>]+)\>')
         support, created = ContributionType.objects.get_or_create(
             community=source.community,
@@ -250,6 +260,12 @@ class SlackImporter(PluginImporter):
     def api_call(self, path):
         return self.api_request(path, headers=self.API_HEADERS)
 
+    def get_rate_limiter(self, url):
+        # Slack doesn't send remaining counts, limits are fixed per method and workspace
+        method = urlparse(url).path.split('/')[-1]
+        per_minute = SLACK_METHOD_TIERS.get(method, 20)
+        return get_rate_limiter('%s:%s' % (self.rate_limit_key, method), rate=per_minute / 60.0, capacity=per_minute)
+
     def update_source(self):
         # Update workspace domain
         try:
@@ -281,6 +297,16 @@ class SlackImporter(PluginImporter):
             print("Failed to update Slack channel names data")
             print(e)
 
+    def pre_import(self, new_only=False, channels=None):
+        self.prefetch_users()
+
+    def get_worker(self):
+        # Share the workspace user list with every channel worker instead of fetching it again
+        worker = super().get_worker()
+        worker._users = self._users
+        worker._has_prefetched = True
+        return worker
+
     def prefetch_users(self):
         if self._has_prefetched:
             return
@@ -341,6 +367,7 @@ class SlackImporter(PluginImporter):
         self.prefetch_users()
 
         self._update_threads = dict()
+        self._thread_participants = dict()
         from_timestamp = from_date.timestamp()
         cursor = ''
         has_more = True
@@ -365,6 +392,7 @@ class SlackImporter(PluginImporter):
                                     print("Error importing message %s: %s" % (message.get('ts'), str(e)))
                                 else:
                                     raise RuntimeError("Error importing message %s: %s" % (message.get('ts'), str(e)))
+                    self.flush_conversations()
                 else:
                     print("Data Error: %s" % resp.content)
                     raise RuntimeError("Slack error: %s" % data.get('error', "Unknown Error"))
@@ -415,6 +443,11 @@ class SlackImporter(PluginImporter):
                     print(e)
         return
 
+    def get_thread_participants(self, channel, thread_id):
+        if thread_id not in self._thread_participants:
+            self._thread_participants[thread_id] = set(Member.objects.filter(participant_in__conversation__channel=channel, participant_in__conversation__origin_id=thread_id))
+        return self._thread_participants[thread_id]
+
     def import_thread(self, channel, thread_ts, from_timestamp):
         if self.verbosity >= 3:
             print("Importing thread: %s" % thread_ts)
@@ -437,6 +470,7 @@ class SlackImporter(PluginImporter):
                                 self.import_message(channel, message)
                             except Exception as e:
                                 raise RuntimeError("Error importing message %s: %s" % (message.get('ts'), str(e)))
+                    self.flush_conversations()
                 else:
                     print("Data Error: %s" % data)
                     raise RuntimeError("Slack error: %s" % data.get('error', "Unknown Error"))
@@ -480,10 +514,11 @@ class SlackImporter(PluginImporter):
             slack_thread_id = "%s/archives/%s/p%s" % (server, channel.origin_id, message.get('thread_ts').replace(".", ""))
             slack_thread_link = slack_thread_id + "?thread_ts=%s&cid=%s" % (message.get('thread_ts'), channel.origin_id)
             thread_tstamp = datetime.datetime.fromtimestamp(float(message.get('thread_ts')))
-            thread = self.make_conversation(origin_id=slack_thread_id, channel=channel, speaker=None, tstamp=thread_tstamp, location=slack_thread_link)
-            thread_participants = set(thread.participants.all())
+            self.queue_conversation(origin_id=slack_thread_id, channel=channel, speaker=None, tstamp=thread_tstamp, location=slack_thread_link)
+            thread = slack_thread_id
+            thread_participants = self.get_thread_participants(channel, slack_thread_id)
             thread_participants.add(speaker)
-            self._update_threads[thread.id] = message.get('thread_ts')
+            self._update_threads[slack_thread_id] = message.get('thread_ts')
 
         convo_text = message.get('text')
         tagged = set(self.tag_matcher.findall(message.get('text')))
@@ -492,11 +527,11 @@ class SlackImporter(PluginImporter):
             if tagged_user:
                 convo_text = convo_text.replace("<@%s>"%tagged_user_id, "@%s"%tagged_user.get('real_name'))
 
-        convo = self.make_conversation(origin_id=slack_convo_id, channel=channel, speaker=speaker, content=convo_text, tstamp=tstamp, location=slack_convo_link, thread=thread)
+        self.queue_conversation(origin_id=slack_convo_id, channel=channel, speaker=speaker, content=convo_text, tstamp=tstamp, location=slack_convo_link, thread=thread)
         convo_participants = set()
         convo_participants.add(speaker)
-        if convo.id in self._update_threads:
-            del self._update_threads[convo.id]
+        if slack_convo_id in self._update_threads:
+            del self._update_threads[slack_convo_id]
 
         for tagged_user in tagged:
             #if not slack._users.get(tagged_user):
@@ -515,8 +550,7 @@ class SlackImporter(PluginImporter):
 
         # Connect this conversation's speaker to everyone else in this thread
         if thread is not None:
-            self.add_participants(thread, thread_participants)
-            if thread.participants.count() > 0:
-                convo_participants.update(list(thread.participants.all()))
+            self.queue_participants(channel, thread, thread_participants)
+            convo_participants.update(thread_participants)
 
-        self.add_participants(convo, convo_participants)
+        self.queue_participants(channel, slack_convo_id, convo_participants)
@@ -1,9 +1,8 @@
 import datetime
 import re
-from time import sleep
 
 from corm.models import *
-from corm.plugins import BasePlugin, PluginImporter
+from corm.plugins import BasePlugin, PluginImporter, get_rate_limiter
 from frontendv2.views import SavannahView
 
 from urllib.parse import urlparse, parse_qs, urlencode
@@ -248,6 +247,10 @@ class StackExchangeImporter(PluginImporter):
     def strptime(self, dtimestamp):
         return datetime.datetime.fromtimestamp(dtimestamp)
 
+    def get_rate_limiter(self, url):
+        # StackExchange allows up to 30 requests per second
+        return get_rate_limiter(self.rate_limit_key, rate=25, capacity=25)
+
     def api_call(self, path):
         full_path = API_BASE_PATH + path
         auth_params = {
@@ -256,7 +259,16 @@ class StackExchangeImporter(PluginImporter):
             'access_token': self.source.auth_secret,
         }
         full_path += '&'+urlencode(auth_params)
-        return self.api_request(full_path, headers=[])
+        resp = self.api_request(full_path, headers=[])
+        try:
+            data = resp.json()
+        except ValueError:
+            return resp, None
+        # StackExchange asks for a pause in the response body instead of a header
+        backoff = data.get('backoff')
+        if backoff:
+            self.get_rate_limiter(full_path).pause(float(backoff))
+        return resp, data
 
     def import_channel(self, channel, from_date, full_import=False):
         source = channel.source
@@ -265,17 +277,12 @@ class StackExchangeImporter(PluginImporter):
         questions = set()
         questions_page = 1
         while questions_page:
-            # Pause between pages when doing a full import
-            if full_import and questions_page > 1:
-                sleep(5)
-
-            question_resp = self.api_call(SITE_QUESTIONS_URL % {
+            question_resp, question_data = self.api_call(SITE_QUESTIONS_URL % {
                 'tag': channel.origin_id,
                 'page': questions_page,
                 'from_date': self.strftime(from_date),
             })
             if question_resp.status_code == 200:
-                question_data = question_resp.json()
                 for question in question_data.get('items'):
                     #print(question)
                     tstamp = self.strptime(question.get('creation_date'))
@@ -310,17 +317,12 @@ class StackExchangeImporter(PluginImporter):
         for question_convo in questions:
             answers_page = 1
             while answers_page:
-                # Pause between pages when doing a full import
-                if full_import and answers_page > 1:
-                    sleep(5)
-
-                answer_resp = self.api_call(SITE_ANSWERS_URL % {
+                answer_resp, answer_data = self.api_call(SITE_ANSWERS_URL % {
                     'question_id': question_convo.origin_id,
                     'page': answers_page,
                     'from_date': self.strftime(from_date),
                 })
                 if answer_resp.status_code == 200:
-                    answer_data = answer_resp.json()
                     for answer in answer_data.get('items'):
                         #print(answer)
                         tstamp = self.strptime(answer.get('creation_date'))
@@ -369,17 +371,12 @@ class StackExchangeImporter(PluginImporter):
         for post in posts:
             posts_page = 1
             while posts_page:
-                # Pause between pages when doing a full import
-                if full_import and posts_page > 1:
-                    sleep(5)
-
-                comments_resp = self.api_call(SITE_COMMENTS_URL % {
+                comments_resp, comments_data = self.api_call(SITE_COMMENTS_URL % {
                     'question_id': post.origin_id,
                     'page': posts_page,
                     'from_date': self.strftime(from_date),
                 })
                 if comments_resp.status_code == 200:
-                    comments_data = comments_resp.json()
                     for comment in comments_data.get('items'):
                         #print(comment)
                         tstamp = self.strptime(comment.get('creation_date'))
@@ -0,0 +1,109 @@
+import json
+import re
+import threading
+import urllib.parse
+from collections import deque
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+SCRUBBED = 'SCRUBBED'
+# Query parameters that carry credentials
+SECRET_PARAMS = re.compile(r'(?i)(token|secret|key|password|auth|signature|sig)')
+# Timestamps in query parameters change with every run, so they're left out when matching requests
+TIMESTAMP_VALUE = re.compile(r'^(\d{4}-\d{2}-\d{2}([T ][0-9:.]+)?Z?|\d{10}(\.\d+)?)$')
+# Response headers worth keeping, the rest can identify the account or session
+KEEP_HEADERS = re.compile(r'(?i)^(content-type|link|retry-after|x-ratelimit-.*|ratelimit-.*|x-rate-limit-.*)$')
+
+class CassetteMissing(Exception):
+    pass
+
+class Cassette:
+    """
+    Recorded API responses for one import, so an importer can be run again offline. Responses are stored in the
+    order they were requested and replayed in the same order for each request, with credentials scrubbed out
+    of the urls and bodies. The cassette also stores a description of the source and channels it came from.
+    """
+    def __init__(self, path, secrets=None, replaying=False):
+        self.path = path
+        self.secrets = [secret for secret in (secrets or []) if secret]
+        self.replaying = replaying
+        self.source = None
+        self.requests = list()
+        self.calls = 0
+        self._responses = dict()
+        self._lock = threading.Lock()
+        if replaying:
+            self.load()
+
+    def scrub(self, text):
+        for secret in self.secrets:
+            text = text.replace(secret, SCRUBBED)
+        return text
+
+    def request_key(self, url, params=None):
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if params:
+            query += list(params.items())
+        key_query = list()
+        for name, value in query:
+            value = str(value)
+            if SECRET_PARAMS.search(name):
+                value = SCRUBBED
+            elif TIMESTAMP_VALUE.match(value):
+                continue
+            key_query.append((name, value))
+        return self.scrub(urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, urllib.parse.urlencode(sorted(key_query)), '')))
+
+    def record(self, url, params, resp):
+        with self._lock:
+            self.calls += 1
+            self.requests.append({
+                'request': self.request_key(url, params),
+                'status': resp.status_code,
+                'headers': dict([(name, value) for name, value in resp.headers.items() if KEEP_HEADERS.match(name)]),
+                'body': self.scrub(resp.content.decode('utf-8', errors='replace')),
+            })
+
+    def replay(self, url, params=None):
+        key = self.request_key(url, params)
+        with self._lock:
+            self.calls += 1
+            responses = self._responses.get(key)
+            if not responses:
+                raise CassetteMissing("No recorded response for %s" % key)
+            recorded = responses[0]
+            if len(responses) > 1:
+                # Repeated requests get the later responses in turn, the last one is kept for any extra requests
+                responses.popleft()
+        resp = Response()
+        resp.status_code = recorded['status']
+        resp.headers = CaseInsensitiveDict(recorded['headers'])
+        resp._content = recorded['body'].encode('utf-8')
+        resp.encoding = 'utf-8'
+        resp.url = url
+        return resp
+
+    def load(self):
+        with open(self.path) as cassette_file:
+            data = json.load(cassette_file)
+        self.source = data.get('source')
+        self.requests = data.get('requests', [])
+        self._responses = dict()
+        for recorded in self.requests:
+            self._responses.setdefault(recorded['request'], deque()).append(recorded)
+
+    def save(self, source):
+        self.source = {
+            'connector': source.connector,
+            'name': source.name,
+            'server': source.server,
+            'auth_id': source.auth_id,
+            'channels': [{'name': channel.name, 'origin_id': channel.origin_id} for channel in source.channel_set.filter(enabled=True, origin_id__isnull=False)],
+        }
+        with open(self.path, 'w') as cassette_file:
+            json.dump({'source': self.source, 'requests': self.requests}, cassette_file, indent=1)
+
+    @classmethod
+    def for_source(cls, path, source, replaying=False):
+        return cls(path, secrets=[source.auth_secret, source.api_key], replaying=replaying)
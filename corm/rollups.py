@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import math
+import struct
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from django.conf import settings
+from corm.models import Member, Conversation, Contribution, Activity, ActivityRollup, RollupProgress
+
+# Days of history kept, enough for a year of monthly charts starting on the first of the month
+ROLLUP_HISTORY_DAYS = getattr(settings, 'ROLLUP_HISTORY_DAYS', 400)
+# How far behind the end of a chart the rollups can be before charts go back to counting activity directly
+ROLLUP_MAX_LAG_HOURS = getattr(settings, 'ROLLUP_MAX_LAG_HOURS', 2)
+
+class MemberSketch:
+    """
+    HyperLogLog estimate of how many distinct members were active. Sketches for single days can be
+    merged to count distinct members over a month without going back to the activity tables.
+    """
+    PRECISION = 10
+    REGISTERS = 1 << PRECISION
+
+    def __init__(self, data=None):
+        self.registers = bytearray(self.REGISTERS)
+        if data:
+            data = bytes(data)
+            if len(data) == self.REGISTERS:
+                self.registers[:] = data
+            else:
+                # Sparse encoding, (register, rank) pairs
+                for i in range(0, len(data), 3):
+                    register, rank = struct.unpack('>HB', data[i:i+3])
+                    self.registers[register] = rank
+
+    def add(self, member_id):
+        hashed = int.from_bytes(hashlib.blake2b(str(member_id).encode('utf-8'), digest_size=8).digest(), 'big')
+        register = hashed >> (64 - self.PRECISION)
+        remainder = hashed & ((1 << (64 - self.PRECISION)) - 1)
+        rank = (64 - self.PRECISION) - remainder.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def count(self):
+        zeros = self.registers.count(0)
+        if zeros == self.REGISTERS:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / self.REGISTERS)
+        estimate = alpha * self.REGISTERS * self.REGISTERS / sum(2.0 ** -rank for rank in self.registers)
+        if estimate <= 2.5 * self.REGISTERS and zeros > 0:
+            estimate = self.REGISTERS * math.log(self.REGISTERS / zeros)
+        return int(round(estimate))
+
+    def as_bytes(self):
+        used = [(i, rank) for i, rank in enumerate(self.registers) if rank > 0]
+        if len(used) * 3 < self.REGISTERS:
+            return b''.join([struct.pack('>HB', i, rank) for i, rank in used])
+        return bytes(self.registers)
+
+
+def update_rollups(community, start, end):
+    """
+    Recount every day from start to end (inclusive dates) for a community
+    """
+    day_start = datetime.datetime.combine(start, datetime.time.min)
+    day_end = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min)
+    rollups = dict()
+
+    def rollup(day, channel_id, source_id, tag_id, role):
+        key = (day, channel_id, tag_id, role)
+        if key not in rollups:
+            rollups[key] = ActivityRollup(community=community, day=day, channel_id=channel_id, source_id=source_id, tag_id=tag_id, role=role)
+            rollups[key].member_sketch = MemberSketch()
+            rollups[key].speaker_sketch = MemberSketch()
+        return rollups[key]
+
+    def rollups_for(timestamp, channel_id, source_id, tag_ids, role):
+        # Every item counts towards its own channel and the community as a whole, both untagged and per tag
+        day = timestamp.date()
+        for tag_id in [None] + list(tag_ids):
+            if channel_id is not None:
+                yield rollup(day, channel_id, source_id, tag_id, role)
+            yield rollup(day, None, None, tag_id, role)
+
+    conversations = Conversation.objects.filter(channel__source__community=community, timestamp__gte=day_start, timestamp__lt=day_end)
+    conversation_tags = tags_by_id(Conversation.tags.through.objects.filter(conversation__in=conversations).values_list('conversation_id', 'tag_id'))
+    for convo_id, timestamp, channel_id, source_id, speaker_id, role in conversations.values_list('id', 'timestamp', 'channel_id', 'channel__source_id', 'speaker_id', 'speaker__role').iterator():
+        for r in rollups_for(timestamp, channel_id, source_id, conversation_tags.get(convo_id, []), role):
+            r.conversation_count += 1
+            if speaker_id is not None:
+                r.speaker_sketch.add(speaker_id)
+
+    contributions = Contribution.objects.filter(community=community, timestamp__gte=day_start, timestamp__lt=day_end)
+    contribution_tags = tags_by_id(Contribution.tags.through.objects.filter(contribution__in=contributions).values_list('contribution_id', 'tag_id'))
+    for contrib_id, timestamp, channel_id, source_id, role in contributions.values_list('id', 'timestamp', 'channel_id', 'channel__source_id', 'author__role').iterator():
+        for r in rollups_for(timestamp, channel_id, source_id, contribution_tags.get(contrib_id, []), role):
+            r.contribution_count += 1
+
+    activities = Activity.objects.filter(channel__source__community=community, timestamp__gte=day_start, timestamp__lt=day_end)
+    activity_tags = tags_by_id(Activity.tags.through.objects.filter(activity__in=activities).values_list('activity_id', 'tag_id'))
+    for activity_id, timestamp, channel_id, source_id, member_id, role in activities.values_list('id', 'timestamp', 'channel_id', 'channel__source_id', 'member_id', 'member__role').iterator():
+        for r in rollups_for(timestamp, channel_id, source_id, activity_tags.get(activity_id, []), role):
+            r.activity_count += 1
+            if member_id is not None:
+                r.member_sketch.add(member_id)
+
+    for r in rollups.values():
+        r.active_members = r.member_sketch.as_bytes()
+        r.speakers = r.speaker_sketch.as_bytes()
+
+    with transaction.atomic():
+        ActivityRollup.objects.filter(community=community, day__gte=start, day__lte=end).delete()
+        ActivityRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+    return len(rollups)
+
+def tags_by_id(pairs):
+    tags = dict()
+    for item_id, tag_id in pairs.iterator():
+        tags.setdefault(item_id, []).append(tag_id)
+    return tags
+
+
+def has_rollups(community, start, end=None):
+    """
+    Whether charts from start to end (now by default) can be drawn from the rollups, which have to go back far
+    enough and have been updated recently enough to cover the end of the range
+    """
+    if isinstance(start, datetime.datetime):
+        start = start.date()
+    if start < datetime.datetime.utcnow().date() - datetime.timedelta(days=ROLLUP_HISTORY_DAYS):
+        return False
+    updated = RollupProgress.objects.filter(community=community).values_list('updated', flat=True).first()
+    if updated is None:
+        return False
+    now = timezone.now()
+    if end is None:
+        end = now
+    elif not isinstance(end, datetime.datetime):
+        end = datetime.datetime.combine(end, datetime.time.max)
+    if settings.USE_TZ and timezone.is_naive(end):
+        end = timezone.make_aware(end, timezone.utc)
+    return updated >= min(end, now) - datetime.timedelta(hours=ROLLUP_MAX_LAG_HOURS)
+
+def get_rollups(community, start, end, source=None, exclude_source=False, tag=None, role=None):
+    rollups = ActivityRollup.objects.filter(community=community, day__gte=start, day__lte=end)
+    if source:
+        if exclude_source:
+            rollups = rollups.filter(channel__isnull=False).exclude(source=source)
+        else:
+            rollups = rollups.filter(source=source)
+    else:
+        rollups = rollups.filter(channel__isnull=True)
+
+    if tag:
+        rollups = rollups.filter(tag=tag)
+    else:
+        rollups = rollups.filter(tag__isnull=True)
+
+    if role:
+        if role == Member.BOT:
+            rollups = rollups.exclude(role=role)
+        else:
+            rollups = rollups.filter(role=role)
+    return rollups
+
+def count_by_span(rollups, field, span):
+    counts = rollups.annotate(span=Trunc('day', span)).values('span').annotate(total=Sum(field)).order_by('span')
+    return [(c['span'], c['total']) for c in counts if c['total']]
+
+def distinct_by_span(rollups, field, span):
+    sketches = dict()
+    for day, data in rollups.values_list('day', field).iterator():
+        if not data:
+            continue
+        if span == 'month':
+            day = day.replace(day=1)
+        if day not in sketches:
+            sketches[day] = MemberSketch()
+        sketches[day].merge(MemberSketch(data))
+    return [(day, sketch.count()) for day, sketch in sorted(sketches.items())]
@@ -0,0 +1,134 @@
+import logging
+import re
+from django.db import connection, transaction, DatabaseError, OperationalError
+from django.db.models import Q, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from corm.models import Contact, Note
+
+# Conversation content is indexed by the database itself, SQLite keeps an FTS5 table in sync with triggers and
+# PostgreSQL uses an expression index, so everything that writes conversations (importers, bulk_create, edits)
+# updates the index without going through Django. Migrations that rebuild corm_conversation on SQLite drop the
+# triggers, so the index is recreated after every migrate.
+SEARCH_INDEX = 'corm_conversation_search'
+POSTGRES_VECTOR = "to_tsvector('simple', coalesce(%s, ''))"
+POSTGRES_TRIGRAM_COLUMNS = [
+    ('corm_member', 'name'),
+    ('corm_member', 'email_address'),
+    ('corm_company', 'name'),
+    ('corm_contact', 'detail'),
+    ('corm_contact', 'email_address'),
+    ('corm_note', 'content'),
+]
+
+logger = logging.getLogger(__name__)
+
+def create_search_index(conn=connection):
+    global _has_index
+    _has_index = None
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(content, content='corm_conversation', content_rowid='id')" % SEARCH_INDEX)
+            except OperationalError as e:
+                logger.warning("SQLite was built without FTS5, conversation search will not be indexed: %s", e)
+                return
+            cursor.execute("CREATE TRIGGER IF NOT EXISTS %s_insert AFTER INSERT ON corm_conversation BEGIN INSERT INTO %s(rowid, content) VALUES (new.id, new.content); END" % (SEARCH_INDEX, SEARCH_INDEX))
+            cursor.execute("CREATE TRIGGER IF NOT EXISTS %s_delete AFTER DELETE ON corm_conversation BEGIN INSERT INTO %s(%s, rowid, content) VALUES ('delete', old.id, old.content); END" % (SEARCH_INDEX, SEARCH_INDEX, SEARCH_INDEX))
+            cursor.execute("CREATE TRIGGER IF NOT EXISTS %s_update AFTER UPDATE OF content ON corm_conversation BEGIN INSERT INTO %s(%s, rowid, content) VALUES ('delete', old.id, old.content); INSERT INTO %s(rowid, content) VALUES (new.id, new.content); END" % (SEARCH_INDEX, SEARCH_INDEX, SEARCH_INDEX, SEARCH_INDEX))
+            cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (SEARCH_INDEX, SEARCH_INDEX))
+
+        elif conn.vendor == 'postgresql':
+            cursor.execute("CREATE INDEX IF NOT EXISTS %s ON corm_conversation USING gin ((%s))" % (SEARCH_INDEX, POSTGRES_VECTOR % 'content'))
+            # Trigram indexes let the icontains lookups used by member search skip the table scan
+            try:
+                with transaction.atomic(using=conn.alias):
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            except DatabaseError as e:
+                logger.warning("Unable to enable pg_trgm, member search will not be indexed: %s", e)
+                return
+            for table, column in POSTGRES_TRIGRAM_COLUMNS:
+                cursor.execute("CREATE INDEX IF NOT EXISTS %s_%s_trgm ON %s USING gin ((upper(%s::text)) gin_trgm_ops)" % (table, column, table, column))
+
+def drop_search_index(conn=connection):
+    global _has_index
+    _has_index = None
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                cursor.execute("DROP TRIGGER IF EXISTS %s_%s" % (SEARCH_INDEX, trigger))
+            cursor.execute("DROP TABLE IF EXISTS %s" % SEARCH_INDEX)
+        elif conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS %s" % SEARCH_INDEX)
+            for table, column in POSTGRES_TRIGRAM_COLUMNS:
+                cursor.execute("DROP INDEX IF EXISTS %s_%s_trgm" % (table, column))
+
+def restore_search_index(sender, using, **kwargs):
+    """
+    post_migrate receiver, puts back anything a migration dropped. Creating the index is a no-op when it's all there.
+    """
+    from django.db import connections
+    try:
+        create_search_index(connections[using])
+    except DatabaseError as e:
+        logger.warning("Unable to create the search index, run rebuild_search_index once the database is migrated: %s", e)
+
+_has_index = None
+def has_search_index():
+    global _has_index
+    if _has_index is None:
+        if connection.vendor == 'sqlite':
+            _has_index = SEARCH_INDEX in connection.introspection.table_names()
+        else:
+            _has_index = connection.vendor == 'postgresql'
+    return _has_index
+
+def search_terms(search):
+    return re.findall(r'[^\W_]+', search.lower())
+
+def conversation_matches(search):
+    """
+    Subquery for the ids of conversations containing every search term (or a word starting with it)
+    """
+    terms = search_terms(search)
+    if not terms or not has_search_index():
+        return None
+    if connection.vendor == 'sqlite':
+        query = " ".join(['"%s"*' % term for term in terms])
+        return RawSQL("SELECT rowid FROM %s WHERE %s MATCH %%s" % (SEARCH_INDEX, SEARCH_INDEX), [query])
+    else:
+        query = " & ".join(['%s:*' % term for term in terms])
+        return RawSQL("SELECT id FROM corm_conversation WHERE %s @@ to_tsquery('simple', %%s)" % (POSTGRES_VECTOR % 'content'), [query])
+
+def search_conversations(search, prefix=''):
+    """
+    Filter for conversations, or anything related to conversations through prefix, matching the search
+    """
+    matches = conversation_matches(search)
+    if matches is None:
+        return Q(**{prefix + 'content__icontains': search})
+    return Q(**{prefix + 'id__in': matches})
+
+def rank_conversations(conversations, search):
+    """
+    Annotate conversations with search_rank, higher is a better match
+    """
+    terms = search_terms(search)
+    if not terms or not has_search_index():
+        return conversations.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connection.vendor == 'sqlite':
+        query = " ".join(['"%s"*' % term for term in terms])
+        rank = RawSQL("SELECT -rank FROM %s WHERE %s MATCH %%s AND rowid = corm_conversation.id" % (SEARCH_INDEX, SEARCH_INDEX), [query], output_field=FloatField())
+    else:
+        query = " & ".join(['%s:*' % term for term in terms])
+        rank = RawSQL("ts_rank(%s, to_tsquery('simple', %%s))" % (POSTGRES_VECTOR % 'corm_conversation.content'), [query], output_field=FloatField())
+    return conversations.annotate(search_rank=rank)
+
+def search_members(search):
+    """
+    Filter for members matching the search by name, company, email, contact or note. Related tables are
+    searched in subqueries so a member with many matching contacts or notes is only returned once.
+    """
+    return Q(name__icontains=search) | Q(company__name__icontains=search) | Q(email_address__icontains=search) | \
+        Q(id__in=Contact.objects.filter(Q(detail__icontains=search) | Q(email_address__icontains=search)).values('member_id')) | \
+        Q(id__in=Note.objects.filter(content__icontains=search).values('member_id'))
@@ -0,0 +1,77 @@
+PUNCTUATION = "!\"&'()*+,.:;<=>?@[\]^_`{|}~/\r\n"
+# Punctuation is a word break, so "foo bar" matches "foo,bar" like it always has
+PUNCTUATION_TABLE = str.maketrans(PUNCTUATION, ' '*len(PUNCTUATION))
+
+def keyword_words(text):
+    return text.lower().translate(PUNCTUATION_TABLE).split()
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over words, finds every tag whose keywords appear in a text in a single pass
+    """
+    def __init__(self):
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [set()]
+
+    @classmethod
+    def for_community(cls, community, tags=None):
+        if tags is None:
+            tags = community.tag_set.filter(keywords__isnull=False)
+        matcher = cls()
+        for tag in tags:
+            if not tag.keywords:
+                continue
+            for keyword in tag.keywords.split(","):
+                matcher.add(keyword.lower().split(), tag.id)
+        matcher.build()
+        return matcher
+
+    def __len__(self):
+        return len(self.goto) - 1
+
+    def add(self, words, value):
+        if not words:
+            return
+        state = 0
+        for word in words:
+            if word not in self.goto[state]:
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][word] = len(self.goto) - 1
+            state = self.goto[state][word]
+        self.output[state].add(value)
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(word, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def match(self, text):
+        found = set()
+        if not text:
+            return found
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for word in keyword_words(text):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+def add_tags(model, pairs, batch_size=1000):
+    """
+    Bulk insert (object id, tag id) pairs into a TaggableModel's tags table, skipping ones already tagged
+    """
+    through = model.tags.through
+    source_field = model._meta.model_name + '_id'
+    through.objects.bulk_create([through(**{source_field: obj_id, 'tag_id': tag_id}) for obj_id, tag_id in pairs], batch_size=batch_size, ignore_conflicts=True)
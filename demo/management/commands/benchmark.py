@@ -0,0 +1,130 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management import call_command
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import time
+import django
+from django.contrib.auth.models import User
+
+from corm.models import *
+from frontendv2 import profiling
+
+# Everything production runs on a schedule, so the views are timed on the same tables and indexes they'd use there
+BATCH_COMMANDS = ('level_check', 'make_connections', 'tag_conversations', 'tag_contributions', 'make_suggestions', 'make_reports', 'gift_impact', 'update_rollups', 'rebuild_search_index')
+# Commands that don't take a community
+GLOBAL_COMMANDS = ('rebuild_search_index',)
+VIEWS = ('dashboard', 'overview', 'members', 'all_members', 'conversations', 'contributions', 'contributors', 'connections', 'connections_json')
+
+class Command(BaseCommand):
+    help = 'Time the batch commands and main views against generated demo communities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default="1000,10000,100000", type=str, help='Comma separated community sizes to generate')
+        parser.add_argument('--age', default=365, type=int)
+        parser.add_argument('--seed', default=42, type=int)
+        parser.add_argument('--output', type=str, help='File to write the JSON results to, instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated communities afterwards')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options.get('sizes').split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of numbers")
+        self.seed = options.get('seed')
+        self.age = options.get('age')
+        self.owner, created = User.objects.get_or_create(username='benchmark')
+
+        results = {
+            'started': datetime.datetime.utcnow().isoformat(),
+            'seed': self.seed,
+            'age': self.age,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'scales': [],
+        }
+        for size in sizes:
+            community = self.generate(size)
+            scale = {
+                'size': size,
+                'members': Member.objects.filter(community=community).count(),
+                'conversations': Conversation.objects.filter(channel__source__community=community).count(),
+                'generate_seconds': self.generate_seconds,
+                'commands': self.run_commands(community),
+                'views': self.render_views(community),
+            }
+            results['scales'].append(scale)
+            if not options.get('keep'):
+                community.delete()
+
+        output = json.dumps(results, indent=2)
+        if options.get('output'):
+            with open(options.get('output'), 'w') as outfile:
+                outfile.write(output)
+        else:
+            self.stdout.write(output)
+
+    def measure(self, name, func):
+        """
+        Run func with its queries counted and its output discarded, returning its result and profile
+        """
+        profile, stack = profiling.start(name)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = func()
+        finally:
+            profiling.stop(profile, stack)
+        return result, profile
+
+    def generate(self, size):
+        name = "Benchmark %s" % size
+        print("Generating %s..." % name)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('make_demo', name=name, owner_id=self.owner.id, size=size, age=self.age, seed=self.seed, data_only=True)
+        self.generate_seconds = time.perf_counter() - started
+        return Community.objects.get(name=name+" Demo")
+
+    def run_commands(self, community):
+        timings = dict()
+        month = datetime.datetime.utcnow().strftime('%Y-%m')
+        for command in BATCH_COMMANDS:
+            print("Running %s..." % command)
+            kwargs = dict()
+            if command not in GLOBAL_COMMANDS:
+                kwargs['community'] = community.id
+            if command == 'make_reports':
+                kwargs['date'] = month
+            result, profile = self.measure(command, lambda: call_command(command, **kwargs))
+            timings[command] = {'seconds': profile.wall_time, 'queries': profile.queries, 'query_seconds': profile.query_time}
+        return timings
+
+    def render_views(self, community):
+        timings = dict()
+        # Errors are recorded as the status instead of ending the run
+        client = Client(raise_request_exception=False)
+        client.force_login(self.owner)
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for view in VIEWS:
+                print("Rendering %s..." % view)
+                url = reverse(view, kwargs={'community_id': community.id})
+                # The first render fills the filter cache, the second shows what most page views cost
+                response, cold = self.measure(url, lambda: client.get(url))
+                response, warm = self.measure(url, lambda: client.get(url))
+                timings[view] = {
+                    'url': url,
+                    'status': response.status_code,
+                    'seconds': cold.wall_time,
+                    'queries': cold.queries,
+                    'query_seconds': cold.query_time,
+                    'warm_seconds': warm.wall_time,
+                    'warm_queries': warm.queries,
+                    'slowest': [[name, wall_time, queries] for name, (calls, queries, query_time, wall_time, max_wall_time) in cold.slowest()],
+                }
+        return timings
@@ -20,10 +20,12 @@ class Command(BaseCommand):
         parser.add_argument('--owner_id', type=int)
         parser.add_argument('--size', default=200, type=int)
         parser.add_argument('--age', default=365, type=int)
+        parser.add_argument('--seed', type=int, help='Seed the random generator to make the same community every time')
+        parser.add_argument('--data_only', action='store_true', help='Skip running the batch commands on the new community')
 
 
     def handle(self, *args, **options):
-        random.seed()
+        random.seed(options.get('seed'))
         self.community_id = options.get("community_id")
         self.community_name = options.get("name")
         try:
@@ -73,6 +75,9 @@ class Command(BaseCommand):
         self.make_gifts()
         self.make_tasks()
 
+        if options.get('data_only'):
+            return
+
         call_command('set_company_info', community=self.community.id)
         call_command('level_check', community=self.community.id)
         call_command('gift_impact', community=self.community.id)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
-from frontendv2.models import EmailRecord, ManagerInvite, PasswordResetRequest, PublicDashboard
+from frontendv2.models import EmailRecord, ManagerInvite, PasswordResetRequest, PublicDashboard, ProfileHotspot
 from django.contrib.sessions.models import Session
 from django.contrib.auth.models import User
 
@@ -58,4 +58,29 @@ class PublicDashboardAdmin(admin.ModelAdmin):
     def link(self, dashboard):
         return mark_safe("<a href=\"%s\" target=\"_blank\">Open</a>" % dashboard.get_absolute_url())
     link.short_description = "URL"
-admin.site.register(PublicDashboard, PublicDashboardAdmin)
\ No newline at end of file
+admin.site.register(PublicDashboard, PublicDashboardAdmin)
+
+class ProfileHotspotAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'calls', 'avg_ms', 'max_ms', 'avg_queries', 'query_share', 'total_seconds')
+    list_filter = ('kind',)
+    search_fields = ('name',)
+    readonly_fields = ('kind', 'name', 'calls', 'queries', 'query_time', 'wall_time', 'max_wall_time')
+    def avg_ms(self, hotspot):
+        return "%0.1f" % (hotspot.avg_wall_time * 1000)
+    avg_ms.short_description = "Avg ms"
+    def max_ms(self, hotspot):
+        return "%0.1f" % (hotspot.max_wall_time * 1000)
+    max_ms.short_description = "Max ms"
+    def avg_queries(self, hotspot):
+        return "%0.1f" % hotspot.avg_queries
+    def query_share(self, hotspot):
+        if not hotspot.wall_time:
+            return ""
+        return "%d%%" % (100 * hotspot.query_time / hotspot.wall_time)
+    query_share.short_description = "Time in DB"
+    def total_seconds(self, hotspot):
+        return "%0.1f" % hotspot.wall_time
+    total_seconds.admin_order_field = 'wall_time'
+    def has_add_permission(self, request):
+        return False
+admin.site.register(ProfileHotspot, ProfileHotspotAdmin)
\ No newline at end of file
@@ -4,6 +4,7 @@ from django.utils.deprecation import MiddlewareMixin
 from django.utils.safestring import SafeData, mark_safe
 
 from notifications.models import Notification
+from frontendv2 import profiling
 
 class ReadNotificationMiddleware(MiddlewareMixin):
     """
@@ -11,7 +12,34 @@ class ReadNotificationMiddleware(MiddlewareMixin):
     """
 
     def process_response(self, request, response):
-        if request.user.is_authenticated:
-            unread = Notification.objects.filter(unread=True, recipient=request.user, data__contains=request.path)
-            unread.update(unread=False)
+        # Most users have nothing unread, which the (recipient, unread) index answers without touching the targets
+        if request.user.is_authenticated and Notification.objects.filter(recipient=request.user, unread=True).exists():
+            Notification.objects.filter(unread=True, recipient=request.user, link_target__path=request.path).update(unread=False)
+        return response
+
+class ProfilingMiddleware:
+    """
+    Middleware that profiles a sample of requests, see frontendv2.profiling
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile():
+            return self.get_response(request)
+
+        profile, stack = profiling.start(request.path)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.stop(profile, stack)
+        if request.resolver_match is not None and request.resolver_match.view_name:
+            profile.name = request.resolver_match.view_name
+        response['Server-Timing'] = profile.server_timing()
+        profile.log()
+        if profiling.PROFILE_HOTSPOTS:
+            try:
+                profile.save_hotspots()
+            except Exception as e:
+                print("Failed to save profile hotspots: %s" % e)
         return response
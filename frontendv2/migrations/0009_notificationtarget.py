@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+def backfill_notification_targets(apps, schema_editor):
+    from urllib.parse import urlparse
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationTarget = apps.get_model('frontendv2', 'NotificationTarget')
+    targets = []
+    for notification in Notification.objects.filter(data__isnull=False).only('id', 'data').iterator():
+        if isinstance(notification.data, dict) and notification.data.get('link'):
+            targets.append(NotificationTarget(notification_id=notification.id, path=urlparse(notification.data['link']).path[:512]))
+    NotificationTarget.objects.bulk_create(targets, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_index_together_recipient_unread'),
+        ('frontendv2', '0008_auto_20220303_1620'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationTarget',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_index=True, max_length=512)),
+                ('notification', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='link_target', to='notifications.notification')),
+            ],
+        ),
+        migrations.RunPython(backfill_notification_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontendv2', '0009_notificationtarget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileHotspot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('request', 'Request'), ('property', 'Property')], max_length=16)),
+                ('name', models.CharField(max_length=256)),
+                ('calls', models.PositiveBigIntegerField(default=0)),
+                ('queries', models.PositiveBigIntegerField(default=0)),
+                ('query_time', models.FloatField(default=0, help_text='Total seconds spent in queries')),
+                ('wall_time', models.FloatField(default=0, help_text='Total seconds spent')),
+                ('max_wall_time', models.FloatField(default=0, help_text='Slowest single call in seconds')),
+            ],
+            options={
+                'ordering': ('-wall_time',),
+                'unique_together': {('kind', 'name')},
+            },
+        ),
+    ]
@@ -7,6 +7,10 @@ from django.template.loader import get_template, render_to_string
 from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404, reverse
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from urllib.parse import urlparse
+from notifications.models import Notification
 
 from corm.models import Community, Member, ManagerProfile, Tag, Company, Source, Channel
 from corm.email import EmailMessage, send_message, remaining_emails_allowed
@@ -212,3 +216,47 @@ class PublicDashboard(models.Model):
         context = view.context
         context['dashboard'] = self
         return context
+
+class NotificationTarget(models.Model):
+    " The page a notification links to, so it can be marked as read when that page is viewed"
+    notification = models.OneToOneField(Notification, related_name='link_target', on_delete=models.CASCADE)
+    path = models.CharField(max_length=512, db_index=True)
+
+    @classmethod
+    def normalize(cls, link):
+        return urlparse(link).path[:512]
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    if created and isinstance(instance.data, dict) and instance.data.get('link'):
+        NotificationTarget.objects.create(notification=instance, path=NotificationTarget.normalize(instance.data['link']))
+
+class ProfileHotspot(models.Model):
+    " Running totals for profiled requests and view properties"
+    REQUEST = 'request'
+    PROPERTY = 'property'
+    KINDS = {
+        REQUEST: "Request",
+        PROPERTY: "Property",
+    }
+    class Meta:
+        unique_together = [["kind", "name"]]
+        ordering = ("-wall_time",)
+    kind = models.CharField(max_length=16, choices=KINDS.items())
+    name = models.CharField(max_length=256)
+    calls = models.PositiveBigIntegerField(default=0)
+    queries = models.PositiveBigIntegerField(default=0)
+    query_time = models.FloatField(default=0, help_text="Total seconds spent in queries")
+    wall_time = models.FloatField(default=0, help_text="Total seconds spent")
+    max_wall_time = models.FloatField(default=0, help_text="Slowest single call in seconds")
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def avg_wall_time(self):
+        return self.wall_time / self.calls if self.calls else 0
+
+    @property
+    def avg_queries(self):
+        return self.queries / self.calls if self.calls else 0
@@ -0,0 +1,47 @@
+import datetime
+import threading
+from django.conf import settings
+from django.utils import timezone
+
+from corm.models import ManagerProfile
+
+# How stale a manager's last_seen is allowed to get, and how often seen managers are written out
+PRESENCE_MINUTES = getattr(settings, 'MANAGER_PRESENCE_MINUTES', 5)
+# Write out sooner once this many managers are waiting, so a killed worker loses at most a handful
+PRESENCE_BATCH = getattr(settings, 'MANAGER_PRESENCE_BATCH', 10)
+
+_pending = dict()
+_pending_lock = threading.Lock()
+_last_flush = timezone.now()
+
+def seen(profile, now=None):
+    """
+    Record that a manager is looking at their community. Nothing is written while the stored last_seen is
+    recent enough, otherwise the time is held in memory and written with everyone else's on the next flush.
+    Every call checks whether a flush is due, so pending times are written within PRESENCE_MINUTES of any request.
+    """
+    if now is None:
+        now = timezone.now()
+    interval = datetime.timedelta(minutes=PRESENCE_MINUTES)
+    with _pending_lock:
+        if profile.last_seen is None or profile.last_seen <= now - interval:
+            _pending[profile.id] = now
+        due = len(_pending) > 0 and (len(_pending) >= PRESENCE_BATCH or _last_flush <= now - interval)
+    if due:
+        flush()
+
+def flush():
+    """
+    Write every pending last_seen in one bulk update
+    """
+    global _pending, _last_flush
+    with _pending_lock:
+        pending = _pending
+        _pending = dict()
+        _last_flush = timezone.now()
+    if not pending:
+        return
+    try:
+        ManagerProfile.objects.bulk_update([ManagerProfile(id=profile_id, last_seen=last_seen) for profile_id, last_seen in pending.items()], ['last_seen'])
+    except Exception as e:
+        print("Failed to update manager last_seen: %s" % e)
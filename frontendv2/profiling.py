@@ -0,0 +1,120 @@
+import functools
+import random
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+# Fraction of requests to profile, 0 turns profiling off
+PROFILE_SAMPLE_RATE = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+# How many of the slowest view properties are logged for each profiled request
+PROFILE_SLOWEST = getattr(settings, 'PROFILE_SLOWEST', 5)
+# Whether to keep running totals in ProfileHotspot for the admin
+PROFILE_HOTSPOTS = getattr(settings, 'PROFILE_HOTSPOTS', False)
+
+_local = threading.local()
+
+class RequestProfile:
+    """
+    Query count, query time and wall time for one request, and for each profiled view property called while handling it
+    """
+    def __init__(self, path):
+        self.path = path
+        self.name = path
+        self.started = time.perf_counter()
+        self.wall_time = 0
+        self.queries = 0
+        self.query_time = 0
+        self.timings = dict()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+    def record(self, name, queries, query_time, wall_time):
+        if name in self.timings:
+            timing = self.timings[name]
+            timing[0] += 1
+            timing[1] += queries
+            timing[2] += query_time
+            timing[3] += wall_time
+            timing[4] = max(timing[4], wall_time)
+        else:
+            self.timings[name] = [1, queries, query_time, wall_time, wall_time]
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self.started
+
+    def slowest(self, count=PROFILE_SLOWEST):
+        return sorted(self.timings.items(), key=lambda item: item[1][3], reverse=True)[:count]
+
+    def log(self):
+        print("Profiled %s: %0.1fms, %s queries in %0.1fms" % (self.path, self.wall_time * 1000, self.queries, self.query_time * 1000))
+        for name, (calls, queries, query_time, wall_time, max_wall_time) in self.slowest():
+            print("    %s: %0.1fms, %s queries in %0.1fms (%s calls)" % (name, wall_time * 1000, queries, query_time * 1000, calls))
+
+    def server_timing(self):
+        return "total;dur=%0.1f, db;desc=\"%s queries\";dur=%0.1f" % (self.wall_time * 1000, self.queries, self.query_time * 1000)
+
+    def save_hotspots(self):
+        from frontendv2.models import ProfileHotspot
+        rows = [(ProfileHotspot.REQUEST, self.name, 1, self.queries, self.query_time, self.wall_time, self.wall_time)]
+        rows += [(ProfileHotspot.PROPERTY, name, calls, queries, query_time, wall_time, max_wall_time) for name, (calls, queries, query_time, wall_time, max_wall_time) in self.timings.items()]
+        for kind, name, calls, queries, query_time, wall_time, max_wall_time in rows:
+            updated = ProfileHotspot.objects.filter(kind=kind, name=name[:256]).update(
+                calls=F('calls') + calls,
+                queries=F('queries') + queries,
+                query_time=F('query_time') + query_time,
+                wall_time=F('wall_time') + wall_time,
+                max_wall_time=Greatest(F('max_wall_time'), max_wall_time),
+            )
+            if not updated:
+                ProfileHotspot.objects.create(kind=kind, name=name[:256], calls=calls, queries=queries, query_time=query_time, wall_time=wall_time, max_wall_time=max_wall_time)
+
+def current():
+    return getattr(_local, 'profile', None)
+
+def should_profile():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start(path):
+    """
+    Start profiling a request on this thread, the returned ExitStack counts queries on every database until it's closed
+    """
+    profile = RequestProfile(path)
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    _local.profile = profile
+    return profile, stack
+
+def stop(profile, stack):
+    stack.close()
+    profile.finish()
+    _local.profile = None
+
+def profiled(func):
+    """
+    Records the queries and time spent in a view property or method when the current request is being profiled
+    """
+    name = func.__qualname__
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current()
+        if profile is None:
+            return func(*args, **kwargs)
+        queries = profile.queries
+        query_time = profile.query_time
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.record(name, profile.queries - queries, profile.query_time - query_time, time.perf_counter() - started)
+    return wrapper
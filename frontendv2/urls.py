@@ -76,6 +76,7 @@ urlpatterns = [
     path('member/<int:community_id>/publish', Members.publish, name='publish_members'),
     path('public/member/<str:dashboard_id>/', Members.public, name='public_members'),
     path('conversations/<int:community_id>/', Conversations.as_view, name='conversations'),
+    path('conversations/<int:community_id>/conversations.csv', Conversations.as_csv, name='conversations_csv'),
     path('conversations/<int:community_id>/publish', Conversations.publish, name='publish_conversations'),
     path('conversations/<int:community_id>/link/<int:hyperlink_id>/ignore', ignore_hyperlink, name='ignore_hyperlink'),
     path('conversations/<int:community_id>/link/<int:hyperlink_id>/show', show_hyperlink, name='show_hyperlink'),
@@ -85,6 +86,7 @@ urlpatterns = [
     path('contributions/<int:community_id>/contributors/publish', Contributors.publish, name='publish_contributors'),
     path('public/contributors/<str:dashboard_id>/', Contributors.public, name='public_contributors'),
     path('contributions/<int:community_id>/contributors.csv', Contributors.as_csv, name='contributors_csv'),
+    path('contributions/<int:community_id>/contributions.csv', Contributions.as_csv, name='contributions_csv'),
     path('contributions/<int:community_id>/publish', Contributions.publish, name='publish_contributions'),
     path('public/contributions/<str:dashboard_id>/', Contributions.public, name='public_contributions'),
     path('connections/<int:community_id>/', Connections.as_view, name='connections'),
@@ -143,6 +145,7 @@ urlpatterns = [
     path('events/<int:community_id>/add', AddEvent.as_view, name='event_add'),
     path('events/<int:community_id>/tag', tag_event, name='event_tag_form'),
     path('event/<int:event_id>/', EventProfile.as_view, name='event'),
+    path('event/<int:event_id>/attendees.csv', EventProfile.as_csv, name='event_attendees_csv'),
     path('event/<int:event_id>/edit', EditEvent.as_view, name='event_edit'),
     path('event/<int:event_id>/add', AddAttendee.as_view, name='attendee_add'),
 ]
@@ -1,18 +1,25 @@
 import operator
 import datetime
+import csv
+import functools
+import hashlib
 import json
 from django.shortcuts import render, get_object_or_404, redirect, reverse
+from django.http import StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Max
+from django.db.models import Q, Count, Max, prefetch_related_objects
 from django.db.models.functions import Lower
 from django.contrib.auth import authenticate, login as login_user, logout as logout_user
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm, UsernameField, SetPasswordForm
 from django.contrib import messages
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from django import forms
 
 from corm.models import *
-from frontendv2 import colors
+from frontendv2 import colors, presence
+from frontendv2.profiling import profiled
 from frontendv2.models import EmailMessage, PasswordResetRequest, PublicDashboard
 
 # Create your views here.
@@ -157,6 +164,56 @@ def get_session_community(request):
             pass
     return None
 
+def filter_cached(func):
+    """
+    Caches the result of a SavannahFilterView property for everyone looking at the same community with
+    the same filters, until new data is imported for the community or FILTER_CACHE_SECONDS pass.
+    """
+    missing = object()
+    @profiled
+    @functools.wraps(func)
+    def wrapper(self):
+        key = self.filter_cache_key(func.__qualname__)
+        value = cache.get(key, missing)
+        if value is missing:
+            value = func(self)
+            cache.set(key, value, getattr(settings, 'FILTER_CACHE_SECONDS', 3600))
+        return value
+    return wrapper
+
+class Echo:
+    """
+    File-like object for csv.writer that hands each row back instead of buffering it
+    """
+    def write(self, value):
+        return value
+
+def in_batches(queryset, *prefetch):
+    """
+    Iterate over a large queryset with a server-side cursor, prefetching related objects one batch at a time
+    """
+    batch_size = getattr(settings, 'CSV_BATCH_SIZE', 1000)
+    batch = []
+    for obj in queryset.prefetch_related(None).iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            prefetch_related_objects(batch, *prefetch)
+            yield from batch
+            batch = []
+    if batch:
+        prefetch_related_objects(batch, *prefetch)
+        yield from batch
+
+def stream_csv(filename, fieldnames, rows):
+    writer = csv.DictWriter(Echo(), fieldnames=fieldnames)
+    def generate():
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
 class SavannahView:
     def __init__(self, request, community_id):
         request.session['community'] = community_id
@@ -168,7 +225,9 @@ class SavannahView:
         else:
             self.community = None
         if request.user.is_authenticated:
-            self.manager_profile, created = ManagerProfile.objects.update_or_create(user=request.user, community=self.community, defaults={'last_seen': datetime.datetime.utcnow()})
+            self.manager_profile, created = ManagerProfile.objects.get_or_create(user=request.user, community=self.community, defaults={'last_seen': timezone.now()})
+            if not created:
+                presence.seen(self.manager_profile)
             self.user_member = self.manager_profile.member
         else:
             self.manager_profile = None
@@ -381,6 +440,44 @@ class SavannahFilterView(SavannahView):
         else:
             self.timespan = (self.rangeend - self.rangestart).days + 1
 
+    @property
+    def data_version(self):
+        if not hasattr(self, '_data_version'):
+            self._data_version = Source.objects.filter(community=self.community).aggregate(last_import=Max('last_import'))['last_import']
+        return self._data_version
+
+    def filter_cache_key(self, name):
+        if self.timefilter == 'timespan':
+            # Timespans move with the clock, so results are shared for the rest of the hour
+            timerange = (self.timespan, self.rangeend.strftime('%Y-%m-%d %H'))
+        else:
+            timerange = (self.rangestart.isoformat(), self.rangeend.isoformat())
+        state = (
+            timerange,
+            self.tag and self.tag.id,
+            self.member_tag and self.member_tag.id,
+            self.member_company and self.member_company.id,
+            self.role,
+            self.contrib_type,
+            self.source and self.source.id,
+            self.exclude_source,
+            getattr(self, 'conversation_search', None),
+            getattr(getattr(self, 'filter_link', None), 'id', None),
+            self.data_version,
+        )
+        return 'filter:%s:%s:%s' % (self.community.id, name, hashlib.md5(repr(state).encode('utf-8')).hexdigest())
+
+    def cached_count(self, name, queryset, *extra):
+        """
+        Total row count for a paged list, shared the same way as filter_cached so paging doesn't count every time
+        """
+        key = self.filter_cache_key('%s:%s' % (name, hashlib.md5(repr(extra).encode('utf-8')).hexdigest()))
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, getattr(settings, 'FILTER_CACHE_SECONDS', 3600))
+        return count
+
     def filters_as_dict(self, request):
         filters = dict()
         for name, used in self.filter.items():
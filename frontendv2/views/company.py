@@ -11,6 +11,7 @@ from django import forms
 
 from corm.models import *
 from corm.connectors import ConnectionManager
+from corm.search import search_conversations, rank_conversations
 
 from frontendv2.views import SavannahView, SavannahFilterView
 from frontendv2.views.charts import PieChart, ChartColors
@@ -165,10 +166,14 @@ class CompanyProfile(SavannahView):
         conversations = Conversation.objects.filter(channel__source__community=self.community)
         conversations = conversations.filter(participation__member__company=self.company)
         if self.conversation_search:
-            conversations = conversations.filter(content__icontains=self.conversation_search)
+            conversations = conversations.filter(search_conversations(self.conversation_search))
 
         self.result_count = conversations.count()
-        conversations = conversations.select_related('channel', 'channel__source', 'speaker').prefetch_related('tags').order_by('-timestamp')
+        conversations = conversations.select_related('channel', 'channel__source', 'speaker').prefetch_related('tags')
+        if self.conversation_search:
+            conversations = rank_conversations(conversations, self.conversation_search).order_by('-search_rank', '-timestamp')
+        else:
+            conversations = conversations.order_by('-timestamp')
         start = (self.page-1) * self.RESULTS_PER_PAGE
         return conversations[start:start+self.RESULTS_PER_PAGE]
 
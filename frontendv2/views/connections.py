@@ -1,14 +1,18 @@
 import operator
 import datetime
+import json
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db.models import F, Q, Count, Max
 from django.utils.safestring import mark_safe
-from django.http import JsonResponse
+from django.db.models.functions import Trunc
+from django.http import JsonResponse, HttpResponse
 
 from corm.models import *
+from corm.connections import GRAPH_MAX_LINKS, get_graph_snapshot, graph_data, load_edges, trim_graph
 from frontendv2.views import SavannahFilterView
 from frontendv2.views.charts import PieChart
+from savannah.utils import safe_int
 
 class Connections(SavannahFilterView):
     def __init__(self, request, community_id, json=False):
@@ -44,14 +48,12 @@ class Connections(SavannahFilterView):
             counts['prev'] = connections.filter(first_connected__lt=self.rangestart).count()
 
             connections = connections.filter(first_connected__gte=self.rangestart, first_connected__lte=self.rangeend)
+            connections = connections.annotate(month=Trunc('first_connected', self.trunc_span)).values('month').annotate(connection_count=Count('id')).order_by('month')
             for c in connections:
-                month = self.trunc_date(c.first_connected)
+                month = self.trunc_date(c['month'])
                 if month not in months:
                     months.append(month)
-                if month not in counts:
-                    counts[month] = 1
-                else:
-                    counts[month] += 1
+                counts[month] = counts.get(month, 0) + c['connection_count']
             self._connectionsChart = (months, counts)
         return self._connectionsChart
         
@@ -103,18 +105,18 @@ class Connections(SavannahFilterView):
     @login_required
     def as_json(request, community_id):
         view = Connections(request, community_id, json=True)
-        nodes = list()
-        links = list()
-        member_map = dict()
-        connection_counts = dict()
-        connected = set()
-        missing_members = set()
-        # if view.timespan <= 31:
-        #     timespan = view.timespan
-        # else:
-        #     timespan = 30
+        max_links = safe_int(request.GET.get('links', GRAPH_MAX_LINKS))
+        if max_links < 1 or max_links > GRAPH_MAX_LINKS:
+            max_links = GRAPH_MAX_LINKS
+
+        if view.timefilter == 'timespan' and not (view.member_company or view.member_tag or view.role):
+            snapshot = get_graph_snapshot(view.community, view.timespan)
+            if snapshot is not None:
+                if max_links < GRAPH_MAX_LINKS:
+                    return JsonResponse(trim_graph(json.loads(snapshot.data), max_links))
+                return HttpResponse(snapshot.data, content_type='application/json')
+
         timespan = view.timespan
-        
         connections = MemberConnection.objects.filter(from_member__community=view.community, connection_count__gte=1, last_connected__gte=view.rangeend - datetime.timedelta(days=timespan), last_connected__lte=view.rangeend)
         if view.member_company:
             connections = connections.filter(Q(to_member__company=view.member_company)|Q(from_member__company=view.member_company))
@@ -125,51 +127,5 @@ class Connections(SavannahFilterView):
                 connections = connections.exclude(Q(to_member__role=view.role)|Q(from_member__role=view.role))
             else:
                 connections = connections.filter(Q(to_member__role=view.role)&Q(from_member__role=view.role))
-        connections = connections.select_related('from_member').prefetch_related('from_member__tags').order_by('-last_connected')
-
-        for connection in connections:
-            if connection.from_member_id != connection.to_member_id:
-                if connection.to_member_id > connection.from_member_id:
-                    connection_id = str(connection.to_member_id) + ":" + str(connection.from_member_id)
-                else:
-                    connection_id = str(connection.from_member_id) + ":" + str(connection.to_member_id)
-
-                links.append({"source":connection.from_member_id, "target":connection.to_member_id})
-                member_map[connection.from_member_id] = connection.from_member
-                if connection.from_member_id in missing_members:
-                    missing_members.remove(connection.from_member_id)
-                if connection.to_member_id not in member_map:
-                    missing_members.add(connection.to_member_id)
-
-                if not connection_id in connected:
-                    connected.add(connection_id)
-
-                    if connection.from_member_id not in connection_counts:
-                        connection_counts[connection.from_member_id] = 1
-                    else:
-                        connection_counts[connection.from_member_id] += 1
-
-                    if len(connected) >= 10000:
-                        break
-                    if len(member_map) >= 1000:
-                        break
-
-        for member in Member.objects.filter(id__in=missing_members):
-            member_map[member.id] = member
-
-        for member_id, member in member_map.items():
-            tag_color = None
-            tags = member.tags.all()
-            if len(tags) > 0:
-                tag_color = tags[0].color
-            if tag_color is None and member.role == Member.BOT:
-                tag_color = "aeaeae"
-            elif tag_color is None and member.role == Member.STAFF:
-                tag_color = "36b9cc"
-            if tag_color is None:
-                tag_color = "1f77b4"
-            
-            nodes.append({"id":member_id, "name":member.name, "color":tag_color, "connections":connection_counts.get(member_id, 0)})
-        
 
-        return JsonResponse({"nodes":nodes, "links":links})
+        return JsonResponse(graph_data(load_edges(connections), max_links=max_links))
@@ -1,7 +1,5 @@
 import operator
 import datetime
-import csv
-from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db.models import F, Q, Count, Max, Min
@@ -9,7 +7,8 @@ from django.db.models.functions import Lower
 from django.utils.safestring import mark_safe
 
 from corm.models import *
-from frontendv2.views import SavannahFilterView
+from corm.paging import Keyset
+from frontendv2.views import SavannahFilterView, filter_cached, in_batches, stream_csv
 from frontendv2.views.charts import PieChart
 from frontendv2.models import PublicDashboard
 
@@ -35,6 +34,8 @@ class Contributions(SavannahFilterView):
             self.page = int(request.GET.get('page', 1))
         except:
             self.page = 1
+        self.cursor = request.GET.get('after')
+        self.next_cursor = None
 
         if 'search' in request.GET:
             self.search = request.GET.get('search', "").lower()
@@ -45,8 +46,7 @@ class Contributions(SavannahFilterView):
     def suggestion_count(self):
         return SuggestConversationAsContribution.objects.filter(community=self.community, status__isnull=True).count()
 
-    @property
-    def all_contributions(self):
+    def get_contributions(self):
         contributions = Contribution.objects.filter(community=self.community)
         contributions = contributions.filter(timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
         if self.contrib_type:
@@ -73,10 +73,14 @@ class Contributions(SavannahFilterView):
             else:
                 contributions = contributions.filter(channel__source=self.source)
 
-        contributions = contributions.annotate(author_name=F('author__name'), channel_name=F('channel__name'), source_name=F('contribution_type__source__name'), source_icon=F('contribution_type__source__icon_name')).prefetch_related('tags').order_by('-timestamp')
-        self.result_count = contributions.count()
-        start = (self.page-1) * self.RESULTS_PER_PAGE
-        return contributions[start:start+self.RESULTS_PER_PAGE]
+        return contributions.annotate(author_name=F('author__name'), channel_name=F('channel__name'), source_name=F('contribution_type__source__name'), source_icon=F('contribution_type__source__icon_name')).prefetch_related('tags').order_by('-timestamp')
+
+    @property
+    def all_contributions(self):
+        contributions = self.get_contributions()
+        self.result_count = self.cached_count('contributions', contributions)
+        rows, self.next_cursor = Keyset('timestamp', descending=True).page(contributions, self.page, self.RESULTS_PER_PAGE, self.cursor)
+        return rows
 
     @property
     def page_start(self):
@@ -180,6 +184,7 @@ class Contributions(SavannahFilterView):
         return recently_active[:10]
 
     @property
+    @filter_cached
     def top_contributors(self):
         activity_counts = dict()
         members = Member.objects.filter(community=self.community)
@@ -213,6 +218,7 @@ class Contributions(SavannahFilterView):
         return most_active[:10]
 
     @property
+    @filter_cached
     def top_supporters(self):
         activity_counts = dict()
         contributor_ids = set()
@@ -254,6 +260,7 @@ class Contributions(SavannahFilterView):
         return most_active[:10]
   
     @property
+    @filter_cached
     def top_enablers(self):
         activity_counts = dict()
         contributor_ids = set()
@@ -389,6 +396,23 @@ class Contributions(SavannahFilterView):
         view = Contributions(request, community_id)
         return render(request, 'savannahv2/contributions.html', view.context)
 
+    @login_required
+    def as_csv(request, community_id):
+        view = Contributions(request, community_id)
+        contributions = view.get_contributions().select_related('contribution_type', 'author__company')
+        rows = ({
+            'Date': contribution.timestamp,
+            'Type': contribution.contribution_type.name,
+            'Source': contribution.source_name,
+            'Channel': contribution.channel_name or '',
+            'Title': contribution.title,
+            'Author': contribution.author_name or '',
+            'Company': contribution.author.company.name if contribution.author and contribution.author.company else '',
+            'Link': contribution.location or '',
+            'Tags': ",".join([tag.name for tag in contribution.tags.all()])
+        } for contribution in in_batches(contributions, 'tags'))
+        return stream_csv('contributions.csv', ['Date', 'Type', 'Source', 'Channel', 'Title', 'Author', 'Company', 'Link', 'Tags'], rows)
+
     @login_required
     def publish(request, community_id):
         if 'cancel' in request.GET:
@@ -540,23 +564,15 @@ class Contributors(SavannahFilterView):
     @login_required
     def as_csv(request, community_id):
         view = Contributors(request, community_id)
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="contributors.csv"'
-        writer = csv.DictWriter(response, fieldnames=['Member', 'Company', 'First Contrib', 'Last Contrib', 'Contrib Count', 'Tags'])
-        writer.writeheader()
-        for member in view.all_contributors:
-            company_name = ''
-            if member.company:
-                company_name = member.company.name
-            writer.writerow({
-                'Member': member.name, 
-                'Company':company_name, 
-                'First Contrib':member.first_contrib, 
-                'Last Contrib':member.last_contrib, 
-                'Contrib Count':member.contrib_count,
-                'Tags': ",".join([tag.name for tag in member.tags.all()])
-            })
-        return response
+        rows = ({
+            'Member': member.name, 
+            'Company': member.company.name if member.company else '', 
+            'First Contrib': member.first_contrib, 
+            'Last Contrib': member.last_contrib, 
+            'Contrib Count': member.contrib_count,
+            'Tags': ",".join([tag.name for tag in member.tags.all()])
+        } for member in in_batches(view.all_contributors, 'tags'))
+        return stream_csv('contributors.csv', ['Member', 'Company', 'First Contrib', 'Last Contrib', 'Contrib Count', 'Tags'], rows)
 
     @login_required
     def publish(request, community_id):
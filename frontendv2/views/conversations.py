@@ -2,12 +2,16 @@ import operator
 import datetime
 from django.shortcuts import render, get_object_or_404, reverse
 from django.contrib.auth.decorators import login_required
-from django.db.models import F, Q, Count, Min, Max, Avg, ExpressionWrapper, fields
+from django.db.models import F, Q, Count, Max, Avg, Exists, OuterRef
 from django.db.models.functions import Trunc
 from django.utils.safestring import mark_safe
 
 from corm.models import *
-from frontendv2.views import SavannahFilterView
+from corm.rollups import has_rollups, get_rollups, count_by_span
+from corm.search import search_conversations, rank_conversations
+from corm.paging import Keyset
+from frontendv2.views import SavannahFilterView, filter_cached, in_batches, stream_csv
+from frontendv2.profiling import profiled
 from frontendv2.views.charts import PieChart, LineChart 
 from frontendv2 import colors as savannah_colors
 from frontendv2.models import PublicDashboard
@@ -42,6 +46,8 @@ class Conversations(SavannahFilterView):
             self.page = int(request.GET.get('page', 1))
         except:
             self.page = 1
+        self.cursor = request.GET.get('after')
+        self.next_cursor = None
 
         if 'clear' in request.GET and request.GET.get('clear') == 'all':
             request.session['conversation_search'] = None
@@ -114,20 +120,24 @@ class Conversations(SavannahFilterView):
                     conversations = conversations.filter(speaker__role=self.role)
 
             if self.conversation_search:
-                conversations = conversations.filter(content__icontains=self.conversation_search)
+                conversations = conversations.filter(search_conversations(self.conversation_search))
 
             if self.filter_link:
                 conversations = conversations.filter(links=self.filter_link)
-            self.result_count = conversations.count()
+            self.result_count = self.cached_count('conversations', conversations)
             self._allConversations = conversations
         return self._allConversations
 
     @property
     def all_conversations(self):
-        conversations = self._displayed_conversations().select_related('channel', 'channel__source', 'speaker').prefetch_related('tags').order_by('-timestamp')
-        
-        start = (self.page-1) * self.RESULTS_PER_PAGE
-        return conversations[start:start+self.RESULTS_PER_PAGE]
+        conversations = self._displayed_conversations().select_related('channel', 'channel__source', 'speaker').prefetch_related('tags')
+        if self.conversation_search:
+            conversations = rank_conversations(conversations, self.conversation_search).order_by('-search_rank', '-timestamp')
+            start = (self.page-1) * self.RESULTS_PER_PAGE
+            return conversations[start:start+self.RESULTS_PER_PAGE]
+
+        rows, self.next_cursor = Keyset('timestamp', descending=True).page(conversations, self.page, self.RESULTS_PER_PAGE, self.cursor)
+        return rows
 
     @property
     def page_start(self):
@@ -162,95 +172,87 @@ class Conversations(SavannahFilterView):
             offset = 1
         return [page+offset for page in range(min(10, pages))]
 
-    @property
-    def median_response_time(self):
-        if self._responseTimes:
-            return self._responseTimes
-        else:
-            replies = Conversation.objects.filter(speaker__community_id=self.community, thread_start__isnull=True, timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
-            if self.source:
-                if self.exclude_source:
-                    replies = replies.exclude(channel__source=self.source)
-                else:
-                    replies = replies.filter(channel__source=self.source)
-            if self.tag:
-                replies = replies.filter(Q(tags=self.tag) | Q(replies__tags=self.tag))
+    def _replied_by(self, replies):
+        # Threads with a reply matching the filter, as a subquery so threads aren't repeated for each reply
+        return Q(id__in=Conversation.objects.filter(replies).values('thread_start_id'))
 
-            if self.member_company:
-                replies = replies.filter(replies__speaker__company=self.member_company)
+    def _threads(self, by_replies):
+        threads = Conversation.objects.filter(speaker__community_id=self.community, timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
+        if self.source:
+            if self.exclude_source:
+                threads = threads.exclude(channel__source=self.source)
+            else:
+                threads = threads.filter(channel__source=self.source)
+        if self.tag:
+            threads = threads.filter(Q(tags=self.tag) | self._replied_by(Q(tags=self.tag)))
 
-            if self.member_tag:
-                replies = replies.filter(replies__speaker__tags=self.member_tag)
+        def by_speaker(field, value):
+            # Member filters apply to whoever replied when looking at responses, otherwise to whoever started the thread
+            if by_replies:
+                return self._replied_by(Q(**{'speaker__' + field: value}))
+            return Q(**{'speaker__' + field: value})
 
-            if self.role:
-                if self.role == Member.BOT:
-                    replies = replies.exclude(replies__speaker__role=self.role)
-                else:
-                    replies = replies.filter(replies__speaker__role=self.role)
+        if self.member_company:
+            threads = threads.filter(by_speaker('company', self.member_company))
 
-            if self.conversation_search:
-                replies = replies.filter(Q(content__icontains=self.conversation_search) | Q(replies__content__icontains=self.conversation_search))
+        if self.member_tag:
+            threads = threads.filter(by_speaker('tags', self.member_tag))
 
-            if self.filter_link:
-                replies = replies.filter(links=self.filter_link)
-
-            replies = replies.annotate(first_response=Min('replies__timestamp'))
-            replies = replies.filter(first_response__isnull=False, first_response__gt=F('timestamp'))
-            response_time = ExpressionWrapper(F('first_response') - F('timestamp'), output_field=fields.DurationField())
-            replies = replies.annotate(response_time=response_time)
-            values = replies.values_list('response_time', flat=True).order_by('response_time')
-            count = len(values)
-            if count < 1:
-                return None
-            if count % 2 == 1:
-                median = values[int(round(count/2))]
+        if self.role:
+            if self.role == Member.BOT:
+                threads = threads.exclude(by_speaker('role', self.role))
             else:
-                med1, med2 = values[int(count/2-1):int(count/2+1)]
-                median = (med1 + med2)/(2.0)
+                threads = threads.filter(by_speaker('role', self.role))
+
+        if self.conversation_search:
+            threads = threads.filter(search_conversations(self.conversation_search) | self._replied_by(search_conversations(self.conversation_search)))
+
+        if self.filter_link:
+            threads = threads.filter(links=self.filter_link)
+        return threads
+
+    def response_time_percentile(self, percentile):
+        # Uses the first reply time stored on each thread, so the database only has to sort and count them
+        threads = self._threads(by_replies=True).filter(thread_start__isnull=True, response_time__isnull=False)
+        count = threads.count()
+        if count < 1:
+            return None
+        position = (count - 1) * percentile / 100.0
+        low = int(position)
+        values = list(threads.order_by('response_time').values_list('response_time', flat=True)[low:low+2])
+        if len(values) < 2 or position == low:
+            return values[0]
+        return values[0] + (values[1] - values[0]) * (position - low)
+
+    @property
+    @profiled
+    def median_response_time(self):
+        if self._responseTimes:
+            return self._responseTimes
+        else:
+            median = self.response_time_percentile(50)
+            if median is None:
+                return None
             self._responseTimes = median - datetime.timedelta(microseconds=median.microseconds)
             return self._responseTimes
 
     @property
+    @profiled
     def response_rate(self):
         if self._responseRate:
             return self._responseRate
         else:
-            convos = Conversation.objects.filter(speaker__community_id=self.community, timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
-            if self.source:
-                if self.exclude_source:
-                    convos = convos.exclude(channel__source=self.source)
-                else:
-                    convos = convos.filter(channel__source=self.source)
-            if self.tag:
-                convos = convos.filter(Q(tags=self.tag) | Q(replies__tags=self.tag))
-
-            if self.member_company:
-                convos = convos.filter(speaker__company=self.member_company)
-
-            if self.member_tag:
-                convos = convos.filter(speaker__tags=self.member_tag)
-
-            if self.role:
-                if self.role == Member.BOT:
-                    convos = convos.exclude(speaker__role=self.role)
-                else:
-                    convos = convos.filter(speaker__role=self.role)
-
-            if self.conversation_search:
-                convos = convos.filter(Q(content__icontains=self.conversation_search) | Q(replies__content__icontains=self.conversation_search))
-
-            if self.filter_link:
-                convos = convos.filter(links=self.filter_link)
-
-            total = convos.filter(thread_start__isnull=True).count()
+            convos = self._threads(by_replies=False).filter(thread_start__isnull=True)
+            total = convos.count()
             if total == 0:
                 return 0
-            responded = convos.annotate(reponse_count=Count('replies', unique=True)).filter(reponse_count__gt=0).count()
+            responded = convos.filter(Exists(Conversation.objects.filter(thread_start_id=OuterRef('id')))).count()
             # print("total: %s\nreponded: %s" % (total, responded))
             self._responseRate = 100 * responded / total
             return self._responseRate
 
     @property 
+    @profiled
     def speaker_count(self):
         members = self.community.member_set.all()
         if self.member_company:
@@ -272,13 +274,14 @@ class Conversations(SavannahFilterView):
         if self.tag:
             conversation_filter = conversation_filter & Q(speaker_in__tags=self.tag)
         if self.conversation_search:
-            conversation_filter = conversation_filter & Q(speaker_in__content__icontains=self.conversation_search)
+            conversation_filter = conversation_filter & search_conversations(self.conversation_search, 'speaker_in__')
         if self.filter_link:
             conversation_filter = conversation_filter & Q(speaker_in__links=self.filter_link)
         members = members.annotate(activity_count=Count('speaker_in', filter=conversation_filter)).filter(activity_count__gt=0)
         return members.count()
 
     @property
+    @filter_cached
     def conversation_count(self):
         convos = self._displayed_conversations()
         return convos.count()
@@ -293,11 +296,24 @@ class Conversations(SavannahFilterView):
         else:
             return self.getBasicConversationsChart()
 
+    @profiled
     def getBasicConversationsChart(self):
         if not self._membersChart:
             months = list()
             counts = dict()
 
+            if self.trunc_span != 'hour' and not (self.member_company or self.member_tag or self.conversation_search or self.filter_link) and has_rollups(self.community, self.rangestart, self.rangeend):
+                rollups = get_rollups(self.community, self.rangestart.date(), self.rangeend.date(), source=self.source, exclude_source=self.exclude_source, tag=self.tag, role=self.role)
+                for day, count in count_by_span(rollups, 'conversation_count', self.trunc_span):
+                    month = self.trunc_date(day)
+                    months.append(month)
+                    counts[month] = count
+                self._membersChart = LineChart('conversation_graph', 'Conversations')
+                self._membersChart.set_keys(self.timespan_chart_keys(sorted(months)))
+                self._membersChart.add('Conversations', counts, savannah_colors.CONVERSATION)
+                self.charts.add(self._membersChart)
+                return self._membersChart
+
             conversations = Conversation.objects.filter(channel__source__community=self.community, timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
             if self.source:
                 if self.exclude_source:
@@ -321,7 +337,7 @@ class Conversations(SavannahFilterView):
                     conversations = conversations.filter(speaker__role=self.role)
 
             if self.conversation_search:
-                conversations = conversations.filter(content__icontains=self.conversation_search)
+                conversations = conversations.filter(search_conversations(self.conversation_search))
             if self.filter_link:
                 conversations = conversations.filter(links=self.filter_link)
             conversations = conversations.order_by("timestamp")
@@ -339,6 +355,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._membersChart)
         return self._membersChart
     
+    @profiled
     def getConversationsChartByTag(self):
         if not self._membersChart:
             months = list()
@@ -367,7 +384,7 @@ class Conversations(SavannahFilterView):
                     conversations = conversations & Q(conversation__speaker__role=self.role)
 
             if self.conversation_search:
-                conversations = conversations & Q(conversation__content__icontains=self.conversation_search)
+                conversations = conversations & search_conversations(self.conversation_search, 'conversation__')
             if self.filter_link:
                 conversations = conversations & Q(conversation__links=self.filter_link)
 
@@ -395,6 +412,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._membersChart)
         return self._membersChart
 
+    @profiled
     def getConversationsChartBySource(self):
         if not self._membersChart:
             months = list()
@@ -423,7 +441,7 @@ class Conversations(SavannahFilterView):
                     conversations = conversations & Q(channel__conversation__speaker__role=self.role)
 
             if self.conversation_search:
-                conversations = conversations & Q(channel__conversation__content__icontains=self.conversation_search)
+                conversations = conversations & search_conversations(self.conversation_search, 'channel__conversation__')
             if self.filter_link:
                 conversations = conversations & Q(channel__conversation__links=self.filter_link)
 
@@ -451,6 +469,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._membersChart)
         return self._membersChart
 
+    @profiled
     def getConversationsChartByRole(self):
         if not self._membersChart:
             months = list()
@@ -479,7 +498,7 @@ class Conversations(SavannahFilterView):
                     conversations = conversations & Q(role=self.role)
 
             if self.conversation_search:
-                conversations = conversations & Q(speaker_in__content__icontains=self.conversation_search)
+                conversations = conversations & search_conversations(self.conversation_search, 'speaker_in__')
             if self.filter_link:
                 conversations = conversations & Q(speaker_in__links=self.filter_link)
 
@@ -513,6 +532,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._membersChart)
         return self._membersChart
 
+    @profiled
     def channelsChart(self):
         if not self._channelsChart:
             channels = list()
@@ -536,7 +556,7 @@ class Conversations(SavannahFilterView):
                 else:
                     convo_filter = convo_filter & Q(conversation__speaker__role=self.role)
             if self.conversation_search:
-                convo_filter = convo_filter & Q(conversation__content__icontains=self.conversation_search)
+                convo_filter = convo_filter & search_conversations(self.conversation_search, 'conversation__')
             if self.filter_link:
                 convo_filter = convo_filter & Q(conversation__links=self.filter_link)
 
@@ -553,6 +573,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._channelsChart)
         return self._channelsChart
 
+    @profiled
     def tagsChart(self):
         if not self._tagsChart:
             counts = dict()
@@ -576,7 +597,7 @@ class Conversations(SavannahFilterView):
                 else:
                     convo_filter = convo_filter & Q(conversation__speaker__role=self.role)
             if self.conversation_search:
-                convo_filter = convo_filter & Q(conversation__content__icontains=self.conversation_search)
+                convo_filter = convo_filter & search_conversations(self.conversation_search, 'conversation__')
             if self.filter_link:
                 convo_filter = convo_filter & Q(conversation__links=self.filter_link)
 
@@ -591,6 +612,7 @@ class Conversations(SavannahFilterView):
         self.charts.add(self._tagsChart)
         return self._tagsChart
 
+    @profiled
     def rolesChart(self):
         if not self._rolesChart:
             counts = dict()
@@ -618,7 +640,7 @@ class Conversations(SavannahFilterView):
                 else:
                     members = members.filter(role=self.role)
             if self.conversation_search:
-                convo_filter = convo_filter & Q(speaker_in__content__icontains=self.conversation_search)
+                convo_filter = convo_filter & search_conversations(self.conversation_search, 'speaker_in__')
             if self.filter_link:
                 convo_filter = convo_filter & Q(speaker_in__links=self.filter_link)
             #convo_filter = convo_filter & Q(speaker_in__speaker_id=F('id'))
@@ -636,6 +658,7 @@ class Conversations(SavannahFilterView):
         return self._rolesChart
 
     @property
+    @filter_cached
     def most_active(self):
         activity_counts = dict()
         members = Member.objects.filter(community=self.community)
@@ -657,7 +680,7 @@ class Conversations(SavannahFilterView):
             else:
                 members = members.filter(role=self.role)
         if self.conversation_search:
-            convo_filter = convo_filter & Q(speaker_in__content__icontains=self.conversation_search)
+            convo_filter = convo_filter & search_conversations(self.conversation_search, 'speaker_in__')
         if self.filter_link:
             convo_filter = convo_filter & Q(speaker_in__links=self.filter_link)
 
@@ -665,6 +688,7 @@ class Conversations(SavannahFilterView):
         return members[:20]
 
     @property
+    @filter_cached
     def most_connected(self):
         if self.conversation_search or self.filter_link:
             return []
@@ -690,6 +714,7 @@ class Conversations(SavannahFilterView):
         return members[:20]
 
     @property
+    @filter_cached
     def top_links(self):
         links = Hyperlink.objects.filter(community=self.community, ignored=False)
         convo_filter = Q(conversation__timestamp__gte=self.rangestart, conversation__timestamp__lte=self.rangeend)
@@ -710,7 +735,7 @@ class Conversations(SavannahFilterView):
             else:
                 convo_filter = convo_filter & Q(conversation__speaker__role=self.role)
         if self.conversation_search:
-            convo_filter = convo_filter & Q(conversation__content__icontains=self.conversation_search)
+            convo_filter = convo_filter & search_conversations(self.conversation_search, 'conversation__')
         if self.filter_link:
             convo_filter = convo_filter & Q(conversation__links=self.filter_link)
 
@@ -718,6 +743,7 @@ class Conversations(SavannahFilterView):
         return links[:10]
 
     @property
+    @filter_cached
     def top_link_sites(self):
         links = Hyperlink.objects.filter(community=self.community, ignored=False)
         convo_filter = Q(conversation__timestamp__gte=self.rangestart, conversation__timestamp__lte=self.rangeend)
@@ -738,7 +764,7 @@ class Conversations(SavannahFilterView):
             else:
                 convo_filter = convo_filter & Q(conversation__speaker__role=self.role)
         if self.conversation_search:
-            convo_filter = convo_filter & Q(conversation__content__icontains=self.conversation_search)
+            convo_filter = convo_filter & search_conversations(self.conversation_search, 'conversation__')
         if self.filter_link:
             convo_filter = convo_filter & Q(conversation__links=self.filter_link)
 
@@ -751,6 +777,22 @@ class Conversations(SavannahFilterView):
         view = Conversations(request, community_id)
         return render(request, 'savannahv2/conversations.html', view.context)
 
+    @login_required
+    def as_csv(request, community_id):
+        view = Conversations(request, community_id)
+        conversations = view._displayed_conversations().select_related('channel', 'channel__source', 'speaker__company').order_by('-timestamp')
+        rows = ({
+            'Date': conversation.timestamp,
+            'Source': conversation.channel.source.name,
+            'Channel': conversation.channel.name,
+            'Speaker': conversation.speaker.name if conversation.speaker else '',
+            'Company': conversation.speaker.company.name if conversation.speaker and conversation.speaker.company else '',
+            'Content': conversation.content or '',
+            'Link': conversation.location or '',
+            'Tags': ",".join([tag.name for tag in conversation.tags.all()])
+        } for conversation in in_batches(conversations, 'tags'))
+        return stream_csv('conversations.csv', ['Date', 'Source', 'Channel', 'Speaker', 'Company', 'Content', 'Link', 'Tags'], rows)
+
     @login_required
     def publish(request, community_id):
         if 'cancel' in request.GET:
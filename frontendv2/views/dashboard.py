@@ -9,7 +9,8 @@ from notifications.models import Notification
 from corm.models import *
 from corm.connectors import ConnectionManager
 from frontendv2.models import PublicDashboard
-from frontendv2.views import SavannahFilterView, SavannahView
+from frontendv2.views import SavannahFilterView, SavannahView, filter_cached
+from frontendv2.profiling import profiled
 from frontendv2.views.projects import TaskForm
 from frontendv2.views.charts import FunnelChart
 
@@ -61,6 +62,7 @@ class ManagerDashboard(SavannahView):
         return members
 
     @property
+    @profiled
     def new_contributors(self):
         members = Member.objects.filter(community=self.community)
         members = members.annotate(first_contrib=Min('contribution__timestamp')).filter(first_contrib__isnull=False)
@@ -95,6 +97,7 @@ class ManagerDashboard(SavannahView):
             return []
 
     @property
+    @profiled
     def recent_conversations(self):
         if self.user_member:
             recent = []
@@ -179,6 +182,7 @@ class Overview(SavannahFilterView):
         self.filter['member'] = True
     
     @property 
+    @filter_cached
     def member_count(self):
         members = self.community.member_set.all()
         if self.member_company:
@@ -193,6 +197,7 @@ class Overview(SavannahFilterView):
         return members.count()
         
     @property 
+    @filter_cached
     def conversation_count(self):
         conversations = Conversation.objects.filter(channel__source__community=self.community)
         if self.member_company:
@@ -209,6 +214,7 @@ class Overview(SavannahFilterView):
         return conversations.count()
         
     @property 
+    @filter_cached
     def contribution_count(self):
         contributions = Contribution.objects.filter(community=self.community)
         contributions = contributions.filter(timestamp__gte=self.rangestart, timestamp__lte=self.rangeend)
@@ -227,6 +233,7 @@ class Overview(SavannahFilterView):
         return contributions.count()
         
     @property 
+    @filter_cached
     def contributor_count(self):
         members = Member.objects.filter(community=self.community)
         if self.member_company:
@@ -241,6 +248,7 @@ class Overview(SavannahFilterView):
         return members.annotate(contrib_count=Count('contribution')).filter(contrib_count__gt=0).count()
         
     @property
+    @filter_cached
     def most_active(self):
         members = Member.objects.filter(community=self.community)
         if self.member_company:
@@ -259,6 +267,7 @@ class Overview(SavannahFilterView):
         return members[:10]
 
     @property
+    @filter_cached
     def most_connected(self):
         members = Member.objects.filter(community=self.community)
         if self.member_company:
@@ -277,6 +286,7 @@ class Overview(SavannahFilterView):
         return members[:10]
 
     @property
+    @filter_cached
     def top_contributors(self):
         members = Member.objects.filter(community=self.community)
         if self.member_company:
@@ -12,7 +12,7 @@ from django import forms
 from corm.models import *
 from corm.connectors import ConnectionManager
 
-from frontendv2.views import SavannahView, SavannahFilterView
+from frontendv2.views import SavannahView, SavannahFilterView, in_batches, stream_csv
 from frontendv2.views.charts import PieChart, ChartColors
 from frontendv2 import colors
 
@@ -39,13 +39,16 @@ class EventProfile(SavannahView):
     def attendee_count(self):
         return EventAttendee.objects.filter(event=self.event).count()
 
-    @property
-    def all_attendees(self):
+    def get_attendees(self):
         attendees = EventAttendee.objects.filter(event=self.event).select_related('member')
         if self.event_search:
             attendees = attendees.filter(member__name__icontains=self.event_search)
 
-        attendees = attendees.annotate(events_count=Count('member__event_attendance'))
+        return attendees.annotate(events_count=Count('member__event_attendance'))
+
+    @property
+    def all_attendees(self):
+        attendees = self.get_attendees()
         self.result_count = attendees.count()
         start = (self.page-1) * self.RESULTS_PER_PAGE
         return attendees[start:start+self.RESULTS_PER_PAGE]
@@ -126,6 +129,20 @@ class EventProfile(SavannahView):
 
         return render(request, "savannahv2/event.html", view.context)
 
+    @login_required
+    def as_csv(request, event_id):
+        view = EventProfile(request, event_id)
+        attendees = view.get_attendees().select_related('member__company').order_by('timestamp')
+        rows = ({
+            'Member': attendee.member.name,
+            'Company': attendee.member.company.name if attendee.member.company else '',
+            'Role': attendee.get_role_display(),
+            'Date': attendee.timestamp,
+            'Events Attended': attendee.events_count,
+            'Tags': ",".join([tag.name for tag in attendee.member.tags.all()])
+        } for attendee in in_batches(attendees, 'member__tags'))
+        return stream_csv('attendees.csv', ['Member', 'Company', 'Role', 'Date', 'Events Attended', 'Tags'], rows)
+
 from django.http import JsonResponse
 @login_required
 def tag_event(request, community_id):
@@ -1,8 +1,6 @@
 import operator
 from functools import reduce
 import datetime
-import csv
-from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect, reverse
 from django.contrib.auth.decorators import login_required
 from django.db.models import F, Q, Count, Min, Max, Avg
@@ -12,8 +10,12 @@ from django.http import JsonResponse
 from django.contrib import messages
 
 from corm.models import *
+from corm.rollups import has_rollups, get_rollups, distinct_by_span
+from corm.search import search_members
+from corm.paging import Keyset
 from corm.connectors import ConnectionManager
-from frontendv2.views import SavannahView, SavannahFilterView
+from frontendv2.views import SavannahView, SavannahFilterView, filter_cached, in_batches, stream_csv
+from frontendv2.profiling import profiled
 from frontendv2.views.charts import PieChart, LineChart
 from savannah.utils import safe_int
 from frontendv2 import colors as savannah_colors
@@ -110,6 +112,7 @@ class Members(SavannahFilterView):
  
         return members.order_by('-last_active')[:10]
 
+    @profiled
     def membersChart(self):
         if not self._membersChart:
             months = list()
@@ -141,7 +144,15 @@ class Members(SavannahFilterView):
                     months.append(month)
                 counts[month] = m['member_count']
 
-            active = members.annotate(month=Trunc('activity__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
+            if self.trunc_span != 'hour' and not (self.member_company or self.member_tag or self.source) and has_rollups(self.community, self.rangestart, self.rangeend):
+                # Only the charted span is needed, starting from the first of the month for monthly charts
+                start = self.rangestart.date()
+                if self.trunc_span == 'month':
+                    start = start.replace(day=1)
+                rollups = get_rollups(self.community, start, self.rangeend.date(), role=self.role)
+                active = [{'month': day, 'member_count': count} for day, count in distinct_by_span(rollups, 'active_members', self.trunc_span)]
+            else:
+                active = members.annotate(month=Trunc('activity__timestamp', self.trunc_span)).values('month').annotate(member_count=Count('id', distinct=True)).order_by('month')
             for a in active:
                 if a['month'] is not None:
                     month = self.trunc_date(a['month'])
@@ -169,6 +180,7 @@ class Members(SavannahFilterView):
         return data
 
     @property 
+    @filter_cached
     def member_count(self):
         members = self.community.member_set.all()
         if self.member_company:
@@ -190,6 +202,7 @@ class Members(SavannahFilterView):
         return members.count()
 
     @property
+    @filter_cached
     def conversations_per_member(self):
         members = self.community.member_set.all()
         if self.member_company:
@@ -224,6 +237,7 @@ class Members(SavannahFilterView):
             return 0
 
     @property
+    @filter_cached
     def dau_to_mau(self):
         if not self._dauPercent:
             members = Member.objects.filter(community=self.community)
@@ -256,6 +270,7 @@ class Members(SavannahFilterView):
                 self._dauPercent = 0
         return self._dauPercent
 
+    @profiled
     def sources_chart(self):
         if not self._sourcesChart:
             counts = dict()
@@ -292,6 +307,7 @@ class Members(SavannahFilterView):
         self.charts.add(self._sourcesChart)
         return self._sourcesChart
 
+    @profiled
     def rolesChart(self):
         if not self._rolesChart:
             counts = dict()
@@ -330,6 +346,7 @@ class Members(SavannahFilterView):
         self.charts.add(self._rolesChart)
         return self._rolesChart
 
+    @profiled
     def tagsChart(self):
         if not self._tagsChart:
             counts = dict()
@@ -407,6 +424,8 @@ class AllMembers(SavannahFilterView):
             self.page = int(request.GET.get('page', 1))
         except:
             self.page = 1
+        self.cursor = request.GET.get('after')
+        self.next_cursor = None
 
         if 'search' in request.GET:
             self.search = request.GET.get('search', "").lower().strip()
@@ -418,7 +437,7 @@ class AllMembers(SavannahFilterView):
         members = Member.objects.filter(community=self.community)
         activity_filter = Q()
         if self.search:
-            members = members.filter(Q(name__icontains=self.search) | Q(company__name__icontains=self.search) | Q(email_address__icontains=self.search) | Q(contact__detail__icontains=self.search) | Q(contact__email_address__icontains=self.search) | Q(note__content__icontains=self.search))
+            members = members.filter(search_members(self.search))
 
         if self.member_company:
             members = members.filter(company=self.member_company)
@@ -456,10 +475,19 @@ class AllMembers(SavannahFilterView):
         members = self.get_members()
         if not self.search and (self.timefilter == 'custom' or self.timespan < self.MAX_TIMESPAN):
             members = members.filter(activity_count__gt=0)
+        self.result_count = self.cached_count('all_members', members, self.search)
         members = members.annotate(note_count=Count('note'), tag_count=Count('tags'))
-        self.result_count = members.count()
-        start = (self.page-1) * self.RESULTS_PER_PAGE
-        return members[start:start+self.RESULTS_PER_PAGE]
+
+        if self.sort_by in ('company', '-company'):
+            start = (self.page-1) * self.RESULTS_PER_PAGE
+            return members[start:start+self.RESULTS_PER_PAGE]
+        if self.sort_by in ('name', '-name'):
+            members = members.annotate(sort_name=Lower('name'))
+            keyset = Keyset('sort_name', descending=self.sort_by.startswith('-'))
+        else:
+            keyset = Keyset(self.sort_by.lstrip('-'), descending=self.sort_by.startswith('-'))
+        rows, self.next_cursor = keyset.page(members, self.page, self.RESULTS_PER_PAGE, self.cursor)
+        return rows
 
     @property
     def all_companies(self):
@@ -555,24 +583,17 @@ class AllMembers(SavannahFilterView):
     @login_required
     def as_csv(request, community_id):
         view = AllMembers(request, community_id)
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="members.csv"'
-        writer = csv.DictWriter(response, fieldnames=['Member', 'Company', 'Role', 'First Seen', 'Last Seen', 'Activity Count', 'Tags'])
-        writer.writeheader()
-        for member in view.get_members():
-            company_name = ''
-            if member.company:
-                company_name = member.company.name
-            writer.writerow({
-                'Member': member.name, 
-                'Company':company_name, 
-                'Role': member.get_role_display(),
-                'First Seen':member.first_seen, 
-                'Last Seen':member.last_seen, 
-                'Activity Count':member.activity_count,
-                'Tags': ",".join([tag.name for tag in member.tags.all()])
-            })
-        return response
+        members = view.get_members().select_related('company')
+        rows = ({
+            'Member': member.name, 
+            'Company': member.company.name if member.company else '', 
+            'Role': member.get_role_display(),
+            'First Seen': member.first_seen, 
+            'Last Seen': member.last_seen, 
+            'Activity Count': member.activity_count,
+            'Tags': ",".join([tag.name for tag in member.tags.all()])
+        } for member in in_batches(members, 'tags'))
+        return stream_csv('members.csv', ['Member', 'Company', 'Role', 'First Seen', 'Last Seen', 'Activity Count', 'Tags'], rows)
 
 class MemberNoteForm(forms.ModelForm):
     class Meta:
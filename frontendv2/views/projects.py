@@ -11,6 +11,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 
 from corm.models import *
+from corm.rollups import has_rollups, get_rollups, count_by_span
 from corm.connectors import ConnectionManager
 
 from frontendv2.views import SavannahView, SavannahFilterView
@@ -147,6 +148,22 @@ class ProjectOverview(SavannahView):
         if not self._engagementChart:
             conversations_counts = dict()
             activity_counts = dict()
+            rangestart = datetime.datetime.utcnow() - datetime.timedelta(days=self.timespan)
+            if self.project.default_project and self.trunc_span != 'hour' and has_rollups(self.community, rangestart):
+                months = list()
+                rollups = get_rollups(self.community, rangestart.date(), datetime.datetime.utcnow().date())
+                for day, count in count_by_span(rollups, 'conversation_count', self.trunc_span):
+                    month = self.trunc_date(day)
+                    months.append(month)
+                    conversations_counts[month] = count
+                for day, count in count_by_span(rollups, 'contribution_count', self.trunc_span):
+                    month = self.trunc_date(day)
+                    if month not in months:
+                        months.append(month)
+                    activity_counts[month] = count
+                self._engagementChart = (sorted(months), conversations_counts, activity_counts)
+                return self._engagementChart
+
             convo_filter = Q(timestamp__gte=datetime.datetime.now() - datetime.timedelta(days=self.timespan))
             if not self.project.default_project:
                 convo_filter = Q(channel__in=self.project.channels.all())
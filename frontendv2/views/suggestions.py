@@ -32,15 +32,9 @@ class MemberMergeSuggestions(SavannahView):
                 suggestion.reject(request.user)
                 messages.info(request, "Suggested rejected, you won't see it again")
             elif 'accept' in request.POST:
-                success_count = 0
                 selected = request.POST.getlist('selected')
-                for suggestion_id in selected:
-                    try:
-                        suggestion = SuggestMemberMerge.objects.get(id=suggestion_id)
-                        suggestion.accept(request.user)
-                        success_count += 1
-                    except:
-                        pass
+                suggestions = SuggestMemberMerge.objects.filter(community=view.community, id__in=selected).select_related('source_member', 'destination_member')
+                success_count = SuggestMemberMerge.accept_many(suggestions, request.user)
                 if len(selected) > 0:
                     messages.success(request, "<b>%s</b> %s been merged" % (success_count, pluralize(len(selected), "Member has", "Members have")))
                 else:
@@ -123,12 +123,8 @@ class EditTag(SavannahView):
         if not view.edit_tag.editable:
             messages.warning(request, "Unable to edit tag \"%s\", it is managed by the %s plugin." % (view.edit_tag.name, view.edit_tag.connector_name))
             return redirect('tags', community_id=view.community.id)
-        keywords = view.edit_tag.keywords
         if request.method == "POST" and view.form.is_valid():
             view.form.save()
-            if view.edit_tag.keywords != keywords:
-                view.edit_tag.last_changed = datetime.datetime.utcnow()
-                view.edit_tag.save()
             return redirect('tags', community_id=view.community.id)
 
         return render(request, "savannahv2/tag_edit.html", view.context)
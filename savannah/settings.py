@@ -133,6 +133,7 @@ CORM_PLUGINS = [
 ]
 
 MIDDLEWARE = [
+    "frontendv2.middleware.ProfilingMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',